@@ -0,0 +1,200 @@
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from rendering import (
+    convert_model_to_camera_space, project_points, project_to_image, clip_edges, draw_segments, render_image,
+    render_wireframe,
+)
+from rendering_helpers import make_intrinsics, yp_mat
+
+BENCHMARK_SIZES = [10 ** exponent for exponent in range(2, 8)]
+BENCHMARK_IMAGE_SIZES = [(512, 512), (2048, 2048)]
+BENCHMARK_REPEATS = 5
+# Stages faster than this are run in a loop for every timed sample, so the samples are not timer noise
+SAMPLE_MIN_SECONDS = 0.01
+REGRESSION_THRESHOLD = 0.25
+# Increases smaller than these never count as regressions, however large they are relative to the baseline
+REGRESSION_MIN_SECONDS = 1e-3
+REGRESSION_MIN_BYTES = 2 ** 16
+
+# The list based stages build a Python object per vertex, so they are only timed up to this size
+LIST_STAGE_MAX_SIZE = 10 ** 5
+
+
+def synthetic_mesh(vertex_count, seed=0):
+    """
+    A random wireframe with about 1.5 edges per vertex, filling a unit ball.
+    Every vertex is joined to the next one, and every other vertex also to a random one, so the edges
+    have a mix of short and long lengths.
+    :param vertex_count: number of vertices.
+    :param seed: seed of the random generator.
+    :return: dictionary with "vertices" (N, 3) float64 and "edges" (E, 2) int64 arrays.
+    """
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(vertex_count, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    vertices = directions * rng.uniform(0, 1, size=(vertex_count, 1)) ** (1 / 3)
+
+    chain = np.arange(vertex_count - 1)
+    others = np.arange(0, vertex_count, 2)
+    edges = np.concatenate([
+        np.stack([chain, chain + 1], axis=1),
+        np.stack([others, rng.integers(0, vertex_count, len(others))], axis=1),
+    ])
+    return {"vertices": vertices, "edges": edges}
+
+def time_stage(function, repeats=BENCHMARK_REPEATS, sample_seconds=SAMPLE_MIN_SECONDS):
+    """
+    Run a stage several times and measure it.
+    :param function: callable running the stage once.
+    :param repeats: number of timed samples, the fastest one counts.
+    :param sample_seconds: shortest time of a sample. Faster stages run as many times per sample as it takes,
+      and the sample time is divided by the number of runs.
+    :return: tuple (seconds, peak_bytes) with the peak of the memory allocated while the stage ran.
+    """
+    # The first run also warms up caches and lazy imports, and tells how many runs a sample needs
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    runs = max(1, int(np.ceil(sample_seconds / first))) if first > 0 else 1
+
+    # Garbage collection is held off while timing, like timeit does, so it is not charged to whichever stage triggers it
+    seconds = []
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(runs):
+                function()
+            seconds.append((time.perf_counter() - start) / runs)
+    finally:
+        if collecting:
+            gc.enable()
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(seconds), peak_bytes
+
+def benchmark_mesh(model, image_width, image_height, repeats=BENCHMARK_REPEATS):
+    """
+    Time every stage of the pipeline on one mesh and image size, and the whole render_wireframe.
+    Each stage runs on the output of the previous one, which is computed once outside the timing.
+    :param model: dictionary with "vertices" and "edges" arrays.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param repeats: number of timed runs per stage.
+    :return: dictionary from stage name to a dictionary with "seconds", "throughput" in elements per second,
+      "elements" and "peak_bytes".
+    """
+    vertices, edges = model["vertices"], model["edges"]
+    rotation = yp_mat(0.3, 0.2)
+    translation = np.array([0.2, -0.1, -3.])
+    camera_intrinsics = make_intrinsics(image_width, image_width, image_height)
+
+    camera_space = convert_model_to_camera_space(vertices, rotation, translation)
+    segments, visible = clip_edges(camera_space, edges, camera_intrinsics, image_width, image_height)
+    points, _ = project_points(segments[visible], camera_intrinsics)
+    image = np.zeros((image_height, image_width, 3), dtype=np.uint8)
+
+    stages = {
+        "camera_space": (len(vertices), lambda: convert_model_to_camera_space(vertices, rotation, translation)),
+        "project": (len(vertices), lambda: project_points(camera_space, camera_intrinsics)),
+        "clip": (len(edges), lambda: clip_edges(camera_space, edges, camera_intrinsics, image_width, image_height)),
+        "draw": (len(points), lambda: draw_segments(image, points)),
+        "render_wireframe": (len(edges), lambda: render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height)),
+    }
+    if len(vertices) <= LIST_STAGE_MAX_SIZE:
+        image_space = project_to_image(camera_space, camera_intrinsics)
+        stages["project_to_image"] = (len(vertices), lambda: project_to_image(camera_space, camera_intrinsics))
+        stages["render_image"] = (len(edges), lambda: render_image(image_space, edges, image_width, image_height))
+
+    results = {}
+    for name, (elements, function) in stages.items():
+        seconds, peak_bytes = time_stage(function, repeats)
+        results[name] = {
+            "seconds": seconds,
+            "throughput": elements / seconds if seconds > 0 else float("inf"),
+            "elements": elements,
+            "peak_bytes": peak_bytes,
+        }
+    return results
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, image_sizes=BENCHMARK_IMAGE_SIZES, repeats=BENCHMARK_REPEATS, log=print):
+    """
+    Benchmark every combination of mesh size and image size.
+    :param sizes: vertex counts of the synthetic meshes.
+    :param image_sizes: (width, height) pairs.
+    :param repeats: number of timed runs per stage.
+    :param log: callable receiving a line of progress for every stage, or None for silence.
+    :return: dictionary from "stage/vertices/widthxheight" keys to the results of benchmark_mesh.
+    """
+    results = {}
+    for size in sizes:
+        model = synthetic_mesh(size)
+        for image_width, image_height in image_sizes:
+            for stage, result in benchmark_mesh(model, image_width, image_height, repeats).items():
+                key = f"{stage}/{size}/{image_width}x{image_height}"
+                results[key] = result
+                if log is not None:
+                    log(f"{key:40} {result['seconds'] * 1000:10.3f} ms {result['throughput']:14.0f} /s {result['peak_bytes'] / 2 ** 20:10.1f} MiB")
+    return results
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD, min_seconds=REGRESSION_MIN_SECONDS, min_bytes=REGRESSION_MIN_BYTES):
+    """
+    Compare a run against a baseline.
+    :param results: results of run_benchmarks.
+    :param baseline: earlier results of run_benchmarks, e.g. loaded from a baseline file.
+    :param threshold: allowed relative increase of the time or the peak memory, 0.25 for 25%.
+    :param min_seconds: smallest increase of a time that counts, so stages taking microseconds do not fail
+      a run on noise.
+    :param min_bytes: smallest increase of the peak memory that counts.
+    :return: list of messages, one for every measurement that got worse by more than the threshold and the floor.
+    """
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for measure, floor in (("seconds", min_seconds), ("peak_bytes", min_bytes)):
+            increase = result[measure] - expected[measure]
+            if increase > expected[measure] * threshold and increase > floor:
+                regressions.append(f"{key} {measure}: {result[measure]:.6g} against a baseline of {expected[measure]:.6g}")
+    return regressions
+
+if __name__ == "__main__":
+    # e.g. python benchmark.py --max-size 100000 --save baseline.json
+    #      python benchmark.py --max-size 100000 --baseline baseline.json
+    parser = argparse.ArgumentParser(description="Time the rendering pipeline on synthetic meshes.")
+    parser.add_argument("--max-size", type=int, default=BENCHMARK_SIZES[-1], help="largest vertex count to run")
+    parser.add_argument("--image-size", type=int, nargs="*", help="square image sizes, e.g. 512 2048 8192")
+    parser.add_argument("--repeats", type=int, default=BENCHMARK_REPEATS)
+    parser.add_argument("--save", help="write the results to this JSON baseline file")
+    parser.add_argument("--baseline", help="JSON baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--min-seconds", type=float, default=REGRESSION_MIN_SECONDS, help="smallest time increase that fails the run")
+    args = parser.parse_args()
+
+    image_sizes = [(size, size) for size in args.image_size] if args.image_size else BENCHMARK_IMAGE_SIZES
+    results = run_benchmarks([size for size in BENCHMARK_SIZES if size <= args.max_size], image_sizes, args.repeats)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = find_regressions(results, json.load(f), args.threshold, args.min_seconds)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
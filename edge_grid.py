@@ -0,0 +1,229 @@
+import numpy as np
+from rendering_helpers import boxes_outside, world_frustum_planes
+
+GRID_EDGES_PER_CELL = 8
+GRID_MAX_RESOLUTION = 128
+PICK_RADIUS = 3.0
+
+
+def build_edge_grid(vertices, edges, edges_per_cell=GRID_EDGES_PER_CELL, max_resolution=GRID_MAX_RESOLUTION):
+    """
+    Uniform grid over the edges of a model in model space, to store alongside its vertices and edges.
+    The cells are about as close to cubes as the bounding box allows, with about edges_per_cell edges each.
+    Every edge is listed in each cell its segment passes through, and only the cells holding edges are stored.
+    The cells are numbered in Morton order, interleaving the bits of their coordinates, so every block of
+    2**k cells along each axis starting at a multiple of 2**k is one run of codes. The blocks form an octree
+    the queries descend without storing it.
+    :param vertices: (N, 3) array of points.
+    :param edges: (E, 2) array of pairs of indices into vertices.
+    :param edges_per_cell: average number of edges per cell the grid resolution is chosen for.
+    :param max_resolution: largest number of cells along any axis.
+    :return: dictionary of arrays:
+      - "grid_bounds" (2, 3) with the lower and upper corner of the grid
+      - "grid_shape" (3,) with the number of cells along every axis
+      - "grid_codes" (C,) with the Morton codes of the cells holding edges, in increasing order
+      - "grid_offsets" (C + 1,) so the edges of cell grid_codes[i] are grid_edges[grid_offsets[i]:grid_offsets[i + 1]]
+      - "grid_edges" with the edge indices of every cell one after another
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    segments = vertices[edges]
+    ends = segments.reshape(-1, 3)
+    lower = ends.min(axis=0) if len(ends) else np.zeros(3)
+    upper = ends.max(axis=0) if len(ends) else np.zeros(3)
+
+    # Size the cells from the volume, or the area or length for flat models, of the bounding box
+    extent = upper - lower
+    spread = extent > 1e-9 * max(extent.max(), 1e-300)
+    shape = np.ones(3, dtype=np.int64)
+    if spread.any() and len(edges):
+        cell = (np.prod(extent[spread]) * edges_per_cell / len(edges)) ** (1 / np.count_nonzero(spread))
+        shape[spread] = np.clip(np.round(extent[spread] / cell), 1, max_resolution)
+
+    # Walk every segment through the grid: between two consecutive crossings of cell faces the segment stays in
+    # one cell, the cell its midpoint falls in
+    start, direction = segments[:, 0], segments[:, 1] - segments[:, 0]
+    first, last = _cell_coordinates(start, lower, upper, shape), _cell_coordinates(segments[:, 1], lower, upper, shape)
+    cell_size = extent / shape
+    owners, crossings = [np.arange(len(edges))] * 2, [np.zeros(len(edges)), np.ones(len(edges))]
+    for axis in range(3):
+        counts = np.abs(last[:, axis] - first[:, axis])
+        owner = np.repeat(np.arange(len(edges)), counts)
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+        face = np.minimum(first[owner, axis], last[owner, axis]) + step
+        owners.append(owner)
+        crossings.append((lower[axis] + face * cell_size[axis] - start[owner, axis]) / direction[owner, axis])
+    owner, crossing = np.concatenate(owners), np.clip(np.concatenate(crossings), 0, 1)
+    order = np.lexsort((crossing, owner))
+    owner, crossing = owner[order], crossing[order]
+    same = owner[1:] == owner[:-1]
+    owner = owner[1:][same]
+    middle = (crossing[1:][same] + crossing[:-1][same]) / 2
+    coordinates = _cell_coordinates(start[owner] + middle[:, None] * direction[owner], lower, upper, shape)
+
+    # Every edge once per cell, grouped by cell
+    codes = _morton_codes(coordinates, _octree_depth(shape))
+    pairs = np.unique(np.stack([codes, owner], axis=1), axis=0)
+    cells, cell_counts = np.unique(pairs[:, 0], return_counts=True)
+    return {
+        "grid_bounds": np.stack([lower, upper]),
+        "grid_shape": shape,
+        "grid_codes": cells.astype(np.int64),
+        "grid_offsets": np.concatenate([[0], np.cumsum(cell_counts)]).astype(np.int64),
+        "grid_edges": pairs[:, 1].astype(np.int32),
+    }
+
+def _cell_coordinates(points, lower, upper, shape):
+    """
+    :return: (..., 3) int64 coordinates of the cells the points fall in, points on the upper faces going into the last cells.
+    """
+    scale = np.divide(shape, upper - lower, out=np.zeros(3), where=upper > lower)
+    return np.clip(np.floor((points - lower) * scale), 0, shape - 1).astype(np.int64)
+
+def _octree_depth(shape):
+    """
+    :return: number of times the grid is halved along its longest axis until one block holds every cell.
+    """
+    return int(np.asarray(shape).max() - 1).bit_length()
+
+def _morton_codes(coordinates, depth):
+    """
+    :return: (...) int64 Morton codes of (..., 3) cell coordinates below 2**depth, with the x bit lowest.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.int64)
+    codes = np.zeros(coordinates.shape[:-1], dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((coordinates[..., axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+def _morton_coordinates(codes, depth):
+    """
+    :return: (..., 3) int64 cell coordinates of Morton codes, see _morton_codes.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    coordinates = np.zeros(codes.shape + (3,), dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(3):
+            coordinates[..., axis] |= ((codes >> (3 * bit + axis)) & 1) << bit
+    return coordinates
+
+def _block_boxes(blocks, level, lower, upper, shape):
+    """
+    :return: tuple (lower, upper) of the (..., 3) corners of the blocks of 2**level cells along each axis with the
+      given Morton codes, grown slightly so points on a face are inside.
+    """
+    first = _morton_coordinates(blocks, _octree_depth(shape) - level) << level
+    last = np.minimum(first + (1 << level), shape)
+    cell_size = (upper - lower) / shape
+    slack = 1e-9 * (np.abs(upper - lower).max() + np.abs(lower).max() + 1)
+    return lower + first * cell_size - slack, np.minimum(lower + last * cell_size, upper) + slack
+
+def query_planes(model, planes):
+    """
+    Find the edges in the grid cells that are not completely outside the given model space planes.
+    The blocks of cells are tested from the whole grid down: blocks outside a plane are skipped, blocks inside
+    every plane are taken whole and only the blocks crossing a plane are split, so the cost follows the
+    number of cells near the planes rather than the number of cells.
+    :param model: Dictionary or model_loader.Model with arrays from build_edge_grid.
+    :param planes: (P, 4) array of planes, see rendering_helpers.world_frustum_planes.
+    :return: sorted array of the indices of the edges that may lie inside all planes.
+    """
+    bounds, shape = np.asarray(model["grid_bounds"]), np.asarray(model["grid_shape"])
+    codes, offsets = np.asarray(model["grid_codes"]), np.asarray(model["grid_offsets"])
+    planes = np.asarray(planes, dtype=np.float64)
+
+    # Ranges of grid_codes positions of the cells that were kept
+    starts, stops = [], []
+    blocks = np.zeros(1 if len(codes) else 0, dtype=np.int64)
+    for level in range(_octree_depth(shape), -1, -1):
+        block_lower, block_upper = _block_boxes(blocks, level, bounds[0], bounds[1], shape)
+        outside, crossing = boxes_outside(planes, block_lower, block_upper)
+        taken = ~outside & (~crossing.any(axis=-1) | (level == 0))
+        starts.append(np.searchsorted(codes, blocks[taken] << (3 * level)))
+        stops.append(np.searchsorted(codes, (blocks[taken] + 1) << (3 * level)))
+        if level == 0:
+            break
+
+        # Split the crossing blocks in eight and keep the parts holding cells
+        children = ((blocks[~outside & ~taken] << 3)[:, None] + np.arange(8)).ravel()
+        child_shift = 3 * (level - 1)
+        blocks = children[np.searchsorted(codes, children << child_shift) < np.searchsorted(codes, (children + 1) << child_shift)]
+
+    starts, stops = offsets[np.concatenate(starts)], offsets[np.concatenate(stops)]
+    counts = stops - starts
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return np.unique(np.asarray(model["grid_edges"])[positions])
+
+def window_edges(model, rotation, translation, camera_intrinsics, x0, y0, x1, y1, near, far=None, margin=1):
+    """
+    Find the edges that may show up in a rectangle of the image, without projecting the others.
+    :param model: Dictionary or model_loader.Model with arrays from build_edge_grid.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param x0: left side of the rectangle in pixels.
+    :param y0: top side of the rectangle in pixels.
+    :param x1: right side of the rectangle in pixels.
+    :param y1: bottom side of the rectangle in pixels.
+    :param near: distance of the near plane.
+    :param far: distance of the far plane, or None for no far plane.
+    :param margin: pixels of slack around the rectangle, see rendering_helpers.frustum_planes.
+    :return: sorted array of edge indices, every edge with a point in the rectangle among them.
+    """
+    # Camera matrix of an image that starts at the corner of the rectangle
+    shift = np.array([[1., 0., -x0], [0., 1., -y0], [0., 0., 1.]])
+    planes = world_frustum_planes(rotation, translation, shift @ camera_intrinsics, x1 - x0, y1 - y0, near, far, margin)
+    return query_planes(model, planes)
+
+def frustum_edges(model, rotation, translation, camera_intrinsics, image_width, image_height, near, far=None):
+    """
+    Find the edges that may show up in the image, see window_edges.
+    :return: sorted array of edge indices.
+    """
+    return window_edges(model, rotation, translation, camera_intrinsics, 0, 0, image_width, image_height, near, far)
+
+def pick_edge(model, rotation, translation, camera_intrinsics, x, y, near, radius=PICK_RADIUS):
+    """
+    Find the edge under the cursor. Only the edges the grid finds near the cursor are projected.
+    :param model: Dictionary or model_loader.Model with arrays from build_edge_grid.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param x: column of the pixel under the cursor.
+    :param y: row of the pixel under the cursor.
+    :param near: distance of the near plane, the part of the edges closer to the camera cannot be picked.
+    :param radius: largest distance in pixels from the pixel centre to a picked edge.
+    :return: index of the edge closest to the cursor on screen, or None when no edge is within radius.
+    """
+    # Pixels cover [x, x + 1), the same as the truncated projection, so the cursor sits at the pixel centre
+    cursor = np.array([x + 0.5, y + 0.5])
+    candidates = window_edges(
+        model, rotation, translation, camera_intrinsics, cursor[0] - radius, cursor[1] - radius,
+        cursor[0] + radius, cursor[1] + radius, near, margin=0,
+    )
+    if not len(candidates):
+        return None
+
+    # Cut the candidates at the near plane and measure their distance to the cursor on the image plane
+    rotation, translation = np.asarray(rotation, dtype=np.float64), np.asarray(translation, dtype=np.float64)
+    vertices = np.asarray(model["vertices"], dtype=np.float64)
+    segments = (vertices[np.asarray(model["edges"])[candidates]] - translation) @ rotation
+    depth = segments[..., 2]
+    in_front = (depth >= near).any(axis=1)
+    candidates, segments, depth = candidates[in_front], segments[in_front], depth[in_front]
+    t = np.divide(near - depth[:, 0], depth[:, 1] - depth[:, 0], out=np.zeros(len(depth)), where=depth.min(axis=1) < near)
+    cut = segments[:, 0] + t[:, None] * (segments[:, 1] - segments[:, 0])
+    segments[:, 0] = np.where((depth[:, 0] < near)[:, None], cut, segments[:, 0])
+    segments[:, 1] = np.where((depth[:, 1] < near)[:, None], cut, segments[:, 1])
+
+    projected = segments @ np.asarray(camera_intrinsics, dtype=np.float64).T
+    points = projected[..., :2] / projected[..., 2:]
+    start, direction = points[:, 0], points[:, 1] - points[:, 0]
+    length = (direction ** 2).sum(axis=1)
+    along = np.clip(np.divide(((cursor - start) * direction).sum(axis=1), length, out=np.zeros(len(length)), where=length > 0), 0, 1)
+    distance = np.sqrt(((start + along[:, None] * direction - cursor) ** 2).sum(axis=1))
+
+    if not len(distance) or distance.min() > radius:
+        return None
+    return int(candidates[np.argmin(distance)])
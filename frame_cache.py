@@ -0,0 +1,196 @@
+from time import perf_counter
+
+import cv2
+import numpy as np
+from renderer import BufferPool
+from rendering import NEAR_PLANE, convert_model_to_camera_space, clip_edges, project_points, blank_image
+from rendering_helpers import yp_mat
+
+ANGLE_THRESHOLD = 1e-4
+TRANSLATION_THRESHOLD = 1e-4
+REDRAW_FRACTION = 0.5
+CACHE_TILE_SIZE = 32
+
+
+class FrameCache:
+    """
+    Renders one model for a camera that mostly stands still, reusing the previous frame where it can.
+
+    A pose within the thresholds of the last rendered one returns the last frame as is. Any other pose is
+    transformed and projected in full, which is cheap, but only the tiles of the frame that the old or new
+    lines of edges with changed pixel endpoints pass through are rasterized again. Edges with the same pixel
+    endpoints have the same pixels, so the frame is exactly what a full render of the new pose would give.
+    When most tiles changed, the frame is drawn from scratch instead.
+
+    frame is the last frame and pose the (yaw, pitch, translation) it was drawn for.
+    """
+
+    def __init__(
+        self,
+        model,
+        camera_intrinsics,
+        image_width, image_height,
+        near_plane=NEAR_PLANE,
+        angle_threshold=ANGLE_THRESHOLD,
+        translation_threshold=TRANSLATION_THRESHOLD,
+        redraw_fraction=REDRAW_FRACTION,
+        tile_size=CACHE_TILE_SIZE,
+    ):
+        """
+        :param model: Dictionary or model_loader.Model representing the model to render, see rendering.render_wireframe.
+          Levels of detail are not used, every edge is drawn.
+        :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+        :param image_width: width of the image in pixels
+        :param image_height: height of the image in pixels
+        :param near_plane: distance in front of the camera where edges get clipped.
+        :param angle_threshold: largest change of the yaw and of the pitch in radians that returns the cached frame.
+        :param translation_threshold: largest distance the camera may move and still get the cached frame.
+        :param redraw_fraction: fraction of the tiles that need redrawing above which the frame is drawn from scratch.
+        :param tile_size: width and height in pixels of the tiles the frame is redrawn in.
+        """
+        self.vertices = np.ascontiguousarray(model["vertices"], dtype=np.float64).reshape(-1, 3)
+        self.edges = np.ascontiguousarray(model["edges"], dtype=np.int64).reshape(-1, 2)
+        self.image_width = image_width
+        self.image_height = image_height
+        self.near_plane = near_plane
+        self.angle_threshold = angle_threshold
+        self.translation_threshold = translation_threshold
+        self.redraw_fraction = redraw_fraction
+        self.tile_size = tile_size
+        self.buffers = BufferPool()
+        self.frame = None
+        self.pose = None
+
+        self.frames_skipped = 0
+        self.frames_incremental = 0
+        self.frames_full = 0
+        self.edges_redrawn = 0
+
+        self._points = None
+        self._visible = None
+        self.set_intrinsics(camera_intrinsics)
+
+    def set_intrinsics(self, camera_intrinsics):
+        """
+        Change the camera intrinsics. The next frame is drawn from scratch.
+        :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+        """
+        self.camera_intrinsics = np.array(camera_intrinsics, dtype=np.float64)
+        self.frame = None
+
+    def render(self, yaw, pitch, translation, stats=None):
+        """
+        Render the model from a camera pose, redrawing as little of the previous frame as possible.
+        :param yaw: camera yaw in radians, see rendering_helpers.yp_mat.
+        :param pitch: camera pitch in radians.
+        :param translation: 3-element position of the camera within world space.
+        :param stats: optional callable receiving the stage timing, see rendering.render_wireframe. The "frame"
+          stage counts the edges that were redrawn and whether the cached frame was returned.
+        :return: The wireframe image. The same array is drawn into by every render, copy it to keep a frame.
+        """
+        started = perf_counter() if stats is not None else 0
+        translation = np.array(translation, dtype=np.float64).reshape(3)
+
+        if self.frame is not None and self._within_thresholds(yaw, pitch, translation):
+            self.frames_skipped += 1
+            if stats is not None:
+                stats("frame", perf_counter() - started, edges=len(self.edges), redrawn=0, skipped=1)
+            return self.frame
+
+        camera_space = convert_model_to_camera_space(
+            self.vertices, yp_mat(yaw, pitch), translation, out=self.buffers.get("camera_space", self.vertices.shape), stats=stats
+        )
+        segments, visible = clip_edges(
+            camera_space, self.edges, self.camera_intrinsics, self.image_width, self.image_height, self.near_plane,
+            out=self.buffers.get("segments", (len(self.edges), 2, 3)), stats=stats
+        )
+        points, _ = project_points(segments, self.camera_intrinsics, stats=stats)
+
+        if self.frame is None:
+            redrawn = self._draw_full(points, visible)
+        else:
+            redrawn = self._draw_changes(points, visible)
+        self.edges_redrawn += redrawn
+        self.pose = (yaw, pitch, translation)
+        self._points, self._visible = points, visible
+
+        if stats is not None:
+            stats("frame", perf_counter() - started, edges=len(self.edges), redrawn=redrawn, skipped=0)
+        return self.frame
+
+    def _within_thresholds(self, yaw, pitch, translation):
+        last_yaw, last_pitch, last_translation = self.pose
+        return (
+            abs(yaw - last_yaw) <= self.angle_threshold
+            and abs(pitch - last_pitch) <= self.angle_threshold
+            and np.linalg.norm(translation - last_translation) <= self.translation_threshold
+        )
+
+    def _draw_full(self, points, visible):
+        """
+        :return: number of edges drawn.
+        """
+        buffer = self.buffers.get("frame", (self.image_height, self.image_width, 3), np.uint8)
+        self.frame = blank_image(self.image_width, self.image_height, out=buffer)
+        if visible.any():
+            cv2.polylines(self.frame, points[visible], False, (255, 255, 255), 1)
+        self.frames_full += 1
+        return int(np.count_nonzero(visible))
+
+    def _draw_changes(self, points, visible):
+        """
+        :return: number of edges drawn.
+        """
+        # Edges that appeared, disappeared or have a different pixel at either end
+        moved = (visible != self._visible) | (visible & (points != self._points).any(axis=(1, 2)))
+        changed_segments = np.concatenate([self._points[moved & self._visible], points[moved & visible]])
+        dirty = self._dirty_tiles(changed_segments)
+        if np.count_nonzero(dirty) > self.redraw_fraction * dirty.size:
+            return self._draw_full(points, visible)
+        self.frames_incremental += 1
+        if not len(changed_segments):
+            return 0
+
+        # Clear the dirty tiles, then draw every visible edge whose box meets one of them. Drawing an unmoved
+        # edge whole only sets pixels that were set already outside the dirty tiles.
+        tile = self.tile_size
+        tile_rows, tile_columns = np.nonzero(dirty)
+        for row, column in zip(tile_rows.tolist(), tile_columns.tolist()):
+            self.frame[row * tile:(row + 1) * tile, column * tile:(column + 1) * tile] = 0
+
+        # Summed area table of the dirty tiles, to count the dirty tiles in the box of every edge at once
+        table = np.zeros((dirty.shape[0] + 1, dirty.shape[1] + 1), dtype=np.int64)
+        table[1:, 1:] = dirty.cumsum(axis=0).cumsum(axis=1)
+        lower = np.clip(points.min(axis=1) // tile, 0, np.array(dirty.shape[::-1]) - 1)
+        upper = np.clip(points.max(axis=1) // tile, 0, np.array(dirty.shape[::-1]) - 1) + 1
+        dirty_count = (
+            table[upper[:, 1], upper[:, 0]] - table[lower[:, 1], upper[:, 0]]
+            - table[upper[:, 1], lower[:, 0]] + table[lower[:, 1], lower[:, 0]]
+        )
+        drawn = visible & (dirty_count > 0)
+
+        if drawn.any():
+            cv2.polylines(self.frame, points[drawn], False, (255, 255, 255), 1)
+        return int(np.count_nonzero(drawn))
+
+    def _dirty_tiles(self, segments):
+        """
+        Tiles that pixels of some segments may fall in. The segments are drawn into a mask with one pixel per
+        tile, which is grown until it covers every tile an image pixel of the segments can be in.
+        :param segments: (S, 2, 2) int32 array of pixel endpoints.
+        :return: (tiles down, tiles across) boolean array.
+        """
+        tile = self.tile_size
+        tiles_down, tiles_across = -(-self.image_height // tile), -(-self.image_width // tile)
+        if not len(segments):
+            return np.zeros((tiles_down, tiles_across), dtype=bool)
+
+        # The centre of tile i is at (i + 0.5) * tile - 0.5 in pixels. OpenCV rounds the ends of the coarse lines
+        # to whole tiles and clips them at the centres of the outer tiles, so the mask has a border that is cut
+        # off again, and is grown by two tiles to cover the rounding.
+        dirty = np.zeros((tiles_down + 4, tiles_across + 4), dtype=np.uint8)
+        limit = np.iinfo(np.int32).max // 2
+        coarse = np.clip(np.rint((segments + 0.5) / tile + 1.5), -limit, limit).astype(np.int32)
+        cv2.polylines(dirty, coarse, False, 1, 1)
+        dirty = cv2.dilate(dirty, np.ones((5, 5), np.uint8))[2:-2, 2:-2]
+        return dirty.astype(bool)
@@ -0,0 +1,85 @@
+import numpy as np
+from rendering import NEAR_PLANE, transform_points, clip_edges, project_points, draw_segments, blank_image
+from rendering_helpers import compose_transforms, frustum_planes, world_to_camera_matrix
+from scene import bounding_sphere
+
+INSTANCE_CHUNK_SIZE = 256
+
+
+def visible_instances(model, instance_transforms, rotation, translation, camera_intrinsics, image_width, image_height, near_plane=NEAR_PLANE):
+    """
+    Find the instances whose bounding spheres are not completely outside the view frustum.
+    The sphere of the model is computed once and moved by every instance transform, so culling never looks
+    at the vertices of an instance.
+
+    :param model: Dictionary or model_loader.Model shared by every instance.
+    :param instance_transforms: (I, 4, 4) array of matrices taking the model into world space, see
+      rendering_helpers.pose_matrix.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near_plane: distance of the near plane in front of the camera.
+    :return: sorted array of instance indices.
+    """
+    center, radius = bounding_sphere(model["vertices"])
+    transforms = compose_transforms(world_to_camera_matrix(rotation, translation), instance_transforms).reshape(-1, 4, 4)
+
+    # A scaled instance grows its sphere by the largest stretch of its linear part
+    centers = transforms[:, :3, :3] @ center + transforms[:, :3, 3]
+    radii = radius * np.linalg.norm(transforms[:, :3, :3], ord=2, axis=(1, 2))
+    planes = frustum_planes(camera_intrinsics, image_width, image_height, near_plane)
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return np.flatnonzero((distances >= -radii[:, None]).all(axis=1))
+
+def render_instances(
+    model,
+    instance_transforms,
+    rotation, translation,
+    camera_intrinsics,
+    image_width, image_height,
+    near_plane=NEAR_PLANE,
+    chunk_size=INSTANCE_CHUNK_SIZE,
+    out=None,
+    tile_size=None,
+):
+    """
+    Render many copies of one model placed at different world poses into a single wireframe image.
+    Every instance transform is chained with the camera into one matrix, and the visible instances are
+    transformed, clipped and projected chunk_size at a time with batched operations. The vertices are never
+    copied per instance, so only one chunk of camera space vertices is held in memory at once.
+
+    :param model: Dictionary or model_loader.Model shared by every instance, see rendering.render_wireframe.
+    :param instance_transforms: (I, 4, 4) array of matrices taking the model into world space, see
+      rendering_helpers.pose_matrix.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near_plane: distance in front of the camera where edges get clipped.
+    :param chunk_size: number of instances transformed per batch.
+    :param out: optional preallocated (image_height, image_width, 3) uint8 array to render into.
+    :param tile_size: optional tile size for drawing large images on multiple threads, see rendering.draw_segments.
+    :return: the wireframe image as an (image_height, image_width, 3) uint8 numpy array.
+    """
+    vertices = np.asarray(model["vertices"], dtype=np.float64).reshape(-1, 3)
+    edges = np.asarray(model["edges"], dtype=np.int64).reshape(-1, 2)
+    instance_transforms = np.asarray(instance_transforms, dtype=np.float64).reshape(-1, 4, 4)
+
+    visible = visible_instances(
+        model, instance_transforms, rotation, translation, camera_intrinsics, image_width, image_height, near_plane
+    )
+    transforms = compose_transforms(world_to_camera_matrix(rotation, translation), instance_transforms[visible])
+
+    image = blank_image(image_width, image_height, out)
+    for start in range(0, len(transforms), chunk_size):
+        vertices_camera_space = transform_points(vertices, transforms[start:start + chunk_size])
+        segments, visible_edges = clip_edges(
+            vertices_camera_space, edges, camera_intrinsics, image_width, image_height, near_plane
+        )
+        points_2d, _ = project_points(segments[visible_edges], camera_intrinsics)
+        draw_segments(image, points_2d, tile_size)
+
+    return image
@@ -0,0 +1,113 @@
+import numpy as np
+
+LOD_LEVELS = 4
+LOD_PIXEL_ERROR = 1.0
+
+
+def cluster_vertices(vertices, cell_size):
+    """
+    Vertex clustering: snap the vertices of every grid cell onto one of them.
+    :param vertices: (N, 3) array of points.
+    :param cell_size: edge length of the grid cells.
+    :return: (N,) int64 array with the index of the vertex each vertex is snapped to. Every cell keeps the
+      vertex closest to the mean of the cell, so the simplified model reuses the original vertex array.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    if not len(vertices):
+        return np.zeros(0, dtype=np.int64)
+    _, cluster = np.unique(np.floor(vertices / cell_size).astype(np.int64), axis=0, return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    counts = np.bincount(cluster)
+    means = np.stack([np.bincount(cluster, vertices[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+    distance = ((vertices - means[cluster]) ** 2).sum(axis=1)
+
+    # Sorting by cluster and then by distance puts the vertex to keep first in every cluster
+    order = np.lexsort((distance, cluster))
+    first = order[np.concatenate([[0], np.cumsum(counts)[:-1]])]
+    return first[cluster]
+
+def simplify_edges(vertices, edges, cell_size):
+    """
+    Simplified edge set of a model, see cluster_vertices. Edges that collapse onto a single vertex are dropped
+    and edges that end up joining the same two vertices are kept once.
+    :param vertices: (N, 3) array of points.
+    :param edges: (E, 2) array of pairs of indices into vertices.
+    :param cell_size: edge length of the grid cells.
+    :return: (E', 2) int32 array of pairs of indices into the same vertices.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    snapped = np.sort(cluster_vertices(vertices, cell_size)[edges], axis=1)
+    snapped = snapped[snapped[:, 0] != snapped[:, 1]]
+    return np.unique(snapped, axis=0).astype(np.int32)
+
+def build_lods(vertices, edges, levels=LOD_LEVELS):
+    """
+    Precompute simplified edge sets of a model, to store alongside its vertices and edges.
+    Level 0 is the model itself, and level k clusters the vertices on a grid with cells of radius / 2^(levels - k),
+    where radius is that of the bounding sphere.
+    :param vertices: (N, 3) array of points.
+    :param edges: (E, 2) array of pairs of indices into vertices.
+    :param levels: number of simplified levels.
+    :return: dictionary of arrays:
+      - "lod_sphere" as the bounding sphere (x, y, z, radius) the levels were built for
+      - "lod_cell_sizes" (levels + 1,) with the grid cell size of every level, 0 for level 0
+      - "lod_offsets" (levels + 2,) so the edges of level k are lod_edges[lod_offsets[k]:lod_offsets[k + 1]]
+      - "lod_edges" with the edge sets of every level one after another
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+    lower, upper = vertices.min(axis=0), vertices.max(axis=0)
+    center = (lower + upper) / 2
+    radius = np.sqrt(((vertices - center) ** 2).sum(axis=1).max())
+
+    cell_sizes = [0.] + [radius / 2 ** (levels - level) for level in range(1, levels + 1)]
+    edge_sets = [edges] + [simplify_edges(vertices, edges, cell_size) for cell_size in cell_sizes[1:]]
+    return {
+        "lod_sphere": np.append(center, radius),
+        "lod_cell_sizes": np.array(cell_sizes),
+        "lod_offsets": np.cumsum([0] + [len(edge_set) for edge_set in edge_sets]),
+        "lod_edges": np.concatenate(edge_sets),
+    }
+
+def lod_edges(model, level):
+    """
+    :param model: Dictionary or model_loader.Model with arrays from build_lods.
+    :param level: level of detail, 0 for the full model.
+    :return: (E', 2) edge array of that level.
+    """
+    offsets = model["lod_offsets"]
+    return model["lod_edges"][offsets[level]:offsets[level + 1]]
+
+def select_lod(model, rotation, translation, camera_intrinsics, pixel_error=LOD_PIXEL_ERROR):
+    """
+    Pick the coarsest level whose snapped vertices move by at most pixel_error pixels on screen.
+    A vertex moves by up to the diagonal of a grid cell, which shrinks with the distance to the camera
+    like everything else. The depth used is that of the closest point of the bounding sphere.
+    :param model: Dictionary or model_loader.Model with arrays from build_lods.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics, e.g. from make_intrinsics.
+    :param pixel_error: largest allowed displacement of a vertex in pixels.
+    :return: the level of detail, 0 for the full model.
+    """
+    if "lod_cell_sizes" not in model:
+        return 0
+    sphere = np.asarray(model["lod_sphere"])
+    depth = (sphere[:3] - np.asarray(translation)) @ np.asarray(rotation)[:, 2] - sphere[3]
+    if depth <= 0:
+        return 0
+
+    focal_length = np.abs(np.diag(camera_intrinsics)[:2]).max()
+    errors = np.sqrt(3) * np.asarray(model["lod_cell_sizes"]) * focal_length / depth
+    return int(np.flatnonzero(errors <= pixel_error)[-1])
+
+def select_lod_edges(model, rotation, translation, camera_intrinsics, pixel_error=LOD_PIXEL_ERROR):
+    """
+    The edges of the level picked by select_lod, or all of the model's edges when it has no levels
+    or pixel_error is None.
+    :return: (E', 2) edge array.
+    """
+    if pixel_error is None or "lod_cell_sizes" not in model:
+        return model["edges"]
+    return lod_edges(model, select_lod(model, rotation, translation, camera_intrinsics, pixel_error))
@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from edge_grid import build_edge_grid
+from lod import build_lods
+from topology import preprocess_arrays
+
+COMPILED_MODEL_EXTENSION = ".model"
+MODEL_CACHE_SIZE = 32
+
+
+class Model:
+    """
+    A wireframe model held as NumPy arrays instead of nested lists.
+
+    The arrays are kept in a dictionary so extra per model data can be stored and compiled alongside the
+    vertices and edges. Indexing works like the JSON dictionary, so a Model can be passed anywhere a
+    {"vertices", "edges"} dictionary is expected, including render_wireframe.
+    """
+
+    def __init__(self, vertices, edges, **arrays):
+        """
+        :param vertices: (N, 3) array of 3D points.
+        :param edges: (E, 2) array of pairs of indices into vertices.
+        :param arrays: any additional named arrays that belong to the model.
+        """
+        self.arrays = {"vertices": vertices, "edges": edges, **arrays}
+
+    @classmethod
+    def from_dict(cls, model, vertex_dtype=np.float32):
+        """
+        Build a model from the JSON dictionary format with int32 edges.
+        :param model: Dictionary with "vertices" as a list of 3D points and "edges" as a list of index pairs,
+          and optionally "faces" as a list of index triples for hidden line removal.
+        :param vertex_dtype: dtype of the vertex array.
+        :return: A new Model.
+        """
+        vertices = np.asarray(model["vertices"], dtype=vertex_dtype).reshape(-1, 3)
+        edges = np.asarray(model["edges"], dtype=np.int32).reshape(-1, 2)
+        if "faces" in model:
+            return cls(vertices, edges, faces=np.asarray(model["faces"], dtype=np.int32).reshape(-1, 3))
+        return cls(vertices, edges)
+
+    def preprocessed(self):
+        """
+        Canonicalize the edges, drop unused vertices and index the edges of every vertex, see topology.preprocess_arrays.
+        Faces are renumbered with the vertices. Other arrays refer to the old vertex and edge numbering, so they are left out.
+        :return: A new Model, or this one if it is already preprocessed.
+        """
+        if "adjacency_offsets" in self:
+            return self
+        faces = self["faces"] if "faces" in self else None
+        return Model(**preprocess_arrays(self.vertices, self.edges, faces))
+
+    @property
+    def vertices(self):
+        return self.arrays["vertices"]
+
+    @property
+    def edges(self):
+        return self.arrays["edges"]
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+    def save(self, model_dir):
+        """
+        Write the model in the compiled format: a directory holding one .npy file per array.
+        Arrays left in the directory by an earlier model are removed, since load_model reads every .npy file.
+        :param model_dir: path of the directory to write, created if needed.
+        """
+        os.makedirs(model_dir, exist_ok=True)
+        for entry in os.scandir(model_dir):
+            name, extension = os.path.splitext(entry.name)
+            if extension == ".npy" and name not in self.arrays:
+                os.remove(entry.path)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(model_dir, name + ".npy"), np.ascontiguousarray(array))
+
+
+def compile_model(model_file, model_dir=None, vertex_dtype=np.float32, lod_levels=0, preprocess=True, edge_grid=False):
+    """
+    Convert a JSON model into the compiled binary format so it can be memory-mapped instead of parsed.
+    :param model_file: path of the JSON model.
+    :param model_dir: output directory, defaults to the JSON path with a .model extension.
+    :param vertex_dtype: dtype the vertices are stored as. float32 halves the size but rounds the JSON values.
+    :param lod_levels: number of simplified edge sets to precompute and store with the model, see lod.build_lods.
+    :param preprocess: store the model canonicalized with its vertex to edge index, see Model.preprocessed.
+    :param edge_grid: store a spatial index over the edges, see edge_grid.build_edge_grid.
+    :return: the path of the compiled model.
+    """
+    if model_dir is None:
+        model_dir = os.path.splitext(model_file)[0] + COMPILED_MODEL_EXTENSION
+
+    with open(model_file, 'r') as f:
+        model = Model.from_dict(json.load(f), vertex_dtype)
+    if preprocess:
+        model = model.preprocessed()
+    if lod_levels:
+        model.arrays.update(build_lods(model.vertices, model.edges, lod_levels))
+    if edge_grid:
+        model.arrays.update(build_edge_grid(model.vertices, model.edges))
+    model.save(model_dir)
+
+    return model_dir
+
+
+def load_model(model_path, mmap=True, preprocess=False, edge_grid=False):
+    """
+    Load a model from either a JSON file or a compiled model directory.
+    Compiled arrays are memory-mapped read only, so opening a large model does not copy it.
+    JSON vertices are kept as float64 so they match the values written in the file exactly.
+    :param model_path: path of a .json file or of a directory written by compile_model.
+    :param mmap: memory-map the compiled arrays rather than reading them into memory.
+    :param preprocess: canonicalize the model and index it, see Model.preprocessed. Compiled models are
+      usually stored preprocessed already. Leave it off to keep the vertex numbering of a JSON file.
+    :param edge_grid: build the spatial index over the edges unless the model has it already, see
+      edge_grid.build_edge_grid. Renders and picks then only project the edges near the view.
+    :return: A Model.
+    """
+    if not os.path.isdir(model_path):
+        with open(model_path, 'r') as f:
+            model = Model.from_dict(json.load(f), np.float64)
+        return _finish_model(model, preprocess, edge_grid)
+
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for file_name in sorted(os.listdir(model_path)):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".npy":
+            arrays[name] = np.load(os.path.join(model_path, file_name), mmap_mode=mmap_mode)
+
+    return _finish_model(Model(**arrays), preprocess, edge_grid)
+
+
+def _finish_model(model, preprocess, edge_grid):
+    """
+    Apply the optional load steps of load_model.
+    """
+    if preprocess:
+        model = model.preprocessed()
+    if edge_grid and "grid_codes" not in model:
+        model = Model(**model.arrays, **build_edge_grid(model.vertices, model.edges))
+    return model
+
+
+def _model_mtime(model_path):
+    """
+    Modification time of a model file, or of the newest array inside a compiled model directory.
+    """
+    if not os.path.isdir(model_path):
+        return os.stat(model_path).st_mtime_ns
+    return max([os.stat(entry.path).st_mtime_ns for entry in os.scandir(model_path)] + [os.stat(model_path).st_mtime_ns])
+
+
+class ModelCache:
+    """
+    Least recently used cache of loaded models keyed by path and modification time.
+
+    Cached arrays are made read only since every caller shares them. A model whose file changed on disk
+    is reloaded on the next lookup.
+    """
+
+    def __init__(self, max_size=MODEL_CACHE_SIZE):
+        """
+        :param max_size: maximum number of models kept, the least recently used one is evicted first.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_path):
+        """
+        Return the cached model for model_path, loading it on a miss or when the file changed.
+        :param model_path: path of a .json file or of a compiled model directory.
+        :return: A Model with read only arrays.
+        """
+        key = os.path.abspath(model_path)
+        mtime = _model_mtime(key)
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        model = load_model(key)
+        for array in model.arrays.values():
+            array.flags.writeable = False
+
+        with self._lock:
+            self._models[key] = (mtime, model)
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_size:
+                self._models.popitem(last=False)
+
+        return model
+
+    def clear(self):
+        """
+        Drop every cached model and reset the hit and miss counts.
+        """
+        with self._lock:
+            self._models.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        :return: dictionary with the hit and miss counts and the current and maximum size.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._models), "max_size": self.max_size}
+
+
+MODEL_CACHE = ModelCache()
+
+
+def load_cached_model(model_path):
+    """
+    Load a model through the process wide MODEL_CACHE.
+    :param model_path: path of a .json file or of a compiled model directory.
+    :return: A Model with read only arrays shared with every other caller.
+    """
+    return MODEL_CACHE.get(model_path)
+
+
+if __name__ == "__main__":
+    # Compile every model given on the command line, e.g. python model_loader.py models/*.json
+    for model_file in sys.argv[1:]:
+        print(f"Compiled {model_file} to {compile_model(model_file)}")
@@ -0,0 +1,150 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+from rendering import NEAR_PLANE, render_wireframe_batch
+
+PARALLEL_CHUNK_SIZE = 4
+
+# Model and camera of a worker process, set once by _init_worker
+_worker_state = {}
+
+
+class SharedModel:
+    """
+    Copies the vertex and edge arrays of a model into shared memory once, so worker processes map them
+    instead of receiving a pickled copy with every task. Close it, or use it as a context manager, to free
+    the shared memory.
+    """
+
+    def __init__(self, model):
+        """
+        :param model: Dictionary or model_loader.Model representing the model to share.
+        """
+        arrays = {
+            "vertices": np.ascontiguousarray(model["vertices"], dtype=np.float64).reshape(-1, 3),
+            "edges": np.ascontiguousarray(model["edges"], dtype=np.int64).reshape(-1, 2),
+        }
+        self.blocks = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks[name] = block
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_shared_model(specs):
+    """
+    Map the arrays of a SharedModel in a worker process. Pool workers share the resource tracker of the
+    process that created the blocks, which stays responsible for unlinking them.
+    :param specs: the specs attribute of the SharedModel.
+    :return: tuple (blocks, model). Keep the blocks referenced for as long as the model dictionary is used.
+    """
+    blocks, model = [], {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        model[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, model
+
+def _init_worker(specs, camera_intrinsics, image_width, image_height, near_plane):
+    blocks, model = attach_shared_model(specs)
+    _worker_state.update(
+        blocks=blocks, model=model, camera_intrinsics=camera_intrinsics,
+        image_width=image_width, image_height=image_height, near_plane=near_plane,
+    )
+
+def _render_chunk(rotations, translations):
+    state = _worker_state
+    return render_wireframe_batch(
+        state["model"], rotations, translations, state["camera_intrinsics"],
+        state["image_width"], state["image_height"], state["near_plane"],
+    )
+
+def render_parallel(
+    model,
+    rotations, translations,
+    camera_intrinsics,
+    image_width, image_height,
+    workers=None,
+    chunk_size=PARALLEL_CHUNK_SIZE,
+    use_threads=False,
+    near_plane=NEAR_PLANE,
+):
+    """
+    Render many camera poses across a pool of workers, yielding the frames in pose order.
+    Every task renders chunk_size poses with render_wireframe_batch. At most two tasks per worker are in
+    flight, so a slow consumer does not make finished frames pile up.
+
+    :param model: Dictionary or model_loader.Model representing the model to render, see rendering.render_wireframe.
+    :param rotations: (F, 3, 3) numpy array of camera rotation matrices within world space.
+    :param translations: (F, 3) numpy array of camera positions within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of each frame in pixels
+    :param image_height: height of each frame in pixels
+    :param workers: number of workers, defaults to the number of CPUs.
+    :param chunk_size: number of poses rendered per task.
+    :param use_threads: use a thread pool sharing the model arrays directly instead of processes.
+      OpenCV and NumPy release the GIL for most of the work.
+    :param near_plane: distance in front of the camera where edges get clipped.
+    :return: generator of (image_height, image_width, 3) uint8 frames.
+    """
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+    workers = workers or os.cpu_count()
+    starts = iter(range(0, len(rotations), chunk_size))
+
+    shared = None
+    if use_threads:
+        model = {
+            "vertices": np.asarray(model["vertices"], dtype=np.float64).reshape(-1, 3),
+            "edges": np.asarray(model["edges"], dtype=np.int64).reshape(-1, 2),
+        }
+        executor = ThreadPoolExecutor(workers)
+        render_chunk = partial(
+            render_wireframe_batch, model,
+            camera_intrinsics=camera_intrinsics, image_width=image_width, image_height=image_height, near_plane=near_plane,
+        )
+    else:
+        shared = SharedModel(model)
+        executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker,
+            initargs=(shared.specs, camera_intrinsics, image_width, image_height, near_plane),
+        )
+        render_chunk = _render_chunk
+
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            stop = start + chunk_size
+            pending.append(executor.submit(render_chunk, rotations[start:stop], translations[start:stop]))
+
+    try:
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            frames = pending.popleft().result()
+            submit_next()
+            yield from frames
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if shared is not None:
+            shared.close()
@@ -0,0 +1,114 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds in seconds of the stage time histogram buckets, the last one catches everything
+PROFILE_BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 0.1, 0.3, 1.0, 3.0, float("inf"))
+
+
+class FrameStats:
+    """
+    Collects what the stages of one render report, for a closer look at a single frame.
+    Pass it as the stats argument of render_wireframe or of any of the stage functions.
+
+    After rendering, stages maps every stage name to a dictionary with its "seconds" and the counts it
+    reported, e.g. stats.stages["clip"]["culled"].
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, stage, seconds, **counts):
+        """
+        Record a stage. Called by the stage functions.
+        :param stage: name of the stage.
+        :param seconds: wall time the stage took.
+        :param counts: numbers describing the work done, e.g. vertices, edges, culled and allocated_bytes.
+        """
+        self.stages[stage] = dict(counts, seconds=seconds)
+
+    def total_seconds(self):
+        """
+        :return: the time of the whole frame if it was recorded, else the sum of the stage times.
+        """
+        if "frame" in self.stages:
+            return self.stages["frame"]["seconds"]
+        return sum(stage["seconds"] for stage in self.stages.values())
+
+
+class RenderProfiler:
+    """
+    Aggregates the stage reports of many frames into histograms of the stage times and totals of the counts.
+    It can be shared by threads, and exported with snapshot or as Prometheus text with prometheus_text.
+    Pass it as the stats argument of render_wireframe or of any of the stage functions.
+    """
+
+    def __init__(self, buckets=PROFILE_BUCKETS):
+        """
+        :param buckets: increasing upper bounds in seconds of the histogram buckets, ending with infinity.
+        """
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, seconds, **counts):
+        """
+        Record a stage. Called by the stage functions, see FrameStats.
+        """
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {"count": 0, "sum": 0.0, "bucket_counts": [0] * len(self.buckets), "totals": {}}
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["bucket_counts"][bucket] += 1
+            totals = entry["totals"]
+            for name, value in counts.items():
+                totals[name] = totals.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        :return: dictionary from stage name to a dictionary with the "count" of calls, the "sum" of their times,
+          "buckets" as cumulative (upper bound, count) pairs like a Prometheus histogram and the "totals" of every count.
+        """
+        with self._lock:
+            snapshot = {}
+            for stage, entry in self._stages.items():
+                cumulative, buckets = 0, []
+                for bound, count in zip(self.buckets, entry["bucket_counts"]):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                snapshot[stage] = {"count": entry["count"], "sum": entry["sum"], "buckets": buckets, "totals": dict(entry["totals"])}
+            return snapshot
+
+    def reset(self):
+        """
+        Forget every recorded frame.
+        """
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus_text(self, prefix="wireframe"):
+        """
+        Export the histograms and totals in the Prometheus text format, to serve to a scraper.
+        :param prefix: prefix of the metric names.
+        :return: the metrics as a string.
+        """
+        lines = [
+            f"# HELP {prefix}_stage_seconds Wall time of the rendering stages.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for stage, entry in sorted(snapshot.items()):
+            for bound, count in entry["buckets"]:
+                upper = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{upper}"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]!r}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+        lines.append(f"# HELP {prefix}_stage_items_total Items handled by the rendering stages.")
+        lines.append(f"# TYPE {prefix}_stage_items_total counter")
+        for stage, entry in sorted(snapshot.items()):
+            for name, value in sorted(entry["totals"].items()):
+                lines.append(f'{prefix}_stage_items_total{{stage="{stage}",item="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,357 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+TILE_SIZE = 512
+DEPTH_BIAS = 1e-3
+DEPTH_CHUNK_PIXELS = 1 << 22
+SUBPIXEL_BITS = 4
+ANTIALIAS_MARGIN = 4
+
+
+def clip_segments(segments, image_width, image_height, return_indices=False):
+    """
+    Clip integer line segments to the image the same way OpenCV's clipLine does, so the pixels walked from
+    the clipped endpoints are the ones cv2.line would draw.
+    :param segments: (E, 2, 2) integer array holding the two pixel endpoints of every segment.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param return_indices: also return the indices of the segments that were kept.
+    :return: (E', 4) int64 array of clipped segments (x1, y1, x2, y2), without the segments that miss the image,
+      or a tuple (clipped, indices) with return_indices.
+    """
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2, 2)
+    x1, y1 = segments[:, 0, 0], segments[:, 0, 1]
+    x2, y2 = segments[:, 1, 0], segments[:, 1, 1]
+    right, bottom = image_width - 1, image_height - 1
+
+    def outcode(x, y, vertical=True):
+        code = (x < 0) * 1 + (x > right) * 2
+        return code + (y < 0) * 4 + (y > bottom) * 8 if vertical else code
+
+    c1, c2 = outcode(x1, y1), outcode(x2, y2)
+    partly_outside = ((c1 & c2) == 0) & ((c1 | c2) != 0)
+
+    # Same order as OpenCV: move ends onto the top or bottom edge first, then onto the left or right edge,
+    # each time interpolating with the already clipped other end and truncating towards zero
+    with np.errstate(divide="ignore", invalid="ignore"):
+        edge = np.where(c1 < 8, 0, bottom)
+        move = partly_outside & ((c1 & 12) != 0)
+        x1 = np.where(move, x1 + np.trunc((edge - y1).astype(np.float64) * (x2 - x1) / (y2 - y1)), x1).astype(np.int64)
+        y1 = np.where(move, edge, y1)
+        c1 = np.where(move, outcode(x1, y1, vertical=False), c1)
+
+        edge = np.where(c2 < 8, 0, bottom)
+        move = partly_outside & ((c2 & 12) != 0)
+        x2 = np.where(move, x2 + np.trunc((edge - y2).astype(np.float64) * (x2 - x1) / (y2 - y1)), x2).astype(np.int64)
+        y2 = np.where(move, edge, y2)
+        c2 = np.where(move, outcode(x2, y2, vertical=False), c2)
+
+        partly_outside &= ((c1 & c2) == 0) & ((c1 | c2) != 0)
+        edge = np.where(c1 == 1, 0, right)
+        move = partly_outside & (c1 != 0)
+        y1 = np.where(move, y1 + np.trunc((edge - x1).astype(np.float64) * (y2 - y1) / (x2 - x1)), y1).astype(np.int64)
+        x1 = np.where(move, edge, x1)
+        c1 = np.where(move, 0, c1)
+
+        edge = np.where(c2 == 1, 0, right)
+        move = partly_outside & (c2 != 0)
+        y2 = np.where(move, y2 + np.trunc((edge - x2).astype(np.float64) * (y2 - y1) / (x2 - x1)), y2).astype(np.int64)
+        x2 = np.where(move, edge, x2)
+        c2 = np.where(move, 0, c2)
+
+    inside = (c1 | c2) == 0
+    clipped = np.stack([x1, y1, x2, y2], axis=1)[inside]
+    return (clipped, np.flatnonzero(inside)) if return_indices else clipped
+
+def clip_segments_float(segments, image_width, image_height, margin=0):
+    """
+    Clip subpixel line segments to the image grown by a margin on every side, moving each cut end along
+    its own segment so the lines keep their slopes.
+    :param segments: (E, 2, 2) float array holding the two subpixel endpoints of every segment.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param margin: pixels around the image that the clipped segments may still reach.
+    :return: (E', 2, 2) float64 array of clipped segments, without the segments that miss the grown image.
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    start, direction = segments[:, 0], segments[:, 1] - segments[:, 0]
+    lower = np.array([-margin, -margin], dtype=np.float64)
+    upper = np.array([image_width + margin, image_height + margin], dtype=np.float64)
+
+    # Liang-Barsky: the part of every segment inside each pair of borders, intersected over both axes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_lower, t_upper = (lower - start) / direction, (upper - start) / direction
+    parallel = direction == 0
+    t_enter = np.where(parallel, -np.inf, np.minimum(t_lower, t_upper)).max(axis=1, initial=0.0)
+    t_exit = np.where(parallel, np.inf, np.maximum(t_lower, t_upper)).min(axis=1, initial=1.0)
+    outside = (parallel & ((start < lower) | (start > upper))).any(axis=1)
+    kept = ~outside & (t_enter <= t_exit)
+
+    start, direction = start[kept], direction[kept]
+    return np.stack([start + t_enter[kept, None] * direction, start + t_exit[kept, None] * direction], axis=1)
+
+def _walk_parameters(clipped):
+    """
+    Per segment parameters of OpenCV's 8-connected line iterator, walking from left to right.
+    :return: dictionary of (E,) arrays.
+    """
+    x1, y1, x2, y2 = clipped.T
+    swap = x2 < x1
+    x1, x2 = np.where(swap, x2, x1), np.where(swap, x1, x2)
+    y1, y2 = np.where(swap, y2, y1), np.where(swap, y1, y2)
+
+    dx, dy = x2 - x1, y2 - y1
+    step_y = np.where(dy < 0, -1, 1)
+    dy = np.abs(dy)
+    vertical = dy > dx
+
+    return {
+        "x": x1, "y": y1, "step_y": step_y, "vertical": vertical,
+        "major": np.where(vertical, dy, dx), "minor": np.where(vertical, dx, dy),
+    }
+
+def segment_pixels(walk, indices, first_steps, last_steps):
+    """
+    Pixels of a range of steps along some segments.
+    After k steps the iterator has taken (2 * minor * k + major - 1) // (2 * major) steps along the minor axis.
+    :param walk: parameters from _walk_parameters.
+    :param indices: (S,) indices of the segments to walk.
+    :param first_steps: (S,) first step to include for each segment.
+    :param last_steps: (S,) last step to include for each segment.
+    :return: tuple (xs, ys) of pixel coordinate arrays.
+    """
+    counts = np.maximum(last_steps - first_steps + 1, 0)
+    owner = np.repeat(indices, counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first_steps, counts)
+
+    major, minor = walk["major"][owner], walk["minor"][owner]
+    side_steps = (2 * minor * k + np.maximum(major - 1, 0)) // np.maximum(2 * major, 1)
+    vertical = walk["vertical"][owner]
+    step_y = walk["step_y"][owner]
+
+    xs = walk["x"][owner] + np.where(vertical, side_steps, k)
+    ys = walk["y"][owner] + step_y * np.where(vertical, k, side_steps)
+    return xs, ys
+
+def draw_segments_tiled(image, segments, tile_size=TILE_SIZE, workers=None, color=(255, 255, 255)):
+    """
+    Draw line segments tile by tile on a thread pool, with the same pixels as cv2.polylines.
+    Segments are clipped to the whole image once, then binned into the tiles their bounding boxes touch.
+    Every tile writes into its own view of the image, so tiles never share memory. Segments that lie in a
+    single tile are drawn by OpenCV, since it has nothing to clip there. Segments crossing tiles would be
+    clipped to the tile by OpenCV and start on a different pixel, so for those the tile walks the steps of
+    the whole line that fall in its rows or columns instead.
+
+    :param image: (H, W, 3) uint8 array that is drawn into in place.
+    :param segments: (E, 2, 2) integer array holding the two pixel endpoints of every segment.
+    :param tile_size: width and height of the tiles in pixels.
+    :param workers: number of threads, defaults to the number of CPUs.
+    :param color: color of the lines.
+    :return: The image that was passed in.
+    """
+    image_height, image_width = image.shape[:2]
+    clipped = clip_segments(segments, image_width, image_height)
+    if not len(clipped):
+        return image
+    walk = _walk_parameters(clipped)
+
+    # Bin every segment into each tile its bounding box overlaps
+    lower = np.minimum(clipped[:, :2], clipped[:, 2:]) // tile_size
+    upper = np.maximum(clipped[:, :2], clipped[:, 2:]) // tile_size
+    tiles_x = -(-image_width // tile_size)
+    spans = upper - lower + 1
+    counts = spans[:, 0] * spans[:, 1]
+    owner = np.repeat(np.arange(len(clipped)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile_x = lower[owner, 0] + offset % spans[owner, 0]
+    tile_y = lower[owner, 1] + offset // spans[owner, 0]
+    tile_ids = tile_y * tiles_x + tile_x
+    order = np.argsort(tile_ids, kind="stable")
+    tile_ids, owner = tile_ids[order], owner[order]
+    bounds = np.flatnonzero(np.diff(tile_ids)) + 1
+    starts, stops = np.concatenate([[0], bounds]), np.concatenate([bounds, [len(tile_ids)]])
+    single_tile = counts == 1
+
+    def draw_tile(start, stop):
+        tile_id = tile_ids[start]
+        left, top = (tile_id % tiles_x) * tile_size, (tile_id // tiles_x) * tile_size
+        right, bottom = min(left + tile_size, image_width), min(top + tile_size, image_height)
+        tile = image[top:bottom, left:right]
+        indices = owner[start:stop]
+
+        contained = single_tile[indices]
+        if contained.any():
+            local = clipped[indices[contained]].reshape(-1, 2, 2) - np.array([left, top])
+            cv2.polylines(tile, np.ascontiguousarray(local, dtype=np.int32), False, color, 1)
+            indices = indices[~contained]
+
+        # Steps along the major axis that land in this tile's columns (or rows for steep segments)
+        vertical = walk["vertical"][indices]
+        major_start = np.where(vertical, walk["y"][indices], walk["x"][indices])
+        step = np.where(vertical, walk["step_y"][indices], 1)
+        low = np.where(vertical, top, left)
+        high = np.where(vertical, bottom, right) - 1
+        first = np.where(step > 0, low - major_start, major_start - high)
+        last = np.where(step > 0, high - major_start, major_start - low)
+        first = np.maximum(first, 0)
+        last = np.minimum(last, walk["major"][indices])
+
+        xs, ys = segment_pixels(walk, indices, first, last)
+        inside = (xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)
+        tile[ys[inside] - top, xs[inside] - left] = color
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        for future in [executor.submit(draw_tile, start, stop) for start, stop in zip(starts, stops)]:
+            future.result()
+
+    return image
+
+def draw_segments_antialiased(image, segments, subpixel_bits=SUBPIXEL_BITS, color=(255, 255, 255)):
+    """
+    Draw antialiased line segments at subpixel precision with a single cv2.polylines call.
+    The endpoints are passed to OpenCV as fixed point numbers with subpixel_bits fractional bits. Truncating
+    puts a point at x into pixel floor(x), so the pixel covers [x, x + 1) and its centre is half a pixel
+    further. The endpoints are moved back by that half pixel, so the smooth lines sit where the truncated ones do.
+    :param image: (H, W, 3) uint8 array that is drawn into in place.
+    :param segments: (E, 2, 2) float array holding the two subpixel endpoints of every segment.
+    :param subpixel_bits: fractional bits of the fixed point endpoints, at most 16.
+    :param color: color of the lines.
+    :return: The image that was passed in.
+    """
+    # Cut the segments at a few pixels around the image, along their own direction so the slopes stay the
+    # same, which also keeps the fixed point numbers within int32
+    segments = clip_segments_float(segments, image.shape[1], image.shape[0], ANTIALIAS_MARGIN)
+    if not len(segments):
+        return image
+
+    scale = 1 << subpixel_bits
+    fixed = np.rint((segments - 0.5) * scale).astype(np.int32)
+    cv2.polylines(image, fixed, False, color, 1, cv2.LINE_AA, subpixel_bits)
+    return image
+
+def walk_segments(segments, image_width, image_height):
+    """
+    Every pixel cv2.polylines would draw for some segments, with the segment it belongs to.
+    :param segments: (E, 2, 2) integer array holding the two pixel endpoints of every segment.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :return: tuple (xs, ys, owner) of arrays with one entry per pixel, owner holding the segment indices.
+    """
+    clipped, kept = clip_segments(segments, image_width, image_height, return_indices=True)
+    walk = _walk_parameters(clipped)
+    indices = np.arange(len(clipped))
+    xs, ys = segment_pixels(walk, indices, np.zeros(len(clipped), dtype=np.int64), walk["major"])
+    return xs, ys, kept[np.repeat(indices, walk["major"] + 1)]
+
+def rasterize_depth(depth_buffer, triangles, triangle_depths, chunk_pixels=DEPTH_CHUNK_PIXELS):
+    """
+    Write the depth of filled triangles into a depth buffer, keeping the nearest depth of every pixel.
+    Pixels are sampled at their integer coordinates, the same positions the line pixels sit at. Triangles are
+    filled one row span at a time, and since the inverse of the depth is an affine function of the pixel
+    position, every covered pixel costs a multiply-add and a division.
+    :param depth_buffer: (H, W) float32 array, updated in place. Start from np.inf.
+    :param triangles: (F, 3, 2) array of the pixel coordinates of the corners.
+    :param triangle_depths: (F, 3) array of the camera space depths of the corners, all in front of the camera.
+    :param chunk_pixels: how many pixels are filled at once, to bound the memory for large triangles.
+    :return: The depth buffer that was passed in.
+    """
+    image_height, image_width = depth_buffer.shape
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 2)
+    inverse_depths = 1 / np.asarray(triangle_depths, dtype=np.float64).reshape(-1, 3)
+
+    # Orient every triangle counter clockwise, so a pixel is covered when all edge functions are non negative
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    keep = area != 0
+    triangles, inverse_depths, area = triangles[keep], inverse_depths[keep], area[keep]
+    flip = area < 0
+    triangles[flip] = triangles[flip][:, ::-1]
+    inverse_depths[flip] = inverse_depths[flip][:, ::-1]
+    area = np.abs(area)
+
+    # Edge i runs from corner i to corner i + 1, its function is ex * x + ey * y + e0
+    starts, ends = triangles, np.roll(triangles, -1, axis=1)
+    ex = -(ends[..., 1] - starts[..., 1])
+    ey = ends[..., 0] - starts[..., 0]
+    e0 = -(ex * starts[..., 0] + ey * starts[..., 1])
+
+    # The weight of a corner is the edge function of the opposite edge over the area, which makes the
+    # inverse depth ix * x + iy * y + i0
+    opposite = [1, 2, 0]
+    ix = (ex[:, opposite] * inverse_depths).sum(axis=1) / area
+    iy = (ey[:, opposite] * inverse_depths).sum(axis=1) / area
+    i0 = (e0[:, opposite] * inverse_depths).sum(axis=1) / area
+
+    # Rows of every triangle within the image
+    top = np.maximum(np.ceil(triangles[..., 1].min(axis=1)), 0).astype(np.int64)
+    bottom = np.minimum(np.floor(triangles[..., 1].max(axis=1)), image_height - 1).astype(np.int64)
+    row_counts = np.maximum(bottom - top + 1, 0)
+    owner = np.repeat(np.arange(len(triangles)), row_counts)
+    ys = top[owner] + np.arange(row_counts.sum()) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+
+    # Span of every row: each edge bounds x from below or above, edges along the row bound nothing or everything
+    bound = -(ey[owner] * ys[:, None] + e0[owner])
+    slope = ex[owner]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        limit = bound / slope
+    epsilon = 1e-9 * (np.abs(bound) + 1)
+    left = np.where(slope > 0, limit, -np.inf).max(axis=1)
+    right = np.where(slope < 0, limit, np.inf).min(axis=1)
+    empty = ((slope == 0) & (bound > epsilon)).any(axis=1)
+    left = np.maximum(np.ceil(left - 1e-9), 0)
+    right = np.minimum(np.floor(right + 1e-9), image_width - 1)
+    spans = np.where(empty, 0, np.maximum(right - left + 1, 0)).astype(np.int64)
+
+    rows = np.flatnonzero(spans)
+    flat_buffer = depth_buffer.reshape(-1)
+    first = 0
+    while first < len(rows):
+        last = first + max(1, np.searchsorted(np.cumsum(spans[rows[first:]]), chunk_pixels, side="right"))
+        chunk = rows[first:last]
+        first = last
+
+        counts = spans[chunk]
+        row = np.repeat(chunk, counts)
+        xs = left[row].astype(np.int64) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        triangle = owner[row]
+        depth = 1 / (ix[triangle] * xs + iy[triangle] * ys[row] + i0[triangle])
+        np.minimum.at(flat_buffer, ys[row] * image_width + xs, depth.astype(np.float32))
+
+    return depth_buffer
+
+def draw_segments_depth(image, segments, segment_depths, depth_buffer, depth_bias=DEPTH_BIAS, color=(255, 255, 255)):
+    """
+    Draw line segments with a depth test, leaving out the pixels that lie behind the depth buffer.
+    The pixels are those of cv2.polylines. Their depth is interpolated perspective correctly between the
+    depths of the segment ends, along the unclipped segment.
+    :param image: (H, W, 3) uint8 array that is drawn into in place.
+    :param segments: (E, 2, 2) integer array holding the two pixel endpoints of every segment.
+    :param segment_depths: (E, 2) array of the camera space depths of the endpoints, all in front of the camera.
+    :param depth_buffer: (H, W) float32 array of the nearest surface depths, np.inf where there is none, see rasterize_depth.
+    :param depth_bias: relative depth a line pixel may lie behind the surface and still be drawn, so the
+      edges of a face are not hidden by the face itself.
+    :param color: color of the lines.
+    :return: The image that was passed in.
+    """
+    image_height, image_width = image.shape[:2]
+    segments = np.asarray(segments, dtype=np.int64).reshape(-1, 2, 2)
+    inverse_depths = 1 / np.asarray(segment_depths, dtype=np.float64).reshape(-1, 2)
+    xs, ys, owner = walk_segments(segments, image_width, image_height)
+
+    # Position of every pixel along its segment, as a fraction from the first end to the second
+    start = segments[owner, 0]
+    direction = segments[owner, 1] - start
+    length = (direction ** 2).sum(axis=1)
+    along = (xs - start[:, 0]) * direction[:, 0] + (ys - start[:, 1]) * direction[:, 1]
+    t = np.clip(np.divide(along, length, out=np.zeros(len(along)), where=length > 0), 0, 1)
+    depth = 1 / ((1 - t) * inverse_depths[owner, 0] + t * inverse_depths[owner, 1])
+
+    # A pixel is only hidden when the surface covers its neighbours too, since the line pixels sit up to half
+    # a pixel off the exact edge and on a steep face that half pixel can be well in front of the line
+    surface = cv2.dilate(depth_buffer, np.ones((3, 3), np.uint8))
+    visible = depth <= surface[ys, xs] * (1 + depth_bias)
+    image[ys[visible], xs[visible]] = color
+    return image
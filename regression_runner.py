@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from rendering import convert_model_to_camera_space, project_to_image, render_wireframe
+from rendering_helpers import make_intrinsics, yp_mat, image_difference, diff_image
+from model_loader import load_cached_model
+
+MANIFEST_FILE = "tests/manifest.json"
+DIFF_DIR = "tests/diffs"
+
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    """
+    Read the test cases of a manifest. Every case is a dictionary with:
+      - "name", unique within the manifest
+      - "kind", one of "camera_space", "projection" or "render"
+      - "reference", the .npy or .png file with the expected result
+      - "model", "translation", "yaw" and "pitch" describing the model and the camera pose
+      - "image_width", "image_height" and "focal_length" for the kinds that project
+    :param manifest_file: path of the JSON manifest.
+    :return: list of case dictionaries.
+    """
+    with open(manifest_file, 'r') as f:
+        return json.load(f)["cases"]
+
+def _camera(case):
+    rotation = yp_mat(case["yaw"], case["pitch"])
+    translation = np.array(case["translation"], dtype=np.float64)
+    return rotation, translation
+
+def _camera_space(case):
+    rotation, translation = _camera(case)
+    vertices = np.array(load_cached_model(case["model"])["vertices"])
+    return convert_model_to_camera_space(vertices, rotation, translation)
+
+def _projection(case):
+    camera_intrinsics = make_intrinsics(case["focal_length"], case["image_width"], case["image_height"])
+    return project_to_image(_camera_space(case), camera_intrinsics)
+
+def _render(case):
+    rotation, translation = _camera(case)
+    camera_intrinsics = make_intrinsics(case["focal_length"], case["image_width"], case["image_height"])
+    model = load_cached_model(case["model"])
+    return render_wireframe(model, rotation, translation, camera_intrinsics, case["image_width"], case["image_height"])
+
+def _write_reference(reference_file, kind, actual):
+    directory = os.path.dirname(reference_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if kind == "render":
+        cv2.imwrite(reference_file, actual)
+    else:
+        np.save(reference_file, np.array(actual, dtype=object) if kind == "projection" else actual)
+
+def _compare_points(expected, actual):
+    """
+    :return: tuple (matched, total) of vertices, where None only matches None.
+    """
+    matched = 0
+    for expected_point, actual_point in zip(expected, actual):
+        if expected_point is None or actual_point is None:
+            matched += expected_point is None and actual_point is None
+        elif np.isclose(expected_point, actual_point).all():
+            matched += 1
+    return matched, max(len(expected), len(actual))
+
+def diff_file_name(name):
+    """
+    :return: file name of the diff image of a case.
+    """
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") + ".png"
+
+def run_case(case, diff_dir=DIFF_DIR):
+    """
+    Run one case and compare it with its reference. A missing or empty reference is generated from the
+    current output, the same way the tester scripts do.
+    :param case: dictionary from the manifest.
+    :param diff_dir: directory for the diff images of failed render cases, or None to not write any.
+    :return: dictionary with the "name", the "status" ("passed", "failed", "generated" or "error"), a "message",
+      the "seconds" the case took and for render cases the "mismatched" pixel count, "bbox" and "diff_file".
+    """
+    started = time.perf_counter()
+    result = {"name": case["name"], "status": "passed", "message": ""}
+    try:
+        kind = case["kind"]
+        actual = {"camera_space": _camera_space, "projection": _projection, "render": _render}[kind](case)
+        reference_file = case["reference"]
+
+        if not os.path.exists(reference_file) or os.path.getsize(reference_file) == 0:
+            _write_reference(reference_file, kind, actual)
+            result.update(status="generated", message=f"reference {reference_file} written")
+        elif kind == "render":
+            expected = cv2.imread(reference_file)
+            difference = image_difference(expected, actual)
+            result.update(mismatched=difference["mismatched"], bbox=difference["bbox"])
+            if not difference["same_shape"]:
+                result.update(status="failed", message=f"shape {actual.shape} differs from the reference")
+            elif difference["mismatched"]:
+                result.update(status="failed", message=f"{difference['mismatched']} pixels differ within {difference['bbox']}")
+                if diff_dir is not None:
+                    diff_file = os.path.join(diff_dir, diff_file_name(case["name"]))
+                    os.makedirs(diff_dir, exist_ok=True)
+                    cv2.imwrite(diff_file, diff_image(expected, actual))
+                    result["diff_file"] = diff_file
+        elif kind == "projection":
+            matched, total = _compare_points(np.load(reference_file, allow_pickle=True), actual)
+            if matched != total:
+                result.update(status="failed", message=f"{matched} of {total} points matched")
+        else:
+            expected = np.load(reference_file)
+            matches = expected.shape == actual.shape and np.isclose(expected, actual).all()
+            if not matches:
+                result.update(status="failed", message="camera space points differ from the reference")
+    except Exception as error:
+        result.update(status="error", message=f"{type(error).__name__}: {error}")
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def run_cases(cases, workers=None, diff_dir=DIFF_DIR):
+    """
+    Run cases on a pool of worker processes.
+    :param cases: list of case dictionaries, e.g. from load_manifest.
+    :param workers: number of processes, defaults to the number of CPUs. 1 runs the cases in this process.
+    :param diff_dir: directory for the diff images of failed render cases, or None to not write any.
+    :return: list of results from run_case in the order of the cases.
+    """
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(cases) <= 1:
+        return [run_case(case, diff_dir) for case in cases]
+
+    with ProcessPoolExecutor(min(workers, len(cases))) as executor:
+        chunk_size = max(1, len(cases) // (4 * workers))
+        return list(executor.map(run_case, cases, [diff_dir] * len(cases), chunksize=chunk_size))
+
+
+if __name__ == "__main__":
+    # e.g. python regression_runner.py -k Stress
+    parser = argparse.ArgumentParser(description="Run the rendering regression cases of a manifest in parallel.")
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--workers", type=int, help="number of worker processes, defaults to the number of CPUs")
+    parser.add_argument("--diff-dir", default=DIFF_DIR, help="directory for the diff images of failed render cases")
+    parser.add_argument("-k", dest="keyword", help="only run the cases whose name contains this text")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cases = load_manifest(args.manifest)
+    if args.keyword:
+        cases = [case for case in cases if args.keyword.lower() in case["name"].lower()]
+
+    results = run_cases(cases, args.workers, args.diff_dir)
+    for result in results:
+        message = f", {result['message']}" if result["message"] else ""
+        print(f"Test '{result['name']}' {result['status']}{message}")
+
+    counts = {status: sum(result["status"] == status for result in results) for status in ("passed", "failed", "error", "generated")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()) + f" in {time.perf_counter() - started:.2f}s")
+    if counts["failed"] or counts["error"]:
+        sys.exit(1)
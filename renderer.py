@@ -0,0 +1,154 @@
+import numpy as np
+from rendering import GUARD_BAND, NEAR_PLANE, convert_model_to_camera_space, clip_edges, project_points, draw_segments, blank_image
+
+
+class BufferPool:
+    """
+    Named arrays that are reused from frame to frame. An array is only reallocated when the shape or dtype
+    asked for changes, so a renderer in a steady state does not allocate any per frame buffers.
+    """
+
+    def __init__(self):
+        self.allocations = 0
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.float64):
+        """
+        :param name: name of the buffer.
+        :param shape: shape the buffer needs.
+        :param dtype: dtype the buffer needs.
+        :return: the buffer, with whatever contents it was last left with.
+        """
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer
+
+    def nbytes(self):
+        """
+        :return: total size of the pooled buffers in bytes.
+        """
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class WireframeRenderer:
+    """
+    Renders one model frame after frame, keeping the results of every pipeline stage between frames.
+
+    Changing the camera only redoes the stages that depend on what changed: a new pose redoes everything,
+    new intrinsics keep the camera space vertices and only clip, project and draw again, and rendering
+    without any change returns the previous frame as is. Every stage writes into buffers from a BufferPool.
+    """
+
+    def __init__(self, model, rotation, translation, camera_intrinsics, image_width, image_height, near_plane=NEAR_PLANE):
+        """
+        :param model: Dictionary or model_loader.Model representing the model to render, see rendering.render_wireframe.
+        :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+        :param translation: 3-element numpy array representing the position of the camera within world space.
+        :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+        :param image_width: width of the image in pixels
+        :param image_height: height of the image in pixels
+        :param near_plane: distance in front of the camera where edges get clipped.
+        :raises ValueError: when an edge refers to a vertex the model does not have.
+        """
+        self.vertices = np.ascontiguousarray(model["vertices"], dtype=np.float64).reshape(-1, 3)
+        self.edges = np.ascontiguousarray(model["edges"], dtype=np.int64).reshape(-1, 2)
+        # Checked once here so the per frame gathers can skip the bounds checks
+        if len(self.edges) and (self.edges.min() < 0 or self.edges.max() >= len(self.vertices)):
+            raise ValueError(f"edge indices must be between 0 and {len(self.vertices) - 1}")
+        self.near_plane = near_plane
+        self.buffers = BufferPool()
+        self.frame = None
+
+        self._camera_space = None
+        self._points = None
+        self._frame_valid = False
+
+        self.set_pose(rotation, translation)
+        self.set_intrinsics(camera_intrinsics, image_width, image_height)
+
+    def set_pose(self, rotation, translation):
+        """
+        Move the camera. Everything is recomputed on the next render.
+        :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+        :param translation: 3-element numpy array representing the position of the camera within world space.
+        """
+        self.rotation = np.array(rotation, dtype=np.float64)
+        self.translation = np.array(translation, dtype=np.float64)
+        self._camera_space = None
+        self._points = None
+
+    def set_intrinsics(self, camera_intrinsics, image_width=None, image_height=None):
+        """
+        Change the camera intrinsics and optionally the image size. The camera space vertices are kept.
+        :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+        :param image_width: new width of the image in pixels, or None to keep the current one.
+        :param image_height: new height of the image in pixels, or None to keep the current one.
+        """
+        self.camera_intrinsics = np.array(camera_intrinsics, dtype=np.float64)
+        if image_width is not None:
+            self.image_width = image_width
+        if image_height is not None:
+            self.image_height = image_height
+        self._points = None
+
+    def render(self):
+        """
+        Render the current view, running only the stages whose inputs changed since the last frame.
+        :return: The wireframe image. The same array is drawn into by every render, copy it to keep a frame.
+        """
+        if self._camera_space is None:
+            buffer = self.buffers.get("camera_space", self.vertices.shape)
+            self._camera_space = convert_model_to_camera_space(self.vertices, self.rotation, self.translation, out=buffer)
+
+        if self._points is None:
+            self._points = self._project_edges()
+            self._frame_valid = False
+
+        if not self._frame_valid:
+            buffer = self.buffers.get("frame", (self.image_height, self.image_width, 3), np.uint8)
+            self.frame = blank_image(self.image_width, self.image_height, out=buffer)
+            draw_segments(self.frame, self._points)
+            self._frame_valid = True
+
+        return self.frame
+
+    def _project_edges(self):
+        """
+        The pixel endpoints are written into pooled buffers on both paths. When edges need clipping, the
+        temporaries clip_edges computes along the way are still allocated every frame.
+        :return: (E', 2, 2) int32 array with the pixel endpoints of every edge that needs drawing.
+        """
+        vertex_count, edge_count = len(self.vertices), len(self.edges)
+
+        # With nothing behind the near plane there is nothing to clip, so the vertices are projected once
+        # and gathered into edges. OpenCV clips the lines that fall outside the image itself. Points past the
+        # guard band do not fit in int32, so those frames are clipped like the ones crossing the near plane.
+        if self._camera_space[:, 2].min(initial=np.inf) >= self.near_plane:
+            out = (self.buffers.get("points", (vertex_count, 2), np.int32), self.buffers.get("in_front", (vertex_count,), bool))
+            work = self.buffers.get("projected", (vertex_count, 3))
+            with np.errstate(invalid="ignore"):
+                points, _ = project_points(self._camera_space, self.camera_intrinsics, out=out, work=work)
+            image_plane = work[:, :2]
+            if vertex_count == 0 or (
+                image_plane.min() >= -GUARD_BAND and image_plane[:, 0].max() <= self.image_width + GUARD_BAND
+                and image_plane[:, 1].max() <= self.image_height + GUARD_BAND
+            ):
+                segments = self.buffers.get("segments_2d", (edge_count, 2, 2), np.int32)
+                return np.take(points, self.edges, axis=0, out=segments, mode="clip")
+
+        segments, visible = clip_edges(
+            self._camera_space, self.edges, self.camera_intrinsics, self.image_width, self.image_height, self.near_plane,
+            out=self.buffers.get("segments", (edge_count, 2, 3))
+        )
+
+        # Every segment is projected into the pooled buffers, then the visible ones are packed to the front.
+        # Culled segments may lie anywhere and wrap around in int32, but they are never drawn.
+        out = (self.buffers.get("clipped_points", (2 * edge_count, 2), np.int32), self.buffers.get("clipped_in_front", (2 * edge_count,), bool))
+        work = self.buffers.get("clipped_projected", (2 * edge_count, 3))
+        with np.errstate(invalid="ignore"):
+            points, _ = project_points(segments.reshape(-1, 3), self.camera_intrinsics, out=out, work=work)
+        packed = self.buffers.get("segments_2d", (edge_count, 2, 2), np.int32)[:np.count_nonzero(visible)]
+        return np.compress(visible, points.reshape(edge_count, 2, 2), axis=0, out=packed)
@@ -1,83 +1,308 @@
-import json
 import numpy as np
 import cv2
-from math import pi
-from rendering_helpers import yp_mat, clamp_pitch, make_intrinsics
+from time import perf_counter
+from rendering_helpers import QUIT_KEYS, yp_mat, camera_key_step, make_intrinsics, frustum_planes, world_to_camera_matrix
+from model_loader import load_model
+from rasterizer import clip_segments, draw_segments_antialiased, draw_segments_tiled, draw_segments_depth, rasterize_depth
+from lod import LOD_PIXEL_ERROR, select_lod, select_lod_edges
+from edge_grid import frustum_edges
 
+NEAR_PLANE = 0.01
+# Pixels around the image that clipped edges may reach, far enough that the cut barely moves the visible part
+# of a line and close enough that the pixel coordinates fit in int32 even in the fixed point of antialiasing
+GUARD_BAND = 1 << 22
 
-def convert_model_to_camera_space(vertices, camera_rotation, camera_translation):
+
+def transform_points(vertices, transform, out=None, dtype=np.float64):
+    """
+    Apply a precomposed affine transform to a set of points with one matmul and one add.
+    :param vertices: (N, 3) array of points.
+    :param transform: (4, 4) or (3, 4) matrix acting on column vectors, e.g. from
+      rendering_helpers.world_to_camera_matrix, or (..., 4, 4) to transform the points once per matrix.
+    :param out: optional preallocated (..., N, 3) array of the given dtype to write the result into.
+    :param dtype: float64, or float32 to halve the memory traffic when the points are float32 already.
+    :return: (..., N, 3) array of the transformed points.
+    """
+    transform = np.asarray(transform, dtype=np.float64)
+    vertices = np.ascontiguousarray(vertices, dtype=dtype).reshape(-1, 3)
+
+    # Row vectors, so the points get multiplied by the transposed linear part and then moved by the offset
+    linear = np.swapaxes(transform[..., :3, :3], -1, -2).astype(dtype, copy=False)
+    offset = transform[..., None, :3, 3].astype(dtype, copy=False)
+    points = np.matmul(vertices, linear, out=out)
+    points += offset
+    return points
+
+def convert_model_to_camera_space(vertices, camera_rotation, camera_translation, out=None, stats=None):
     """
     Rotates and moves the model to move it into camera space.
     :param vertices: a list of 3D points formatted as 3-element lists
     :param camera_rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
     :param camera_translation: 3-element numpy array representing the position of the camera within world space.
+    :param out: optional preallocated (N, 3) float64 array to write the result into.
+    :param stats: optional callable receiving the stage timing, e.g. a profiling.FrameStats or RenderProfiler.
     :return: a list the same size as vertices where the points are given relative to the camera's coordinate system
     """
-    # Transform vertices from world to camera space
-    vertices = np.array(vertices)
-    vertices = vertices - camera_translation  # First translate
-    vertices = np.dot(camera_rotation.T, vertices.T).T  # Then rotate with transpose
-    
-    return vertices
+    started = perf_counter() if stats is not None else 0
+
+    # (V - t) @ R is computed as V @ R - t @ R so the result goes straight into out without a translated copy
+    points = transform_points(vertices, world_to_camera_matrix(camera_rotation, camera_translation), out=out)
 
-def project_to_image(vertices_camera_space, camera_intrinsics):
+    if stats is not None:
+        stats("camera_space", perf_counter() - started, vertices=len(points), allocated_bytes=0 if out is not None else points.nbytes)
+    return points
+
+def project_points(vertices_camera_space, camera_intrinsics, out=None, work=None, stats=None, dtype=np.int32):
+    """
+    Project the vertices within camera space onto the image plane in a single batched operation.
+    :param vertices_camera_space: (..., N, 3) array of 3D points indicating the vertices locations within camera space.
+    :param camera_intrinsics: Camera matrix defined by focal length and centroid, either 3x3 or (..., 3, 3) to use
+      a different camera per batch entry.
+    :param out: optional tuple (points, in_front) of preallocated arrays to write the results into.
+    :param work: optional preallocated (..., N, 3) float64 scratch array for the homogeneous image coordinates.
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
+    :param dtype: int32 to truncate the coordinates to whole pixels, or a float dtype to keep their subpixel
+      position, e.g. for drawing antialiased lines. Segments from clip_edges fit in int32, other points may
+      not and wrap around, so project them as floats, see project_to_image.
+    :return: A tuple (points, in_front). points is an (..., N, 2) array of pixel coordinates and in_front is an
+      (..., N) boolean mask that is False for vertices behind the camera. Masked out points are left at (0, 0).
+    """
+    started = perf_counter() if stats is not None else 0
+    allocated = (out is None, work is None)
+    vertices = np.asarray(vertices_camera_space, dtype=np.float64)
+    if vertices.ndim < 2:
+        vertices = vertices.reshape(-1, 3)
+    points, in_front = out if out is not None else (None, None)
+    in_front = np.greater(vertices[..., 2], 0, out=in_front)
+
+    # One matmul for every vertex, then the perspective divide for the ones in front of the camera
+    projected = np.matmul(vertices, np.swapaxes(camera_intrinsics, -1, -2), out=work)
+    image_plane, depth = projected[..., :2], projected[..., 2:]
+    np.divide(image_plane, depth, out=image_plane, where=in_front[..., None])
+    np.multiply(image_plane, in_front[..., None], out=image_plane)
+
+    if points is None:
+        points = np.empty(vertices.shape[:-1] + (2,), dtype=dtype)
+    np.copyto(points, image_plane, casting="unsafe")
+
+    if stats is not None:
+        stats(
+            "project", perf_counter() - started, vertices=in_front.size, behind=int(in_front.size - np.count_nonzero(in_front)),
+            allocated_bytes=allocated[0] * (points.nbytes + in_front.nbytes) + allocated[1] * projected.nbytes,
+        )
+    return points, in_front
+
+def clip_edges(
+    vertices_camera_space, edges, camera_intrinsics, image_width, image_height, near=NEAR_PLANE, far=None, out=None, stats=None
+):
+    """
+    Clip the edges of a model in camera space before projecting them.
+    Edges with both ends outside the same frustum plane are culled, and edges crossing the near plane are cut
+    where they cross it, so the part in front of the camera is still drawn. Edges reaching further than
+    GUARD_BAND pixels beside the image are cut there, so every segment projects to int32 pixel coordinates.
+    :param vertices_camera_space: (..., N, 3) array of vertices within camera space.
+    :param edges: (E, 2) integer array of pairs of indices into the vertices.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics, or (..., 3, 3) with one
+      camera per batch entry of the vertices.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near: distance of the near plane, every drawn point ends up at least this far in front of the camera.
+    :param far: distance of the far plane, or None for no far plane.
+    :param out: optional preallocated (..., E, 2, 3) float64 array for the segments.
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
+    :return: A tuple (segments, visible). segments is an (..., E, 2, 3) array of edge endpoints in camera space
+      and visible is an (..., E) boolean mask of the edges that survived culling.
+    """
+    started = perf_counter() if stats is not None else 0
+    vertices_camera_space = np.asarray(vertices_camera_space, dtype=np.float64)
+    if out is None:
+        segments = vertices_camera_space[..., edges, :]
+    else:
+        segments = out
+        np.take(vertices_camera_space, edges, axis=-2, out=segments)
+
+    # Cull the edges that lie completely on the outer side of any one plane
+    planes = frustum_planes(camera_intrinsics, image_width, image_height, near, far)
+    endpoints = segments.reshape(segments.shape[:-3] + (-1, 3))
+    distances = endpoints @ np.swapaxes(planes[..., :3], -1, -2) + planes[..., None, :, 3]
+    distances = distances.reshape(segments.shape[:-1] + (planes.shape[-2],))
+    visible = ~(distances < 0).all(axis=-2).any(axis=-1)
+
+    # The surviving edges have at most one end behind the near plane, move it onto the plane
+    depth = segments[..., 2]
+    behind = (depth < near) & visible[..., None]
+    crossing = behind.any(axis=-1)
+    start, end = segments[..., 0, :], segments[..., 1, :]
+    t = np.zeros(depth.shape[:-1])
+    np.divide(near - depth[..., 0], depth[..., 1] - depth[..., 0], out=t, where=crossing)
+    cut = start + t[..., None] * (end - start)
+    cut[..., 2] = near
+    segments[..., 0, :] = np.where(behind[..., 0, None], cut, start)
+    segments[..., 1, :] = np.where(behind[..., 1, None], cut, end)
+
+    # Cut the edges leaving the guard band at its sides. The side planes go through the camera, so the cut
+    # points project onto the projected lines and the pixels inside the image stay the same.
+    guard = frustum_planes(camera_intrinsics, image_width, image_height, near, margin=GUARD_BAND)[..., :4, :]
+    endpoints = segments.reshape(segments.shape[:-3] + (-1, 3))
+    distances = endpoints @ np.swapaxes(guard[..., :3], -1, -2) + guard[..., None, :, 3]
+    distances = distances.reshape(segments.shape[:-1] + (4,))
+    leaving = visible & (distances < 0).any(axis=(-2, -1))
+    if leaving.any():
+        start_distances, end_distances = distances[..., 0, :], distances[..., 1, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = start_distances / (start_distances - end_distances)
+        t_enter = np.where((start_distances < 0) & (end_distances >= 0), t, 0).max(axis=-1)
+        t_exit = np.where((end_distances < 0) & (start_distances >= 0), t, 1).min(axis=-1)
+        visible &= ~leaving | ((t_enter <= t_exit) & ~((start_distances < 0) & (end_distances < 0)).any(axis=-1))
+        start, direction = segments[..., 0, :].copy(), segments[..., 1, :] - segments[..., 0, :]
+        segments[..., 0, :] = np.where(leaving[..., None], start + t_enter[..., None] * direction, start)
+        segments[..., 1, :] = np.where(leaving[..., None], start + t_exit[..., None] * direction, segments[..., 1, :])
+
+    if stats is not None:
+        stats(
+            "clip", perf_counter() - started, edges=visible.size, culled=int(visible.size - np.count_nonzero(visible)),
+            near_clipped=int(np.count_nonzero(crossing)), guard_clipped=int(np.count_nonzero(leaving)),
+            allocated_bytes=0 if out is not None else segments.nbytes,
+        )
+    return segments, visible
+
+def project_to_image(vertices_camera_space, camera_intrinsics, stats=None, subpixel=False):
     """
     Project down the vertices within camera space into 2D pixel locations on the infinite image plane.
     Be sure to convert any points behind the camera to None.
     :param vertices_camera_space: List of 3D points indicating the vertices locations within camera space.
     :param camera_intrinsics: Camera matrix defined by focal length and centroid
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
+    :param subpixel: return float coordinates instead of truncating them to whole pixels.
     :return: A list of 2D points representing the pixel coordinates of projected vertices. If a vertex is behind the camera, it is replaced with None.
     """
+    # Truncate to Python ints at the end, points just in front of the camera project far beyond int32
+    points, in_front = project_points(vertices_camera_space, camera_intrinsics, stats=stats, dtype=np.float64)
+    if not subpixel:
+        return [(int(x), int(y)) if visible else None for (x, y), visible in zip(points.tolist(), in_front.tolist())]
+    return [tuple(point) if visible else None for point, visible in zip(points.tolist(), in_front.tolist())]
 
-    # Project vertices onto the image plane
-    projected_points = []
-    for vertex in vertices_camera_space:
-        if vertex[2] <= 0:  # Check if point is behind camera
-            projected_points.append(None)
-            continue
-    
-        projected = camera_intrinsics @ vertex
-        x, y = projected[:2] / projected[2]  # Normalize by depth
-        projected_points.append((int(x), int(y)))
-    
-
-# code for debugging
-    # debugged code 2
-    # print("\nCamera Intrinsics Matrix:")
-    # print(camera_intrinsics)
-    
-    # projected_points = []
-    # for i, vertex in enumerate(vertices_camera_space):
-    #     print(f"\nVertex {i}:")
-    #     print(f"Camera space coordinates: {vertex}")
-        
-    #     if vertex[2] <= 0:
-    #         print(f"Point {i} is behind camera")
-    #         projected_points.append(None)
-    #         continue
-
-    #     # Try the calculation step by step
-    #     x, y, z = vertex
-        
-    #     # Step 1: Perspective division
-    #     x_normalized = x/z
-    #     y_normalized = y/z
-    #     homo_coords = np.array([x_normalized, y_normalized, 1.0])
-    #     print(f"After perspective division: {homo_coords}")
-        
-    #     # Step 2: Apply camera intrinsics
-    #     projected = np.dot(camera_intrinsics, homo_coords)
-    #     print(f"After camera intrinsics: {projected}")
-        
-    #     projected_points.append(projected[:2])
-
-    #     expected_points = np.load("tests/proj_rotation.npy", allow_pickle=True)
-    #     print("Expected points from file:")
-    #     print(expected_points)
-
-    return projected_points
-
-def render_image(image_space_vertices, edges, image_width, image_height):
+def draw_edges(image, points, in_front, edges, stats=None):
+    """
+    Draws white wireframe edges into an existing image.
+
+    :param image: (H, W, 3) uint8 array that is drawn into in place.
+    :param points: (N, 2) int32 array of projected vertices, as returned by project_points.
+    :param in_front: (N,) boolean mask of the vertices that are in front of the camera.
+    :param edges: (E, 2) integer array of pairs of indices into points.
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
+    :return: The image that was passed in.
+    """
+    # Only edges with both ends in front of the camera get drawn
+    visible = in_front[edges[:, 0]] & in_front[edges[:, 1]]
+    return draw_segments(image, points[edges[visible]], stats=stats)
+
+def draw_segments(image, segments, tile_size=None, stats=None, antialiased=False):
+    """
+    Draws white line segments into an existing image.
+
+    :param image: (H, W, 3) uint8 array that is drawn into in place.
+    :param segments: (E, 2, 2) integer array holding the two pixel endpoints of every segment, or a float
+      array of subpixel endpoints when antialiased.
+    :param tile_size: draw the image in square tiles of this size on a thread pool, see
+      rasterizer.draw_segments_tiled. The pixels are the same, it pays off for very large images.
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
+    :param antialiased: draw smooth lines at the subpixel positions of the endpoints, see
+      rasterizer.draw_segments_antialiased. tile_size is ignored.
+    :return: The image that was passed in.
+    """
+    started = perf_counter() if stats is not None else 0
+
+    if antialiased:
+        draw_segments_antialiased(image, segments)
+    elif tile_size is not None:
+        draw_segments_tiled(image, segments, tile_size)
+    else:
+        segments = np.ascontiguousarray(segments, dtype=np.int32)
+
+        # Every segment is a two point polyline, so one call draws them all with the same pixels as cv2.line
+        if len(segments):
+            cv2.polylines(image, segments, False, (255, 255, 255), 1)
+
+    if stats is not None:
+        stats("draw", perf_counter() - started, segments=len(segments))
+    return image
+
+def render_depth_buffer(vertices_camera_space, faces, camera_intrinsics, image_width, image_height, near=NEAR_PLANE, out=None):
+    """
+    Fill a depth buffer with the faces of a model, for drawing its edges with hidden lines removed.
+    Faces crossing the near plane are cut along it into one or two triangles in front of it, so a face
+    reaching behind the camera still hides what lies behind its visible part.
+    :param vertices_camera_space: (N, 3) array of vertices within camera space.
+    :param faces: (F, 3) integer array of triangles as triples of indices into the vertices.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near: distance of the near plane.
+    :param out: optional preallocated (image_height, image_width) float32 array to fill.
+    :return: (image_height, image_width) float32 array with the depth of the nearest face at every pixel, np.inf where there is none.
+    """
+    if out is None:
+        out = np.empty((image_height, image_width), dtype=np.float32)
+    out.fill(np.inf)
+
+    corners = np.asarray(vertices_camera_space, dtype=np.float64)[np.asarray(faces, dtype=np.int64).reshape(-1, 3)]
+    corners = np.concatenate([corners[(corners[..., 2] >= near).all(axis=1)], clip_faces_near(corners, near)])
+
+    # Truncate like the line pixels, the cut corners project far beyond int32
+    points, _ = project_points(corners.reshape(-1, 3), camera_intrinsics, dtype=np.float64)
+    return rasterize_depth(out, np.trunc(points).reshape(-1, 3, 2), corners[..., 2])
+
+def clip_faces_near(corners, near=NEAR_PLANE):
+    """
+    Cut the triangles crossing the near plane along it, keeping the part in front of it.
+    A triangle with one corner behind the plane leaves a quadrilateral, split in two triangles, and one
+    with two corners behind leaves a single triangle. Triangles entirely on one side are not returned.
+    :param corners: (F, 3, 3) array of the camera space corners of every triangle.
+    :param near: distance of the near plane.
+    :return: (F', 3, 3) float64 array of the triangles cut from the crossing ones.
+    """
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 3, 3)
+    behind = corners[..., 2] < near
+    count = behind.sum(axis=1)
+
+    def cut(inside, outside):
+        # Point where the side from a corner in front of the plane to one behind it crosses the plane
+        t = (near - inside[:, 2]) / (outside[:, 2] - inside[:, 2])
+        point = inside + t[:, None] * (outside - inside)
+        point[:, 2] = near
+        return point
+
+    def rolled(selected, odd_corner):
+        # Corners of the selected triangles, starting from the one on its own side of the plane
+        order = (np.argmax(odd_corner[selected], axis=1)[:, None] + np.arange(3)) % 3
+        return np.take_along_axis(corners[selected], order[..., None], axis=1).transpose(1, 0, 2)
+
+    # One corner behind: it is cut off along both of its sides, leaving the quadrilateral b, c, q, p
+    a, b, c = rolled(count == 1, behind)
+    p, q = cut(b, a), cut(c, a)
+    quads = [np.stack([p, b, c], axis=1), np.stack([p, c, q], axis=1)]
+
+    # Two corners behind: the one in front keeps the tip of the triangle
+    a, b, c = rolled(count == 2, ~behind)
+    tips = np.stack([a, cut(a, b), cut(a, c)], axis=1)
+
+    return np.concatenate(quads + [tips])
+
+def blank_image(image_width, image_height, out=None):
+    """
+    A black image to draw a wireframe into.
+    :param image_width: Width of the image in pixels.
+    :param image_height: Height of the image in pixels.
+    :param out: optional preallocated (image_height, image_width, 3) uint8 array that is cleared and returned.
+    :return: An (image_height, image_width, 3) uint8 array of zeros.
+    """
+    if out is None:
+        return np.zeros((image_height, image_width, 3), dtype=np.uint8)
+    out.fill(0)
+    return out
+
+def render_image(image_space_vertices, edges, image_width, image_height, out=None, stats=None):
     """
     Renders a wireframe model onto a blank image using given 2D projected vertices and edges.
 
@@ -86,54 +311,158 @@ def render_image(image_space_vertices, edges, image_width, image_height):
     :param edges: List of pairs of indices indicating the connections between vertices.
     :param image_width: Width of the output image in pixels.
     :param image_height: Height of the output image in pixels.
+    :param out: optional preallocated (image_height, image_width, 3) uint8 array to clear and draw into.
+    :param stats: optional callable receiving the stage timing, see convert_model_to_camera_space.
     :return: A NumPy array representing the rendered wireframe image with a black background and white lines.
     """
-    # Initialize a blank image
-    image = np.zeros((image_height, image_width, 3), dtype=np.uint8)
+    in_front = np.array([point is not None for point in image_space_vertices], dtype=bool)
+    points = np.zeros((len(image_space_vertices), 2), dtype=np.int64)
+    for i in np.flatnonzero(in_front):
+        point = image_space_vertices[i]
+        points[i] = (int(point[0]), int(point[1]))
 
-    # Draw the edges
-    for edge in edges:
-        point1 = image_space_vertices[edge[0]]
-        point2 = image_space_vertices[edge[1]]
-        if point1 is not None and point2 is not None:
-            point1 = (int(point1[0]), int(point1[1]))
-            point2 = (int(point2[0]), int(point2[1]))
-            cv2.line(image, point1, point2, (255, 255, 255), 1)
+    # Initialize a blank image
+    image = blank_image(image_width, image_height, out)
 
-    return image
+    # Draw the edges. Points just in front of the camera can land beyond the int32 coordinates OpenCV
+    # draws with, so those lines are cut to the image first the way OpenCV cuts them.
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    if np.abs(points).max(initial=0) > np.iinfo(np.int32).max:
+        visible = in_front[edges[:, 0]] & in_front[edges[:, 1]]
+        segments = clip_segments(points[edges[visible]], image_width, image_height).reshape(-1, 2, 2)
+        return draw_segments(image, segments, stats=stats)
+    return draw_edges(image, points, in_front, edges, stats)
 
 def render_wireframe(
     model,
     rotation, translation,
     camera_intrinsics,
     image_width, image_height,
+    near_plane=NEAR_PLANE,
+    out=None,
+    tile_size=None,
+    lod_pixel_error=LOD_PIXEL_ERROR,
+    stats=None,
+    hidden_lines=False,
+    antialiased=False,
 ):
     """
     Render a white wireframe model on a black background using given camera parameters.
 
-    :param model: Dictionary representing the model to render. There are two entries:
+    :param model: Dictionary or model_loader.Model representing the model to render. There are two entries:
       - "vertices" as a list of 3D points formatted as 3-element lists
       - "edges" as a list of pairs of indices into the "vertices" list
+      With the arrays of edge_grid.build_edge_grid, only the edges the grid finds in the view are clipped
+      and projected, unless a coarser level of detail is drawn.
     :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
       Multiplying a point by this matrix converts from camera space to world space.
     :param translation: 3-element numpy array representing the position of the camera within world space.
     :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics using the pinhole camera model.
     :param image_width: width of the image in pixels
     :param image_height: height of the image in pixels
+    :param near_plane: distance in front of the camera where edges get clipped.
+    :param out: optional preallocated (image_height, image_width, 3) uint8 array to render into.
+    :param tile_size: optional tile size for drawing large images on multiple threads, see draw_segments.
+    :param lod_pixel_error: for models compiled with levels of detail, how many pixels the simplified edges may
+      stray from the full model, see lod.select_lod. None always draws the full model.
+    :param stats: optional callable receiving the time and counts of every stage and of the whole "frame",
+      e.g. a profiling.FrameStats or RenderProfiler. Without it nothing is measured.
+    :param hidden_lines: leave out the parts of the edges hidden behind the faces of the model, given as a
+      "faces" array of vertex index triples. Without faces nothing is hidden. tile_size is ignored.
+    :param antialiased: project without truncating to whole pixels and draw antialiased lines, which looks
+      about as smooth as rendering at several times the size and downscaling. The default aliased lines are
+      the reference for the tests. tile_size is ignored. Cannot be combined with hidden_lines.
     :return: A wireframe image of the wireframe model as viewed from the specified camera in the format of a numpy array.
+    :raises ValueError: when both hidden_lines and antialiased are set.
     """
+    if hidden_lines and antialiased:
+        raise ValueError("antialiased lines cannot be drawn with hidden_lines")
+    started = perf_counter() if stats is not None else 0
 
-    vertices = np.array(model["vertices"])
-    edges = model["edges"]
+    vertices = np.asarray(model["vertices"])
+    full_detail = lod_pixel_error is None or select_lod(model, rotation, translation, camera_intrinsics, lod_pixel_error) == 0
+    if "grid_codes" in model and full_detail:
+        # The grid indexes the full model, so it only narrows down the edges when no coarser level is drawn
+        in_view = frustum_edges(model, rotation, translation, camera_intrinsics, image_width, image_height, near_plane)
+        edges = np.asarray(model["edges"])[in_view]
+    else:
+        edges = select_lod_edges(model, rotation, translation, camera_intrinsics, lod_pixel_error)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
 
     # Step 1: Convert from world space to camera space
-    vertices_camera_space = convert_model_to_camera_space(vertices, rotation, translation)
+    vertices_camera_space = convert_model_to_camera_space(vertices, rotation, translation, stats=stats)
+
+    # Step 2: Clip the edges to the part of them the camera can see
+    segments, visible = clip_edges(
+        vertices_camera_space, edges, camera_intrinsics, image_width, image_height, near_plane, stats=stats
+    )
+
+    # Step 3: Compress to the image plane, keeping the subpixel positions for antialiased lines
+    points_2d, _ = project_points(
+        segments[visible], camera_intrinsics, stats=stats, dtype=np.float64 if antialiased else np.int32
+    )
 
-    # Step 2: Compress to the image plane
-    points_2d = project_to_image(vertices_camera_space, camera_intrinsics)
+    # Step 4: Color the pixels
+    image = blank_image(image_width, image_height, out)
+    if hidden_lines:
+        # The depth buffer is filled as part of drawing, so it is timed with it
+        draw_started = perf_counter() if stats is not None else 0
+        faces = model["faces"] if "faces" in model else np.zeros((0, 3), dtype=np.int64)
+        depth_buffer = render_depth_buffer(vertices_camera_space, faces, camera_intrinsics, image_width, image_height, near_plane)
+        draw_segments_depth(image, points_2d, segments[visible][..., 2], depth_buffer)
+        if stats is not None:
+            stats("draw", perf_counter() - draw_started, segments=len(points_2d), faces=len(faces))
+    else:
+        draw_segments(image, points_2d, tile_size, stats, antialiased)
 
-    # Step 3: Color the pixels
-    return render_image(points_2d, edges, image_width, image_height)
+    if stats is not None:
+        stats(
+            "frame", perf_counter() - started, vertices=len(vertices), edges=len(edges),
+            model_edges=len(model["edges"]), drawn=len(points_2d),
+        )
+    return image
+
+def render_wireframe_batch(
+    model,
+    rotations, translations,
+    camera_intrinsics,
+    image_width, image_height,
+    near_plane=NEAR_PLANE,
+):
+    """
+    Render the same wireframe model from many camera poses at once. All poses are transformed and projected
+    in a single pass, so the per-pose cost is only the rasterization.
+
+    :param model: Dictionary representing the model to render, see render_wireframe.
+    :param rotations: (B, 3, 3) numpy array of camera rotation matrices within world space.
+    :param translations: (B, 3) numpy array of camera positions within world space.
+    :param camera_intrinsics: 3x3 numpy array shared by every pose, or (B, 3, 3) for one camera per pose.
+    :param image_width: width of each image in pixels
+    :param image_height: height of each image in pixels
+    :param near_plane: distance in front of the camera where edges get clipped.
+    :return: A (B, image_height, image_width, 3) uint8 numpy array with one wireframe image per pose.
+    """
+    vertices = np.asarray(model["vertices"], dtype=np.float64).reshape(-1, 3)
+    edges = np.asarray(model["edges"], dtype=np.int64).reshape(-1, 2)
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+
+    # Step 1: One precomposed world to camera matrix per pose, applied to the shared vertices in a single matmul
+    vertices_camera_space = transform_points(vertices, world_to_camera_matrix(rotations, translations))
+
+    # Step 2: Clip the edges of every pose
+    segments, visible = clip_edges(vertices_camera_space, edges, camera_intrinsics, image_width, image_height, near_plane)
+
+    # Step 3: Project every pose in one go
+    points_2d, _ = project_points(segments.reshape(len(rotations), -1, 3), camera_intrinsics)
+    points_2d = points_2d.reshape(segments.shape[:-1] + (2,))
+
+    # Step 4: Color the pixels of each frame
+    images = np.zeros((len(rotations), image_height, image_width, 3), dtype=np.uint8)
+    for image, frame_points, frame_visible in zip(images, points_2d, visible):
+        draw_segments(image, frame_points[frame_visible])
+
+    return images
 
 
 ## Show a render
@@ -149,27 +478,27 @@ if __name__ == "__main__":
     # model_file = "models/cube.json"
     model_file = "models/square.json"
 
-    # Settings
-    TRANSLATION_STEP_SIZE = 0.2
-    ROTATION_STEP_SIZE = pi / 18
-    FOCAL_FACTOR = 1.1
-
     # Initalize dependent values
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
-
-    # Render the image
-    image = render_wireframe(
-        model=model,
-        rotation=rotation,
-        translation=translation,
-        camera_intrinsics=camera_intrinsics,
-        image_width=image_width,
-        image_height=image_height
-    )
-    cv2.imshow("Wireframe", image)
-    
-    # Show the image until a key is pressed
-    keypress = cv2.waitKey()
+    model = load_model(model_file)
+
+    # The renderer keeps its buffers between frames and only redoes what a keypress invalidated
+    from renderer import WireframeRenderer
+    renderer = WireframeRenderer(model, rotation, translation, camera_intrinsics, image_width, image_height)
+
+    # Render until q or escape is pressed, the keys are shared with viewer.py
+    key = None
+    while key not in QUIT_KEYS:
+        cv2.imshow("Wireframe", renderer.render())
+        key = chr(cv2.waitKey() & 0xFF)
+
+        step = camera_key_step(key, yaw, pitch, translation, focal_length)
+        if step is None:
+            continue
+        if step[3] != focal_length:
+            focal_length = step[3]
+            renderer.set_intrinsics(make_intrinsics(focal_length, image_width, image_height))
+        else:
+            yaw, pitch, translation = step[:3]
+            renderer.set_pose(yp_mat(yaw, pitch), translation)
@@ -1,8 +1,29 @@
+import os
+from functools import lru_cache
 from math import cos, sin, pi
 
 import cv2
 import numpy as np
 
+# A power of two, so the multiples of it the cached angles are rounded to are exact floats
+ANGLE_QUANTUM = 2.0 ** -32
+ROTATION_CACHE_SIZE = 4096
+
+# Camera steps of the interactive viewers, rendering.py and viewer.py
+TRANSLATION_STEP_SIZE = 0.2
+ROTATION_STEP_SIZE = pi / 18
+FOCAL_FACTOR = 1.1
+
+# Camera space moves for w/s (forward, back), a/d (left, right) and r/f (up, down)
+KEY_MOVES = {"w": (0, 0, 1), "s": (0, 0, -1), "a": (-1, 0, 0), "d": (1, 0, 0), "r": (0, 1, 0), "f": (0, -1, 0)}
+# Yaw and pitch changes for j/l and i/k
+KEY_TURNS = {"j": (-1, 0), "l": (1, 0), "i": (0, 1), "k": (0, -1)}
+# Focal length changes for +/= (zoom in) and - (zoom out)
+ZOOM_IN_KEYS = ("+", "=")
+ZOOM_OUT_KEYS = ("-",)
+QUIT_KEYS = ("q", "\x1b")
+
+
 def yp_mat(yaw, pitch):
     yaw_mat = np.array([[cos(yaw), 0, sin(yaw)],
                         [0, 1, 0],
@@ -12,21 +33,249 @@ def yp_mat(yaw, pitch):
                           [0, sin(pitch), cos(pitch)]])
     return yaw_mat @ pitch_mat
 
+def yp_mat_batch(yaws, pitches):
+    """
+    Vectorized yp_mat, building every rotation in one pass with the same values as yp_mat.
+    :param yaws: yaw angles in radians, any shape that broadcasts with pitches.
+    :param pitches: pitch angles in radians.
+    :return: (..., 3, 3) array of rotation matrices.
+    """
+    yaws, pitches = np.broadcast_arrays(np.asarray(yaws, dtype=np.float64), np.asarray(pitches, dtype=np.float64))
+    cos_yaw, sin_yaw = np.cos(yaws), np.sin(yaws)
+    cos_pitch, sin_pitch = np.cos(pitches), np.sin(pitches)
+
+    # The product yaw_mat @ pitch_mat written out, every entry has a single non zero term
+    rotations = np.zeros(yaws.shape + (3, 3))
+    rotations[..., 0, 0] = cos_yaw
+    rotations[..., 0, 1] = sin_yaw * sin_pitch
+    rotations[..., 0, 2] = sin_yaw * cos_pitch
+    rotations[..., 1, 1] = cos_pitch
+    rotations[..., 1, 2] = -sin_pitch
+    rotations[..., 2, 0] = -sin_yaw
+    rotations[..., 2, 1] = cos_yaw * sin_pitch
+    rotations[..., 2, 2] = cos_yaw * cos_pitch
+    return rotations
+
+def yp_mat_cached(yaw, pitch, quantum=ANGLE_QUANTUM):
+    """
+    Memoized yp_mat for loops that keep coming back to the same angles, e.g. a viewer turning in fixed steps.
+    The angles are rounded to multiples of quantum first, so steps that add up to the same angle with
+    different rounding errors share an entry. The latest ROTATION_CACHE_SIZE rotations are kept.
+    :param yaw: yaw angle in radians.
+    :param pitch: pitch angle in radians.
+    :param quantum: spacing of the angles the cache is keyed on.
+    :return: 3x3 read only rotation matrix, shared between calls, copy it before changing it.
+    """
+    return _quantized_yp_mat(round(yaw / quantum), round(pitch / quantum), quantum)
+
+@lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def _quantized_yp_mat(yaw_steps, pitch_steps, quantum):
+    rotation = yp_mat(yaw_steps * quantum, pitch_steps * quantum)
+    rotation.flags.writeable = False
+    return rotation
+
 def clamp_pitch(pitch):
     return max(-pi/2, min(pitch, pi/2))
 
+def camera_key_step(key, yaw, pitch, translation, focal_length):
+    """
+    Move, turn or zoom the camera of an interactive viewer for a key press, see KEY_MOVES and KEY_TURNS.
+    :param key: the key as a one character string.
+    :param yaw: camera yaw in radians.
+    :param pitch: camera pitch in radians.
+    :param translation: 3-element numpy array of the camera position within world space.
+    :param focal_length: focal length in pixels.
+    :return: tuple (yaw, pitch, translation, focal_length) after the key, or None when the key does not change the camera.
+    """
+    if key in KEY_MOVES:
+        translation = translation + yp_mat(yaw, pitch) @ (TRANSLATION_STEP_SIZE * np.array(KEY_MOVES[key]))
+    elif key in KEY_TURNS:
+        yaw += ROTATION_STEP_SIZE * KEY_TURNS[key][0]
+        pitch = clamp_pitch(pitch + ROTATION_STEP_SIZE * KEY_TURNS[key][1])
+    elif key in ZOOM_IN_KEYS:
+        focal_length *= FOCAL_FACTOR
+    elif key in ZOOM_OUT_KEYS:
+        focal_length /= FOCAL_FACTOR
+    else:
+        return None
+    return yaw, pitch, translation, focal_length
+
 
 def make_intrinsics(focal_length, image_width, image_height):
     return np.array([[focal_length, 0., image_width/2], [0, -focal_length, image_height/2], [0, 0, 1]])
 
-def compare_images(expected_image, actual_image):
-    if (expected_image == actual_image).all():
-        return True
+def make_intrinsics_batch(focal_lengths, image_widths, image_heights):
+    """
+    Vectorized make_intrinsics.
+    :param focal_lengths: focal lengths in pixels, any shape that broadcasts with the image sizes.
+    :param image_widths: widths of the images in pixels
+    :param image_heights: heights of the images in pixels
+    :return: (..., 3, 3) array of camera matrices.
+    """
+    focal_lengths, image_widths, image_heights = np.broadcast_arrays(
+        np.asarray(focal_lengths, dtype=np.float64), np.asarray(image_widths, dtype=np.float64),
+        np.asarray(image_heights, dtype=np.float64),
+    )
+    intrinsics = np.zeros(focal_lengths.shape + (3, 3))
+    intrinsics[..., 0, 0] = focal_lengths
+    intrinsics[..., 0, 2] = image_widths / 2
+    intrinsics[..., 1, 1] = -focal_lengths
+    intrinsics[..., 1, 2] = image_heights / 2
+    intrinsics[..., 2, 2] = 1
+    return intrinsics
+
+def pose_matrix(rotation, translation):
+    """
+    4x4 matrix taking points from the local space of a camera or object into world space.
+    :param rotation: 3x3 rotation matrix, or (..., 3, 3) for several poses.
+    :param translation: 3-element position within world space, or (..., 3) for several poses.
+    :return: (..., 4, 4) matrix [R | t] acting on column vectors.
+    """
+    rotation = np.asarray(rotation, dtype=np.float64)
+    translation = np.asarray(translation, dtype=np.float64)
+    matrix = np.zeros(np.broadcast_shapes(rotation.shape[:-2], translation.shape[:-1]) + (4, 4))
+    matrix[..., :3, :3] = rotation
+    matrix[..., :3, 3] = translation
+    matrix[..., 3, 3] = 1
+    return matrix
+
+def world_to_camera_matrix(rotation, translation):
+    """
+    4x4 matrix taking world space points into camera space, the inverse of the camera's pose_matrix.
+    :param rotation: 3x3 rotation matrix of the camera within world space, or (..., 3, 3) for several cameras.
+    :param translation: 3-element position of the camera within world space, or (..., 3) for several cameras.
+    :return: (..., 4, 4) matrix [R^T | -R^T t] acting on column vectors.
+    """
+    rotation = np.asarray(rotation, dtype=np.float64)
+    translation = np.asarray(translation, dtype=np.float64)
+    inverse_rotation = np.swapaxes(rotation, -1, -2)
+    return pose_matrix(inverse_rotation, -(translation[..., None, :] @ rotation)[..., 0, :])
+
+def compose_transforms(*transforms):
+    """
+    Chain transforms into one matrix, e.g. compose_transforms(world_to_camera, model_to_world) takes model
+    points straight into camera space, so the vertices only get multiplied once.
+    :param transforms: (..., 4, 4) or (..., 3, 4) matrices, the last one is applied first.
+    :return: (..., 4, 4) matrix.
+    """
+    result = np.eye(4)
+    for transform in transforms:
+        transform = np.asarray(transform, dtype=np.float64)
+        if transform.shape[-2] == 3:
+            transform = np.concatenate([transform, np.broadcast_to([[0., 0., 0., 1.]], transform.shape[:-2] + (1, 4))], axis=-2)
+        result = result @ transform
+    return result
+
+def frustum_planes(camera_intrinsics, image_width, image_height, near, far=None, margin=1):
+    """
+    Planes bounding the region of camera space that can show up in the image.
+    :param camera_intrinsics: 3x3 camera matrix, e.g. from make_intrinsics, or (..., 3, 3) for several cameras.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near: distance of the near plane in front of the camera.
+    :param far: distance of the far plane, or None to leave the frustum open.
+    :param margin: pixels of slack around the image, so a point truncated onto the border row or column is kept.
+    :return: (..., P, 4) array of planes (a, b, c, d), normalized so a*x + b*y + c*z + d is the signed distance
+      of a camera space point to the plane, positive inside the frustum. The order is left, right, top, bottom,
+      near and then far if given.
+    """
+    k = np.asarray(camera_intrinsics, dtype=np.float64)
+    k0, k1, k2 = k[..., 0, :], k[..., 1, :], k[..., 2, :]
+    sides = np.stack([
+        k0 + margin * k2,
+        (image_width + margin) * k2 - k0,
+        k1 + margin * k2,
+        (image_height + margin) * k2 - k1,
+    ], axis=-2)
+    sides = np.concatenate([sides, np.zeros(sides.shape[:-1] + (1,))], axis=-1)
+
+    depth_planes = [[0., 0., 1., -near]]
+    if far is not None:
+        depth_planes.append([0., 0., -1., far])
+    depth_planes = np.broadcast_to(depth_planes, k.shape[:-2] + (len(depth_planes), 4))
+
+    planes = np.concatenate([sides, depth_planes], axis=-2)
+    return planes / np.linalg.norm(planes[..., :3], axis=-1, keepdims=True)
+
+def world_frustum_planes(rotation, translation, camera_intrinsics, image_width, image_height, near, far=None, margin=1):
+    """
+    The camera frustum planes moved into world space, see frustum_planes.
+    :param rotation: 3x3 numpy array representing the rotation matrix of the camera within world space.
+    :param translation: 3-element numpy array representing the position of the camera within world space.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of the image in pixels
+    :param image_height: height of the image in pixels
+    :param near: distance of the near plane.
+    :param far: distance of the far plane, or None for no far plane.
+    :param margin: pixels of slack around the image, see frustum_planes.
+    :return: (P, 4) array of planes (a, b, c, d) with a*x + b*y + c*z + d the signed distance of a world point.
+    """
+    planes = frustum_planes(camera_intrinsics, image_width, image_height, near, far, margin)
+    normals = planes[:, :3] @ np.asarray(rotation, dtype=np.float64).T
+    offsets = planes[:, 3] - normals @ np.asarray(translation, dtype=np.float64)
+    return np.column_stack([normals, offsets])
+
+def boxes_outside(planes, lower, upper):
+    """
+    Test axis aligned boxes against planes.
+    :param planes: (P, 4) array of planes, e.g. from world_frustum_planes.
+    :param lower: (..., 3) lower corners of the boxes.
+    :param upper: (..., 3) upper corners of the boxes.
+    :return: tuple (outside, crossing) of (...) and (..., P) boolean arrays. A box is outside when it is completely
+      behind any one plane, and crosses a plane when it lies on both of its sides.
+    """
+    center = (lower + upper) / 2
+    extent = (upper - lower) / 2
+    distance = center @ planes[:, :3].T + planes[:, 3]
+    radius = extent @ np.abs(planes[:, :3]).T
+    return (distance < -radius).any(axis=-1), distance < radius
+
+def image_difference(expected_image, actual_image):
+    """
+    Vectorized comparison of two images.
+    :param expected_image: reference image, or None when it could not be read.
+    :param actual_image: image to check.
+    :return: dictionary with "same_shape", the number of "mismatched" pixels that differ in any channel and the
+      "bbox" (x0, y0, x1, y1) of the differing pixels with exclusive ends, or None when nothing differs.
+    """
+    if expected_image is None or expected_image.shape != actual_image.shape:
+        return {"same_shape": False, "mismatched": actual_image.shape[0] * actual_image.shape[1], "bbox": None}
+
+    mismatch = expected_image != actual_image
+    if mismatch.ndim == 3:
+        mismatch = mismatch.any(axis=2)
+    rows, columns = np.flatnonzero(mismatch.any(axis=1)), np.flatnonzero(mismatch.any(axis=0))
+    bbox = None
+    if len(rows):
+        bbox = (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+    return {"same_shape": True, "mismatched": int(np.count_nonzero(mismatch)), "bbox": bbox}
+
+def diff_image(expected_image, actual_image):
+    """
+    Overlay of two images: green where the expected image has lines, blue where the actual image has them
+    and red where both do.
+    """
     eb, eg, er = cv2.split(expected_image)
     ab, ag, ar = cv2.split(actual_image)
-    cv2.imshow('Image Comparison (green = expected, blue = actual)', cv2.merge((ab, eg, ar & er)))
-    cv2.waitKey(0)
+    return cv2.merge((ab, eg, ar & er))
+
+def compare_images(expected_image, actual_image, diff_file=None):
+    """
+    Check two images for equality without opening any window, so it is safe to run headless.
+    :param expected_image: reference image, or None when it could not be read.
+    :param actual_image: image to check.
+    :param diff_file: optional path where the diff_image of mismatching images is written.
+    :return: True when the images are the same.
+    """
+    difference = image_difference(expected_image, actual_image)
+    if difference["same_shape"] and not difference["mismatched"]:
+        return True
+    if diff_file is not None and difference["same_shape"]:
+        directory = os.path.dirname(diff_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        cv2.imwrite(diff_file, diff_image(expected_image, actual_image))
     return False
 
 
-# imgdiff(np1, np2)
\ No newline at end of file
+# imgdiff(np1, np2)
@@ -1,5 +1,4 @@
 import cv2
-import json
 import os
 
 import numpy as np
@@ -9,13 +8,13 @@ from rendering import project_to_image
 from rendering import render_image
 from rendering import render_wireframe
 from rendering_helpers import make_intrinsics, yp_mat, compare_images
+from model_loader import load_cached_model
 
 ### CAMERA SPACE
 
 def write_test_camera_space(reference_file, test_name, model_file, translation, yaw, pitch):
     rotation = yp_mat(yaw, pitch)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     points = convert_model_to_camera_space(vertices, rotation, translation)
@@ -23,8 +22,7 @@ def write_test_camera_space(reference_file, test_name, model_file, translation,
 
 def test_camera_space(reference_file, test_name, model_file, translation, yaw, pitch):
     rotation = yp_mat(yaw, pitch)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     actual_points = convert_model_to_camera_space(vertices, rotation, translation)
@@ -79,8 +77,7 @@ def write_test_projected_image(reference_file, test_name, model_file, translatio
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     camera_space_vertices = convert_model_to_camera_space(vertices, rotation, translation)
@@ -92,8 +89,7 @@ def test_projected_image(reference_file, test_name, model_file, translation, yaw
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     camera_space_vertices = convert_model_to_camera_space(vertices, rotation, translation)
@@ -147,8 +143,7 @@ def write_test_render_image(reference_file, test_name, model_file, translation,
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     image = render_wireframe(
         model=model,
@@ -170,8 +165,7 @@ def test_render_image(reference_file, test_name, model_file, translation, yaw, p
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     actual_image = render_wireframe(
         model=model,
@@ -221,8 +215,7 @@ test_render_image(
 def write_test_image(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     image = render_wireframe(
         model=model,
@@ -238,8 +231,7 @@ def write_test_image(reference_file, test_name, model_file, translation, yaw, pi
 def test_image(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     actual_image = render_wireframe(
         model=model,
@@ -1,15 +1,35 @@
+import asyncio
+import contextlib
 import cv2
+import io
 import json
 import os
+import tempfile
 import numpy as np
 from math import pi
-from rendering import convert_model_to_camera_space, project_to_image, render_image, render_wireframe
-from rendering_helpers import make_intrinsics, yp_mat, compare_images
+from rendering import convert_model_to_camera_space, project_points, project_to_image, render_image, render_wireframe
+from rendering import blank_image, clip_edges, draw_segments, render_wireframe_batch, transform_points
+from rendering_helpers import make_intrinsics, yp_mat, compare_images, compose_transforms, pose_matrix, world_to_camera_matrix
+from rendering_helpers import make_intrinsics_batch, yp_mat_batch, yp_mat_cached
+from model_loader import Model, ModelCache, compile_model, load_cached_model, load_model
+from scene import Scene
+from sequence import ImageSequenceWriter, render_sequence, write_sequence
+from parallel import render_parallel
+from instancing import render_instances, visible_instances
+from lod import select_lod
+from topology import vertex_edges
+from benchmark import REGRESSION_MIN_SECONDS, find_regressions, run_benchmarks
+from profiling import FrameStats, RenderProfiler
+from regression_runner import load_manifest, run_cases
+from viewer import AsyncViewer, CameraState, read_event_stream, serve_socket
+from frame_cache import FrameCache
+from edge_grid import build_edge_grid, frustum_edges, pick_edge
+import renderer
+from renderer import WireframeRenderer
 
 def write_test_camera_space(reference_file, test_name, model_file, translation, yaw, pitch):
     rotation = yp_mat(yaw, pitch)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     points = convert_model_to_camera_space(vertices, rotation, translation)
@@ -23,8 +43,7 @@ def test_camera_space(reference_file, test_name, model_file, translation, yaw, p
         write_test_camera_space(reference_file, test_name, model_file, translation, yaw, pitch)
 
     rotation = yp_mat(yaw, pitch)
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     actual_points = convert_model_to_camera_space(vertices, rotation, translation)
@@ -40,8 +59,7 @@ def write_test_projected_image(reference_file, test_name, model_file, translatio
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     camera_space_vertices = convert_model_to_camera_space(vertices, rotation, translation)
@@ -59,8 +77,7 @@ def test_projected_image(reference_file, test_name, model_file, translation, yaw
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     vertices = np.array(model["vertices"])
     camera_space_vertices = convert_model_to_camera_space(vertices, rotation, translation)
@@ -81,14 +98,81 @@ def test_projected_image(reference_file, test_name, model_file, translation, yaw
     else:
         print(f"Test '{test_name}' failed, {match_count} of {total_count} points matched")
 
+def test_projected_points(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    model = load_cached_model(model_file)
+
+    vertices = np.array(model["vertices"])
+    camera_space_vertices = convert_model_to_camera_space(vertices, rotation, translation)
+    points, in_front = project_points(camera_space_vertices, camera_intrinsics)
+    expected_points = project_to_image(camera_space_vertices, camera_intrinsics)
+
+    expected_in_front = np.array([point is not None for point in expected_points])
+    matches = (in_front == expected_in_front).all()
+    if matches and in_front.any():
+        matches = np.array_equal(points[in_front], np.load(reference_file)[in_front])
+
+    if matches:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_projected_near_camera(test_name, vertices_camera_space, edges, expected_pixels, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    # The per-vertex reference truncates every point in front of the camera to exact Python ints
+    expected_points = []
+    for vertex in vertices_camera_space:
+        if vertex[2] <= 0:
+            expected_points.append(None)
+            continue
+        projected = camera_intrinsics @ np.array(vertex, dtype=np.float64)
+        x, y = projected[:2] / projected[2]
+        expected_points.append((int(x), int(y)))
+
+    with np.errstate(all="raise"):
+        actual_points = project_to_image(np.array(vertices_camera_space, dtype=np.float64), camera_intrinsics)
+
+    # Lines to those points are still drawn, cut at the image border
+    image = render_image(actual_points, edges, image_width, image_height)
+    drawn = sorted(zip(*np.nonzero(image[..., 0])[::-1]))
+
+    if actual_points == expected_points and drawn == sorted(expected_pixels):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {actual_points}")
+
+def test_projected_beside_image(test_name, vertices_camera_space, edges, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = {"vertices": np.array(vertices_camera_space, dtype=np.float64), "edges": np.array(edges)}
+    rotation, translation = np.eye(3), np.zeros(3)
+
+    # The reference projects in exact Python ints, every clipping pipeline has to draw the same lines
+    expected = render_image(project_to_image(model["vertices"], camera_intrinsics), edges, image_width, image_height)
+    images = {
+        "render_wireframe": render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height),
+        "render_wireframe_batch": render_wireframe_batch(
+            model, rotation[None], translation[None], camera_intrinsics, image_width, image_height
+        )[0],
+        "render_instances": render_instances(model, np.eye(4)[None], rotation, translation, camera_intrinsics, image_width, image_height),
+        "WireframeRenderer": WireframeRenderer(model, rotation, translation, camera_intrinsics, image_width, image_height).render(),
+    }
+
+    mismatched = [name for name, image in images.items() if not np.array_equal(image, expected)]
+    if not mismatched and np.count_nonzero(expected[..., 0]) == image_width:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {mismatched}")
+
 def write_test_render_image(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
     os.makedirs(os.path.dirname(reference_file), exist_ok=True)
 
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     image = render_wireframe(
         model=model,
@@ -110,8 +194,7 @@ def test_render_image(reference_file, test_name, model_file, translation, yaw, p
     rotation = yp_mat(yaw, pitch)
     camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
 
-    with open(model_file, 'r') as f:
-        model = json.load(f)
+    model = load_cached_model(model_file)
 
     actual_image = render_wireframe(
         model=model,
@@ -129,6 +212,701 @@ def test_render_image(reference_file, test_name, model_file, translation, yaw, p
     else:
         print(f"Test '{test_name}' failed")
 
+def test_render_batch(reference_files, test_name, model_file, translations, yaws, pitches, image_width, image_height, focal_length):
+    rotations = np.array([yp_mat(yaw, pitch) for yaw, pitch in zip(yaws, pitches)])
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    model = load_cached_model(model_file)
+
+    actual_images = render_wireframe_batch(
+        model=model,
+        rotations=rotations,
+        translations=np.array(translations),
+        camera_intrinsics=camera_intrinsics,
+        image_width=image_width,
+        image_height=image_height
+    )
+
+    match_count = 0
+    for reference_file, actual_image in zip(reference_files, actual_images):
+        if compare_images(cv2.imread(reference_file), actual_image):
+            match_count += 1
+
+    if match_count == len(reference_files):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {match_count} of {len(reference_files)} images matched")
+
+def test_compiled_model(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_dir = compile_model(model_file, os.path.join(temp_dir, "compiled.model"))
+        model = load_model(model_dir)
+
+        actual_image = render_wireframe(
+            model=model,
+            rotation=rotation,
+            translation=translation,
+            camera_intrinsics=camera_intrinsics,
+            image_width=image_width,
+            image_height=image_height
+        )
+        is_memory_mapped = isinstance(model.vertices, np.memmap) and isinstance(model.edges, np.memmap)
+        del model
+
+    expected_image = cv2.imread(reference_file)
+
+    if is_memory_mapped and compare_images(expected_image, actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_recompiled_model(reference_file, test_name, model_file, previous_model_file, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    # Compile another model with levels of detail and an edge grid into the same directory first
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_dir = os.path.join(temp_dir, "compiled.model")
+        compile_model(previous_model_file, model_dir, lod_levels=2, edge_grid=True)
+        compile_model(model_file, model_dir)
+        model = load_model(model_dir, mmap=False)
+
+    stale = sorted(name for name in model.arrays if name.startswith(("lod_", "grid_")))
+    actual_image = render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height)
+
+    if not stale and compare_images(cv2.imread(reference_file), actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, stale arrays {stale}")
+
+def test_model_cache(test_name, model_files, max_size):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = [os.path.join(temp_dir, os.path.basename(model_file)) for model_file in model_files]
+        for model_file, path in zip(model_files, paths):
+            with open(model_file, 'r') as source, open(path, 'w') as f:
+                f.write(source.read())
+
+        cache = ModelCache(max_size=max_size)
+        first = cache.get(paths[0])
+        shared = cache.get(paths[0]) is first
+        read_only = all(not array.flags.writeable for array in first.arrays.values())
+        read_only = read_only and all(not array.flags.writeable for array in load_cached_model(paths[0]).arrays.values())
+
+        # A newer modification time loads the file again
+        stat = os.stat(paths[0])
+        os.utime(paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        reloaded = cache.get(paths[0])
+        fresh = reloaded is not first and cache.get(paths[0]) is reloaded
+
+        # Filling the cache evicts the least recently used model
+        for path in paths[1:]:
+            cache.get(path)
+        evicted = cache.stats()["size"] == max_size and cache.get(paths[0]) is not reloaded
+        stats = cache.stats()
+
+    counts = stats["hits"] == 2 and stats["misses"] == len(paths) + 2
+    if shared and read_only and fresh and evicted and counts:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {stats}")
+
+def test_scene_culling(reference_file, test_name, model_file, offsets, expected_visible, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    model = load_cached_model(model_file)
+    scene = Scene([{"vertices": model["vertices"] + np.array(offset), "edges": model["edges"]} for offset in offsets])
+
+    visible = scene.visible_objects(rotation, translation, camera_intrinsics, image_width, image_height)
+    actual_image = scene.render(rotation, translation, camera_intrinsics, image_width, image_height)
+    expected_image = cv2.imread(reference_file)
+
+    # A model without vertices has no bounds to cull it by
+    try:
+        scene.add({"vertices": np.zeros((0, 3)), "edges": np.zeros((0, 2), dtype=np.int32)})
+        rejected = False
+    except ValueError:
+        rejected = True
+
+    if list(visible) == expected_visible and rejected and len(scene) == len(offsets) and compare_images(expected_image, actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, visible objects {list(visible)}")
+
+def test_buffer_reuse(test_name, model_file, translations, yaws, pitches, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+    vertices, edges = np.asarray(model["vertices"]), np.asarray(model["edges"])
+
+    # The stages write into the arrays passed as out and give the same values as when they allocate
+    buffers = {
+        "camera_space": np.empty((len(vertices), 3)),
+        "segments": np.empty((len(edges), 2, 3)),
+        "points": (np.empty((len(edges), 2, 2), dtype=np.int32), np.empty((len(edges), 2), dtype=bool)),
+        "work": np.empty((len(edges), 2, 3)),
+        "image": np.full((image_height, image_width, 3), 7, dtype=np.uint8),
+    }
+    same_values, written_in_place = True, True
+    for translation, yaw, pitch in zip(translations, yaws, pitches):
+        rotation = yp_mat(yaw, pitch)
+        camera_space = convert_model_to_camera_space(vertices, rotation, np.array(translation))
+        pooled_camera_space = convert_model_to_camera_space(vertices, rotation, np.array(translation), out=buffers["camera_space"])
+        segments, visible = clip_edges(camera_space, edges, camera_intrinsics, image_width, image_height)
+        pooled_segments, pooled_visible = clip_edges(pooled_camera_space, edges, camera_intrinsics, image_width, image_height, out=buffers["segments"])
+        points, in_front = project_points(segments, camera_intrinsics)
+        pooled_points, pooled_in_front = project_points(pooled_segments, camera_intrinsics, out=buffers["points"], work=buffers["work"])
+        image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height)
+        pooled_image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, out=buffers["image"])
+
+        same_values = same_values and np.array_equal(camera_space, pooled_camera_space) and np.array_equal(segments, pooled_segments)
+        same_values = same_values and np.array_equal(visible, pooled_visible) and np.array_equal(points, pooled_points)
+        same_values = same_values and np.array_equal(in_front, pooled_in_front) and compare_images(image, pooled_image)
+        written_in_place = written_in_place and pooled_camera_space is buffers["camera_space"] and pooled_segments is buffers["segments"]
+        written_in_place = written_in_place and pooled_points is buffers["points"][0] and pooled_image is buffers["image"]
+    cleared = blank_image(image_width, image_height, out=buffers["image"]) is buffers["image"] and not buffers["image"].any()
+
+    # A renderer allocates its pooled buffers while going through the poses once and reuses them after that
+    renderer = WireframeRenderer(model, yp_mat(yaws[0], pitches[0]), translations[0], camera_intrinsics, image_width, image_height)
+    allocations = []
+    for _ in range(3):
+        for translation, yaw, pitch in zip(translations, yaws, pitches):
+            renderer.set_pose(yp_mat(yaw, pitch), translation)
+            renderer.render()
+        allocations.append(renderer.buffers.allocations)
+    steady = allocations[0] > 0 and allocations[0] == allocations[-1]
+
+    # The last pose is close enough to clip edges at the near plane, its endpoints are packed into the pool too
+    segments_2d = renderer.buffers.get("segments_2d", (len(edges), 2, 2), np.int32)
+    clipped_in_pool = renderer._camera_space[:, 2].min() < renderer.near_plane and np.shares_memory(renderer._points, segments_2d)
+
+    # Edges pointing past the vertices are rejected instead of drawn to the wrong vertex
+    try:
+        WireframeRenderer({"vertices": vertices, "edges": [[0, len(vertices)]]}, np.eye(3), np.zeros(3), camera_intrinsics, image_width, image_height)
+        rejected = False
+    except ValueError:
+        rejected = True
+
+    if same_values and written_in_place and cleared and steady and clipped_in_pool and rejected:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {allocations[-1] - allocations[0]} buffers allocated in the steady state, clipped in pool {clipped_in_pool}")
+
+def test_wireframe_renderer(test_name, model_file, translations, yaws, pitches, focal_lengths, image_width, image_height):
+    model = load_cached_model(model_file)
+
+    # Count the stage calls the renderer makes
+    calls = {"convert_model_to_camera_space": 0, "draw_segments": 0}
+    stages = {name: getattr(renderer, name) for name in calls}
+    def counted(name):
+        def stage(*args, **kwargs):
+            calls[name] += 1
+            return stages[name](*args, **kwargs)
+        return stage
+
+    for name in calls:
+        setattr(renderer, name, counted(name))
+    try:
+        wireframe_renderer = WireframeRenderer(
+            model, yp_mat(yaws[0], pitches[0]), translations[0], make_intrinsics(focal_lengths[0], image_width, image_height), image_width, image_height
+        )
+        matches, reused, cached = True, True, True
+        for translation, yaw, pitch in zip(translations, yaws, pitches):
+            wireframe_renderer.set_pose(yp_mat(yaw, pitch), translation)
+            conversions = calls["convert_model_to_camera_space"]
+            for focal_length in focal_lengths:
+                camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+                wireframe_renderer.set_intrinsics(camera_intrinsics)
+                frame = wireframe_renderer.render()
+                expected_image = render_wireframe(model, yp_mat(yaw, pitch), np.array(translation), camera_intrinsics, image_width, image_height, lod_pixel_error=None)
+                matches = matches and compare_images(expected_image, frame)
+
+                # Rendering again without any change returns the same frame without drawing it
+                draws = calls["draw_segments"]
+                cached = cached and wireframe_renderer.render() is frame and calls["draw_segments"] == draws
+
+            # New intrinsics keep the camera space vertices of the pose
+            reused = reused and calls["convert_model_to_camera_space"] == conversions + 1
+    finally:
+        for name, stage in stages.items():
+            setattr(renderer, name, stage)
+
+    if matches and reused and cached:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {calls}")
+
+def test_render_sequence(reference_pattern, test_name, model_file, translations, yaws, pitches, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+
+    frames = render_sequence(model, yaws, pitches, translations, camera_intrinsics, image_width, image_height)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_pattern = os.path.join(temp_dir, "frame_{}.png")
+        frame_count = write_sequence(frames, ImageSequenceWriter(output_pattern))
+
+        match_count = 0
+        for index in range(frame_count):
+            expected_image = cv2.imread(reference_pattern.format(index))
+            if compare_images(expected_image, cv2.imread(output_pattern.format(index))):
+                match_count += 1
+
+    if frame_count == len(yaws) and match_count == frame_count:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {match_count} of {len(yaws)} frames matched")
+
+def test_render_parallel(reference_files, test_name, model_file, translations, yaws, pitches, image_width, image_height, focal_length, use_threads):
+    rotations = np.array([yp_mat(yaw, pitch) for yaw, pitch in zip(yaws, pitches)])
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+
+    frames = render_parallel(
+        model, rotations, np.array(translations), camera_intrinsics, image_width, image_height,
+        workers=2, chunk_size=1, use_threads=use_threads
+    )
+
+    match_count = 0
+    for reference_file, actual_image in zip(reference_files, frames):
+        if compare_images(cv2.imread(reference_file), actual_image):
+            match_count += 1
+
+    if match_count == len(reference_files):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {match_count} of {len(reference_files)} images matched")
+
+def test_precomposed_transform(reference_file, test_name, model_file, object_translation, object_yaw, camera_translation, camera_yaw, camera_pitch):
+    # The object is placed in the world by its own pose, the reference holds the camera space vertices of the
+    # same view with the object at the origin and the camera moved instead
+    model = load_cached_model(model_file)
+    model_to_world = pose_matrix(yp_mat(object_yaw, 0), object_translation)
+    world_to_camera = world_to_camera_matrix(yp_mat(camera_yaw, camera_pitch), camera_translation)
+    transform = compose_transforms(world_to_camera, model_to_world)
+
+    expected_points = np.load(reference_file)
+    actual_points = transform_points(model["vertices"], transform)
+    actual_points_32 = transform_points(np.asarray(model["vertices"], dtype=np.float32), transform, dtype=np.float32)
+
+    if np.allclose(expected_points, actual_points) and np.allclose(expected_points, actual_points_32, atol=1e-5):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_render_instances(reference_file, test_name, model_file, offsets, expected_visible, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    model = load_cached_model(model_file)
+    instance_transforms = pose_matrix(np.eye(3), np.array(offsets, dtype=np.float64))
+
+    visible = visible_instances(model, instance_transforms, rotation, translation, camera_intrinsics, image_width, image_height)
+    actual_image = render_instances(model, instance_transforms, rotation, translation, camera_intrinsics, image_width, image_height, chunk_size=2)
+    if reference_file is None:
+        # Without a reference the copies are merged into one scene and rendered the ordinary way
+        scene = Scene([{"vertices": model["vertices"] + np.array(offset), "edges": model["edges"]} for offset in offsets])
+        expected_image = scene.render(rotation, translation, camera_intrinsics, image_width, image_height)
+    else:
+        expected_image = cv2.imread(reference_file)
+
+    if list(visible) == expected_visible and compare_images(expected_image, actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, visible instances {list(visible)}")
+
+def test_lod_model(reference_file, test_name, model_file, lod_levels, translation, far_translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_dir = compile_model(model_file, os.path.join(temp_dir, "compiled.model"), np.float64, lod_levels)
+        model = load_model(model_dir, mmap=False)
+
+    # Close up the full model is drawn, far away a coarser level
+    near_level = select_lod(model, rotation, translation, camera_intrinsics)
+    far_level = select_lod(model, rotation, far_translation, camera_intrinsics)
+    actual_image = render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height)
+    far_image = render_wireframe(model, rotation, far_translation, camera_intrinsics, image_width, image_height)
+    far_full_image = render_wireframe(model, rotation, far_translation, camera_intrinsics, image_width, image_height, lod_pixel_error=None)
+
+    # Every pixel of the simplified lines lies within a pixel of the full model's lines
+    within_error = not (far_image & ~cv2.dilate(far_full_image, np.ones((3, 3), np.uint8))).any()
+
+    expected_image = cv2.imread(reference_file)
+    if near_level == 0 and far_level > 0 and within_error and compare_images(expected_image, actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, levels {near_level} and {far_level}")
+
+def test_preprocessed_model(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    # Add reversed and repeated copies of the edges, a loop and a vertex no edge uses
+    model = load_cached_model(model_file)
+    edges = np.asarray(model["edges"]).tolist()
+    messy_model = {
+        "vertices": [[100, 100, 100]] + np.asarray(model["vertices"]).tolist(),
+        "edges": [[b + 1, a + 1] for a, b in edges] + [[a + 1, b + 1] for a, b in edges] + [[1, 1]],
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        messy_file = os.path.join(temp_dir, "messy.json")
+        with open(messy_file, 'w') as f:
+            json.dump(messy_model, f)
+        preprocessed = load_model(messy_file, preprocess=True)
+
+    # Every edge touching a vertex is found through the index
+    adjacency_matches = all(
+        set(vertex_edges(preprocessed, vertex)) == set(np.flatnonzero((preprocessed.edges == vertex).any(axis=1)))
+        for vertex in range(len(preprocessed.vertices))
+    )
+
+    actual_image = render_wireframe(preprocessed, rotation, translation, camera_intrinsics, image_width, image_height)
+    expected_image = cv2.imread(reference_file)
+
+    counts_match = len(preprocessed.edges) == len(edges) and len(preprocessed.vertices) == len(model["vertices"])
+    if counts_match and adjacency_matches and compare_images(expected_image, actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {len(preprocessed.vertices)} vertices and {len(preprocessed.edges)} edges")
+
+def test_benchmark(test_name, sizes, image_sizes, expected_stages):
+    results = run_benchmarks(sizes, image_sizes, repeats=1, log=None)
+
+    stages = sorted({key.split("/")[0] for key in results})
+    # A baseline twice as fast flags every measurement, one twice as slow none
+    faster_baseline = {key: {"seconds": result["seconds"] / 2, "peak_bytes": result["peak_bytes"]} for key, result in results.items()}
+    slower_baseline = {key: {"seconds": result["seconds"] * 2, "peak_bytes": result["peak_bytes"] * 2} for key, result in results.items()}
+    # Stages this fast only differ by noise, so taking half as long again is not flagged
+    fast_keys = [key for key, result in results.items() if result["seconds"] < REGRESSION_MIN_SECONDS]
+    noisy_baseline = {key: {"seconds": results[key]["seconds"] / 1.5, "peak_bytes": results[key]["peak_bytes"]} for key in fast_keys}
+
+    if (
+        stages == sorted(expected_stages)
+        and len(results) == len(sizes) * len(image_sizes) * len(expected_stages)
+        and len(find_regressions(results, faster_baseline, min_seconds=0, min_bytes=0)) == len(results)
+        and not find_regressions(results, slower_baseline)
+        and fast_keys and not find_regressions(results, noisy_baseline)
+    ):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, stages {stages}")
+
+def test_render_stats(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length, expected_counts, frame_count):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+
+    stats = FrameStats()
+    actual_image = render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height, stats=stats)
+    counts_match = all(stats.stages[stage][name] == value for (stage, name), value in expected_counts.items())
+
+    profiler = RenderProfiler()
+    for _ in range(frame_count):
+        render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height, stats=profiler)
+    frames = profiler.snapshot()["frame"]
+    exported = f'wireframe_stage_seconds_count{{stage="frame"}} {frame_count}' in profiler.prometheus_text()
+    aggregated = frames["count"] == frame_count and frames["buckets"][-1][1] == frame_count and exported
+
+    if counts_match and aggregated and compare_images(cv2.imread(reference_file), actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, stages {stats.stages}")
+
+def test_regression_runner(test_name, manifest_file, broken_case, workers):
+    cases = load_manifest(manifest_file)
+    results = run_cases(cases, workers=workers, diff_dir=None)
+    failures = [result["name"] for result in results if result["status"] not in ("passed", "generated")]
+
+    # A case that renders differently is reported with its diff written to disk instead of shown in a window
+    broken = dict(next(case for case in cases if case["name"] == broken_case), yaw=0.01)
+    with tempfile.TemporaryDirectory() as diff_dir:
+        broken_result = run_cases([broken], workers=1, diff_dir=diff_dir)[0]
+        diff_written = os.path.exists(broken_result.get("diff_file", ""))
+
+    if not failures and broken_result["status"] == "failed" and broken_result["mismatched"] and diff_written:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {failures} {broken_result}")
+
+def test_async_viewer(reference_file, test_name, model_file, events, bad_lines, image_width, image_height):
+    model = load_cached_model(model_file)
+
+    async def run_viewer():
+        viewer = AsyncViewer(model, CameraState(), image_width, image_height)
+        # A burst of events arrives faster than frames render, with some lines that are no events in the
+        # middle, then the stream ends
+        reader = asyncio.StreamReader()
+        lines = [json.dumps(event) for event in events]
+        for line in lines[:len(lines) // 2] + bad_lines + lines[len(lines) // 2:]:
+            reader.feed_data((line + "\n").encode())
+        reader.feed_eof()
+        await viewer.run(lambda viewer: read_event_stream(viewer, reader))
+        return viewer
+
+    errors = io.StringIO()
+    with contextlib.redirect_stderr(errors):
+        viewer = asyncio.run(run_viewer())
+    dropped_stale = viewer.frames_rendered < len(events)
+    skipped = viewer.events_received == len(events) and len(errors.getvalue().splitlines()) == len(bad_lines)
+
+    if dropped_stale and skipped and viewer.frame_version == viewer.camera.version and compare_images(cv2.imread(reference_file), viewer.frame):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {viewer.frames_rendered} frames for {len(events)} events")
+
+def test_socket_viewer(test_name, model_file, events, image_width, image_height, timeout):
+    model = load_cached_model(model_file)
+
+    async def run_viewer(socket_path):
+        viewer = AsyncViewer(model, CameraState(), image_width, image_height)
+
+        async def send_events():
+            while not os.path.exists(socket_path):
+                await asyncio.sleep(0.001)
+            # A second connection stays idle, the quit event still ends the viewer and closes it
+            idle = await asyncio.open_unix_connection(socket_path)
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            for event in events + [{"type": "quit"}]:
+                writer.write((json.dumps(event) + "\n").encode())
+            await writer.drain()
+            return idle
+
+        sender = asyncio.create_task(send_events())
+        await asyncio.wait_for(viewer.run(lambda viewer: serve_socket(viewer, path=socket_path)), timeout)
+        idle_reader, _ = await sender
+        return viewer, await asyncio.wait_for(idle_reader.read(), timeout)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        viewer, idle_data = asyncio.run(run_viewer(os.path.join(temp_dir, "events.sock")))
+
+    if viewer.camera.quit and viewer.events_received == len(events) + 1 and idle_data == b"":
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {viewer.events_received} events received")
+
+def test_render_tiled(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length, tile_size):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+
+    actual_image = render_wireframe(
+        model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, tile_size=tile_size
+    )
+
+    if compare_images(cv2.imread(reference_file), actual_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_hidden_lines(test_name, model_file, faces, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    with open(model_file, 'r') as f:
+        model = Model.from_dict(dict(json.load(f), faces=faces), np.float64).preprocessed()
+
+    # Only the edges of the face nearest to the camera can be seen, and hiding never adds pixels
+    vertices_camera_space = convert_model_to_camera_space(model["vertices"], rotation, np.array(translation))
+    depths = vertices_camera_space[:, 2]
+    front_edges = model["edges"][np.isclose(depths[model["edges"]], depths.min()).all(axis=1)]
+    expected_image = render_wireframe({"vertices": model["vertices"], "edges": front_edges}, rotation, np.array(translation), camera_intrinsics, image_width, image_height)
+    actual_image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, hidden_lines=True)
+
+    turned = yp_mat(yaw + 0.5, pitch + 0.3)
+    turned_translation = -2 * turned[:, 2]
+    hidden_image = render_wireframe(model, turned, turned_translation, camera_intrinsics, image_width, image_height, hidden_lines=True)
+    plain_image = render_wireframe(model, turned, turned_translation, camera_intrinsics, image_width, image_height)
+    subset = not (hidden_image & ~plain_image).any() and (hidden_image != plain_image).any()
+
+    # Drawing with the depth test is timed like any other draw, and antialiased lines cannot be depth tested
+    stats = FrameStats()
+    render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, stats=stats, hidden_lines=True)
+    timed = stats.stages.get("draw", {}).get("faces") == len(faces)
+    try:
+        render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, hidden_lines=True, antialiased=True)
+        rejected = False
+    except ValueError:
+        rejected = True
+
+    if compare_images(expected_image, actual_image) and subset and timed and rejected:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_face_occluder(test_name, model, translation, yaw, pitch, image_width, image_height, focal_length):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    # Faces whose vertices no edge uses still hide the edges behind them once compiled
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_file = os.path.join(temp_dir, "occluder.json")
+        with open(model_file, 'w') as f:
+            json.dump(model, f)
+        compiled = load_model(compile_model(model_file), mmap=False)
+
+    raw_image = render_wireframe(Model.from_dict(model, np.float64), rotation, np.array(translation), camera_intrinsics, image_width, image_height, hidden_lines=True)
+    hidden_image = render_wireframe(compiled, rotation, np.array(translation), camera_intrinsics, image_width, image_height, hidden_lines=True)
+    plain_image = render_wireframe(compiled, rotation, np.array(translation), camera_intrinsics, image_width, image_height)
+
+    if len(compiled["faces"]) == len(model["faces"]) and not raw_image.any() and not hidden_image.any() and plain_image.any():
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {len(compiled['faces'])} faces and {np.count_nonzero(hidden_image[..., 0])} pixels drawn")
+
+def test_face_crossing_near_plane(test_name, model, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    rotation, translation = np.eye(3), np.zeros(3)
+
+    # A face reaching behind the camera is cut at the near plane and still hides the edges behind it
+    hidden_image = render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height, hidden_lines=True)
+    plain_image = render_wireframe(model, rotation, translation, camera_intrinsics, image_width, image_height)
+
+    if not hidden_image.any() and plain_image.any():
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {np.count_nonzero(hidden_image[..., 0])} pixels drawn")
+
+def test_antialiased(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length, supersampling):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+
+    # The subpixel coordinates truncate to the integer ones, which stay the default
+    vertices_camera_space = convert_model_to_camera_space(model["vertices"], rotation, np.array(translation))
+    points, in_front = project_points(vertices_camera_space, camera_intrinsics)
+    subpixel_points, _ = project_points(vertices_camera_space, camera_intrinsics, dtype=np.float64)
+    truncated = np.array_equal(np.trunc(subpixel_points[in_front]), points[in_front])
+    aliased_image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height)
+    smooth_image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height, antialiased=True)
+
+    # The antialiased lines look more like one pixel wide lines drawn at several times the size and
+    # downscaled than the aliased ones do
+    large_points, _ = project_points(vertices_camera_space, make_intrinsics(focal_length * supersampling, image_width * supersampling, image_height * supersampling))
+    large_image = np.zeros((image_height * supersampling, image_width * supersampling, 3), dtype=np.uint8)
+    cv2.polylines(large_image, large_points[np.asarray(model["edges"])], False, (255, 255, 255), supersampling)
+    supersampled_image = cv2.resize(large_image, (image_width, image_height), interpolation=cv2.INTER_AREA)
+
+    def correlation(image, other):
+        image, other = image.astype(np.float64) - image.mean(), other.astype(np.float64) - other.mean()
+        return (image * other).sum() / np.sqrt((image * image).sum() * (other * other).sum())
+
+    smoother = correlation(smooth_image, supersampled_image) > correlation(aliased_image, supersampled_image)
+    shaded = len(np.unique(smooth_image)) > 2
+
+    if truncated and smoother and shaded and compare_images(cv2.imread(reference_file), aliased_image):
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_antialiased_far_endpoint(test_name, start, direction, image_width, image_height):
+    # A line towards a far off endpoint covers the same pixels as the same line ending just past the image
+    start, direction = np.array(start, dtype=np.float64), np.array(direction, dtype=np.float64)
+    far_image = draw_segments(blank_image(image_width, image_height), [[start, start + 1e9 * direction]], antialiased=True)
+    near_image = draw_segments(blank_image(image_width, image_height), [[start, start + 2 * max(image_width, image_height) * direction]], antialiased=True)
+
+    # and keeps its slope, so it crosses a column where the line equation says
+    column = image_width // 2
+    rows = np.flatnonzero(far_image[:, column, 0])
+    expected_row = start[1] + (column - start[0]) * direction[1] / direction[0]
+
+    if np.array_equal(far_image, near_image) and len(rows) and abs(rows.mean() - expected_row) <= 1:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, rows {rows} at column {column}")
+
+def test_frame_cache(test_name, model_file, translation, yaw, pitch, yaw_steps, image_width, image_height, focal_length):
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+    model = load_cached_model(model_file)
+    cache = FrameCache(model, camera_intrinsics, image_width, image_height)
+
+    # Jitter under the thresholds returns the cached frame, small turns redraw the edges that moved and the
+    # result is always the full render of the last drawn pose
+    matches = True
+    for step in [0, 1e-5] + list(yaw_steps) + [0.5]:
+        yaw += step
+        frame = cache.render(yaw, pitch, translation)
+        drawn_yaw = cache.pose[0]
+        expected_image = render_wireframe(model, yp_mat(drawn_yaw, pitch), np.array(translation), camera_intrinsics, image_width, image_height, lod_pixel_error=None)
+        matches = matches and compare_images(expected_image, frame)
+
+    counts = (cache.frames_skipped, cache.frames_incremental, cache.frames_full)
+    saved = cache.edges_redrawn < len(model["edges"]) * (cache.frames_incremental + cache.frames_full)
+
+    if matches and saved and cache.frames_skipped == 1 and cache.frames_incremental > 0 and cache.frames_full > 0:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {counts} frames skipped, incremental and full")
+
+def test_camera_matrix_batch(test_name, yaws, pitches, focal_lengths, image_width, image_height, turn_step, turn_count):
+    # The batched matrices are the same as the ones built one at a time
+    rotations = yp_mat_batch(yaws, pitches)
+    expected_rotations = np.array([yp_mat(yaw, pitch) for yaw, pitch in zip(yaws, pitches)])
+    intrinsics = make_intrinsics_batch(focal_lengths, image_width, image_height)
+    expected_intrinsics = np.array([make_intrinsics(focal_length, image_width, image_height) for focal_length in focal_lengths])
+    batched = np.array_equal(rotations, expected_rotations) and np.array_equal(intrinsics, expected_intrinsics)
+
+    # Turning back and forth in fixed steps comes back to the cached angles despite the rounding errors
+    yaw, cached = 0., True
+    first = yp_mat_cached(yaw, 0.)
+    for _ in range(turn_count):
+        yaw += turn_step
+        cached = cached and np.allclose(yp_mat_cached(yaw, 0.), yp_mat(yaw, 0.), rtol=0, atol=1e-9)
+    for _ in range(turn_count):
+        yaw -= turn_step
+    shared = yp_mat_cached(yaw, 0.) is first and not first.flags.writeable
+
+    if batched and cached and shared:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed")
+
+def test_edge_grid(reference_file, test_name, model_file, translation, yaw, pitch, image_width, image_height, focal_length, terrain_size, picks):
+    rotation = yp_mat(yaw, pitch)
+    camera_intrinsics = make_intrinsics(focal_length, image_width, image_height)
+
+    # Rendering through the grid draws the same pixels, including edges cut by the near plane
+    model = load_model(model_file, edge_grid=True)
+    actual_image = render_wireframe(model, rotation, np.array(translation), camera_intrinsics, image_width, image_height)
+    renders_match = compare_images(cv2.imread(reference_file), actual_image)
+
+    # A camera looking down onto a large terrain only projects the edges near its view
+    xs, zs = np.meshgrid(np.linspace(-5, 5, terrain_size), np.linspace(-5, 5, terrain_size))
+    vertices = np.column_stack([xs.ravel(), 0.3 * np.sin(2 * xs.ravel()) * np.cos(3 * zs.ravel()), zs.ravel()])
+    grid = np.arange(terrain_size * terrain_size).reshape(terrain_size, terrain_size)
+    edges = np.concatenate([
+        np.column_stack([grid[:, :-1].ravel(), grid[:, 1:].ravel()]), np.column_stack([grid[:-1].ravel(), grid[1:].ravel()]),
+    ])
+    terrain = Model(vertices, edges, **build_edge_grid(vertices, edges))
+    camera_rotation, camera_translation = yp_mat(0.5, 1.0), np.array([0., 1.5, 0.])
+    candidates = frustum_edges(terrain, camera_rotation, camera_translation, camera_intrinsics, image_width, image_height, 0.01)
+    culled_match = compare_images(
+        render_wireframe({"vertices": vertices, "edges": edges}, camera_rotation, camera_translation, camera_intrinsics, image_width, image_height),
+        render_wireframe(terrain, camera_rotation, camera_translation, camera_intrinsics, image_width, image_height),
+    )
+
+    # Picking finds the same edge as measuring the distance to every projected edge
+    camera_space = convert_model_to_camera_space(vertices, camera_rotation, camera_translation)
+    segments, visible = clip_edges(camera_space, edges, camera_intrinsics, image_width, image_height)
+    points, _ = project_points(segments, camera_intrinsics, dtype=np.float64)
+    picks_match = True
+    for x, y in picks:
+        cursor = np.array([x + 0.5, y + 0.5])
+        direction = points[:, 1] - points[:, 0]
+        length = (direction ** 2).sum(axis=1)
+        along = np.clip(np.divide(((cursor - points[:, 0]) * direction).sum(axis=1), length, out=np.zeros(len(length)), where=length > 0), 0, 1)
+        distance = np.where(visible, np.linalg.norm(points[:, 0] + along[:, None] * direction - cursor, axis=1), np.inf)
+        expected = int(np.argmin(distance)) if distance.min() <= 3 else None
+        picks_match = picks_match and pick_edge(terrain, camera_rotation, camera_translation, camera_intrinsics, x, y, 0.01) == expected
+
+    if renders_match and culled_match and picks_match and len(candidates) < len(edges) / 2:
+        print(f"Test '{test_name}' passed")
+    else:
+        print(f"Test '{test_name}' failed, {len(candidates)} of {len(edges)} edges in the view")
+
 def run_test_case_1():
     # Test Case 1: Simple cube scale test (just farther away)
     test_camera_space(
@@ -199,6 +977,480 @@ def run_test_case_2():
         focal_length=500
     )
 
+def run_test_case_3():
+    # Test Case 3: Batched projection matches the per-vertex reference
+    test_projected_points(
+        reference_file="tests/proj_rotation.npy",
+        test_name="Batched Projection - Square Rotation",
+        model_file="models/square.json",
+        translation=np.array([1.5, 1, -5]),
+        yaw=-0.15,
+        pitch=0.11,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_projected_points(
+        reference_file="tests/proj_scaled_cube.npy",
+        test_name="Batched Projection - Scaled Cube",
+        model_file="models/cube.json",
+        translation=(0, 0, -8),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_projected_near_camera(
+        test_name="Projection - Points Just In Front Of The Camera",
+        vertices_camera_space=[[1, 1, 1e-8], [-0.5, 2, 1e-12], [0.1, 0.2, -1], [0.5, 0.3, 2], [1, 0, 1e-8], [0, 0, 2]],
+        edges=[[4, 5], [2, 3]],
+        expected_pixels=[(x, 256) for x in range(256, 512)],
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_projected_beside_image(
+        test_name="Projection - Edges Reaching Far Beside The Image",
+        vertices_camera_space=[[1e5, 0, 0.02], [0, 0, 5], [-1e5, 0, 0.02]],
+        edges=[[0, 1], [1, 2]],
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_4():
+    # Test Case 4: One batched call reproduces several single pose references
+    test_render_batch(
+        reference_files=[
+            "tests/simple_square.png",
+            "tests/translate_square.png",
+            "tests/rotate_square.png",
+            "tests/full_motion_square.png",
+        ],
+        test_name="Batch Render - Square Poses",
+        model_file="models/square.json",
+        translations=[[0, 0, -5.], [0.5, 0.3, -5.], [0, 0, -5.], [0.3, -0.5, -4]],
+        yaws=[0, 0, 0.1, 0.1],
+        pitches=[0, 0, 0.1, 0.1],
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_5():
+    # Test Case 5: Compiled, memory-mapped models render the same as their JSON source
+    test_compiled_model(
+        reference_file="tests/simple_cube.png",
+        test_name="Compiled Model - Simple Cube",
+        model_file="models/cube.json",
+        translation=np.array([0, 0, -5.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_recompiled_model(
+        reference_file="tests/simple_cube.png",
+        test_name="Compiled Model - Recompiled Over XYZ",
+        model_file="models/cube.json",
+        previous_model_file="models/xyz.json",
+        translation=np.array([0, 0, -5.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_model_cache(
+        test_name="Model Cache - Hits, Reloads and Eviction",
+        model_files=["models/cube.json", "models/square.json", "models/xyz.json"],
+        max_size=2
+    )
+
+def run_test_case_6():
+    # Test Case 6: Camera inside the cube, edges crossing the near plane are cut instead of dropped
+    test_render_image(
+        reference_file="tests/near_plane_clipping.png",
+        test_name="Render - Near Plane Clipping",
+        model_file="models/cube.json",
+        translation=np.array([0.3, 0.2, -0.45]),
+        yaw=0.5,
+        pitch=0.2,
+        image_width=512,
+        image_height=512,
+        focal_length=300
+    )
+
+def run_test_case_7():
+    # Test Case 7: Copies of the cube behind and beside the camera are culled by their bounds
+    test_scene_culling(
+        reference_file="tests/simple_cube.png",
+        test_name="Scene - Culled Cube Copies",
+        model_file="models/cube.json",
+        offsets=[(0, 0, 0), (0, 0, -10), (20, 0, 0), (0, -20, 1), (3, 3, -6)],
+        expected_visible=[0],
+        translation=np.array([0, 0, -5.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_8():
+    # Test Case 8: Streamed rotation sequence written from a background thread
+    test_render_sequence(
+        reference_pattern="tests/rendering2/cube_rotation_sequence_frame_{}.png",
+        test_name="Sequence - Cube Rotation",
+        model_file="models/cube.json",
+        translations=[0, 0, -5.],
+        yaws=[0, pi],
+        pitches=[0, 0],
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_9():
+    # Test Case 9: Poses rendered by a worker pool come back in order
+    for use_threads, pool_name in [(False, "Processes"), (True, "Threads")]:
+        test_render_parallel(
+            reference_files=[
+                "tests/simple_square.png",
+                "tests/translate_square.png",
+                "tests/rotate_square.png",
+                "tests/full_motion_square.png",
+            ],
+            test_name="Parallel Render - Square Poses - " + pool_name,
+            model_file="models/square.json",
+            translations=[[0, 0, -5.], [0.5, 0.3, -5.], [0, 0, -5.], [0.3, -0.5, -4]],
+            yaws=[0, 0, 0.1, 0.1],
+            pitches=[0, 0, 0.1, 0.1],
+            image_width=512,
+            image_height=512,
+            focal_length=500,
+            use_threads=use_threads
+        )
+
+def run_test_case_10():
+    # Test Case 10: Drawing in tiles gives the same pixels, including for lines crossing many tiles
+    for tile_size in [512, 64, 7]:
+        test_render_tiled(
+            reference_file="tests/full_motion_square.png",
+            test_name=f"Tiled Render - Full Motion Square - {tile_size}px Tiles",
+            model_file="models/square.json",
+            translation=[0.3, -0.5, -4],
+            yaw=0.1,
+            pitch=0.1,
+            image_width=512,
+            image_height=512,
+            focal_length=500,
+            tile_size=tile_size
+        )
+
+    test_render_tiled(
+        reference_file="tests/near_plane_clipping.png",
+        test_name="Tiled Render - Near Plane Clipping - 33px Tiles",
+        model_file="models/cube.json",
+        translation=[0.3, 0.2, -0.45],
+        yaw=0.5,
+        pitch=0.2,
+        image_width=512,
+        image_height=512,
+        focal_length=300,
+        tile_size=33
+    )
+
+def run_test_case_11():
+    # Test Case 11: Object poses chained with the camera into one matrix
+    test_precomposed_transform(
+        reference_file="tests/cs_scaled_cube.npy",
+        test_name="Precomposed Transform - Object Moved Away",
+        model_file="models/cube.json",
+        object_translation=(0, 0, 8),
+        object_yaw=0,
+        camera_translation=(0, 0, 0),
+        camera_yaw=0,
+        camera_pitch=0
+    )
+
+    test_precomposed_transform(
+        reference_file="tests/cs_scaled_cube.npy",
+        test_name="Precomposed Transform - Object and Camera Moved Together",
+        model_file="models/cube.json",
+        object_translation=(1, 2, 3),
+        object_yaw=0,
+        camera_translation=(1, 2, -5),
+        camera_yaw=0,
+        camera_pitch=0
+    )
+
+def run_test_case_12():
+    # Test Case 12: Copies of one model placed by instance transforms
+    test_render_instances(
+        reference_file="tests/simple_cube.png",
+        test_name="Instances - Culled Cube Copies",
+        model_file="models/cube.json",
+        offsets=[(0, 0, 0), (0, 0, -10), (20, 0, 0), (0, -20, 1), (3, 3, -6)],
+        expected_visible=[0],
+        translation=np.array([0, 0, -5.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_render_instances(
+        reference_file=None,
+        test_name="Instances - Cube Grid Through The Near Plane",
+        model_file="models/cube.json",
+        offsets=[(x, y, z) for x in (-3, 0, 3) for y in (-2, 0, 2) for z in (-5, 0, 4)],
+        expected_visible=[1, 2, 4, 5, 7, 8, 10, 11, 12, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26],
+        translation=np.array([0.2, 0.1, -5.3]),
+        yaw=0.2,
+        pitch=0.1,
+        image_width=512,
+        image_height=512,
+        focal_length=300
+    )
+
+def run_test_case_13():
+    # Test Case 13: Levels of detail compiled into the model and picked by distance
+    test_lod_model(
+        reference_file="tests/simple_xyz.png",
+        test_name="Level of Detail - XYZ",
+        model_file="models/xyz.json",
+        lod_levels=4,
+        translation=np.array([0, 0, -5.]),
+        far_translation=np.array([0, 0, -300.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_14():
+    # Test Case 14: Duplicate edges and unused vertices removed when loading
+    test_preprocessed_model(
+        reference_file="tests/simple_cube.png",
+        test_name="Preprocessed Model - Messy Cube",
+        model_file="models/cube.json",
+        translation=np.array([0, 0, -5.]),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_15():
+    # Test Case 15: The benchmark suite times every stage and flags regressions against a baseline
+    test_benchmark(
+        test_name="Benchmark - Small Meshes",
+        sizes=[100, 1000],
+        image_sizes=[(64, 64), (128, 96)],
+        expected_stages=["camera_space", "project", "clip", "draw", "render_wireframe", "project_to_image", "render_image"]
+    )
+
+def run_test_case_16():
+    # Test Case 16: Stage timings and counts reported by render_wireframe
+    test_render_stats(
+        reference_file="tests/near_plane_clipping.png",
+        test_name="Render Stats - Near Plane Clipping",
+        model_file="models/cube.json",
+        translation=np.array([0.3, 0.2, -0.45]),
+        yaw=0.5,
+        pitch=0.2,
+        image_width=512,
+        image_height=512,
+        focal_length=300,
+        expected_counts={
+            ("camera_space", "vertices"): 8,
+            ("clip", "edges"): 12,
+            ("clip", "culled"): 7,
+            ("clip", "near_clipped"): 1,
+            ("draw", "segments"): 5,
+            ("frame", "drawn"): 5,
+        },
+        frame_count=10
+    )
+
+def run_test_case_17():
+    # Test Case 17: Every case of the manifest through the parallel runner
+    test_regression_runner(
+        test_name="Regression Runner - Manifest",
+        manifest_file="tests/manifest.json",
+        broken_case="Simple Cube",
+        workers=2
+    )
+
+def run_test_case_18():
+    # Test Case 18: Only the newest of many queued poses gets drawn
+    test_async_viewer(
+        reference_file="tests/full_motion_square.png",
+        test_name="Async Viewer - Pose Burst",
+        model_file="models/square.json",
+        events=[{"type": "pose", "yaw": i / 1000, "pitch": i / 1000, "translation": [0, 0, -5]} for i in range(100)] + [
+            {"type": "key", "key": "x"},
+            {"type": "pose", "yaw": 0.1, "pitch": 0.1, "translation": [0.3, -0.5, -4]},
+        ],
+        bad_lines=['{"type": "pose", "yaw":', "[1, 2]", "42", "not json"],
+        image_width=512,
+        image_height=512
+    )
+
+    test_socket_viewer(
+        test_name="Async Viewer - Socket Quit",
+        model_file="models/square.json",
+        events=[{"type": "pose", "yaw": i / 100, "pitch": 0.1} for i in range(10)],
+        image_width=512,
+        image_height=512,
+        timeout=5
+    )
+
+def run_test_case_19():
+    # Test Case 19: The back edges of a solid cube are hidden by its faces
+    cube_quads = [[0, 1, 2, 3], [4, 5, 6, 7], [0, 1, 5, 4], [1, 2, 6, 5], [2, 3, 7, 6], [3, 0, 4, 7]]
+    test_hidden_lines(
+        test_name="Hidden Lines - Solid Cube",
+        model_file="models/cube.json",
+        faces=[[a, b, c] for a, b, c, _ in cube_quads] + [[a, c, d] for a, _, c, d in cube_quads],
+        translation=(0, 0, -5),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_face_occluder(
+        test_name="Hidden Lines - Face Only Occluder",
+        model={
+            "vertices": [[-1, 0, 0], [1, 0, 0], [-2, -1, -1], [2, -1, -1], [2, 1, -1], [-2, 1, -1]],
+            "edges": [[0, 1]],
+            "faces": [[2, 3, 4], [2, 4, 5]],
+        },
+        translation=(0, 0, -5),
+        yaw=0,
+        pitch=0,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+    test_face_crossing_near_plane(
+        test_name="Hidden Lines - Floor Crossing The Near Plane",
+        model={
+            "vertices": np.array([[-10, -1, -5], [10, -1, -5], [10, -1, 50], [-10, -1, 50], [0, -3, 10], [0, -2, 10]], dtype=np.float64),
+            "edges": np.array([[4, 5]]),
+            "faces": np.array([[0, 1, 2], [0, 2, 3]]),
+        },
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_20():
+    # Test Case 20: Antialiased lines at subpixel positions, the aliased render is unchanged
+    test_antialiased(
+        reference_file="tests/full_motion_square.png",
+        test_name="Antialiased - Full Motion Square",
+        model_file="models/square.json",
+        translation=(0.3, -0.5, -4),
+        yaw=0.1,
+        pitch=0.1,
+        image_width=512,
+        image_height=512,
+        focal_length=500,
+        supersampling=4
+    )
+
+    test_antialiased_far_endpoint(
+        test_name="Antialiased - Far Off Endpoint",
+        start=(10, 10),
+        direction=(2, 1),
+        image_width=1024,
+        image_height=1024
+    )
+
+def run_test_case_21():
+    # Test Case 21: A nearly still camera reuses the previous frame and redraws only the edges that moved
+    test_frame_cache(
+        test_name="Frame Cache - Slowly Turning Cube",
+        model_file="models/cube.json",
+        translation=(0.3, -0.5, -4),
+        yaw=0.1,
+        pitch=0.1,
+        yaw_steps=[0.0005] * 20,
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_22():
+    # Test Case 22: Camera matrices for a whole pose sweep in one pass, and memoized rotations
+    test_camera_matrix_batch(
+        test_name="Camera Matrices - Pose Sweep",
+        yaws=np.linspace(-pi, pi, 37),
+        pitches=np.linspace(-pi / 2, pi / 2, 37),
+        focal_lengths=np.linspace(100, 1000, 37),
+        image_width=640,
+        image_height=480,
+        turn_step=pi / 18,
+        turn_count=7
+    )
+
+def run_test_case_23():
+    # Test Case 23: A spatial index over the edges culls and picks without projecting every edge
+    test_edge_grid(
+        reference_file="tests/near_plane_clipping.png",
+        test_name="Edge Grid - Culling and Picking",
+        model_file="models/cube.json",
+        translation=(0.3, 0.2, -0.45),
+        yaw=0.5,
+        pitch=0.2,
+        image_width=512,
+        image_height=512,
+        focal_length=300,
+        terrain_size=100,
+        picks=[(256, 300), (100, 400), (400, 450), (5, 5)]
+    )
+
+def run_test_case_24():
+    # Test Case 24: Pipeline stages writing into preallocated buffers, and a renderer reusing its pool
+    test_buffer_reuse(
+        test_name="Buffer Reuse - Cube Poses",
+        model_file="models/cube.json",
+        translations=[[0, 0, -5.], [0.5, 0.3, -5.], [0.3, -0.5, -4.], [0.3, 0.2, -0.45]],
+        yaws=[0, 0.1, 0.3, 0.5],
+        pitches=[0, 0.1, -0.2, 0.2],
+        image_width=512,
+        image_height=512,
+        focal_length=500
+    )
+
+def run_test_case_25():
+    # Test Case 25: The stateful renderer draws what render_wireframe draws and skips the stages that did not change
+    test_wireframe_renderer(
+        test_name="Wireframe Renderer - Poses and Focal Lengths",
+        model_file="models/cube.json",
+        translations=[[0, 0, -5.], [0.5, 0.3, -5.], [0.3, -0.5, -4.], [0.3, 0.2, -0.45]],
+        yaws=[0, 0.1, 0.3, 0.5],
+        pitches=[0, 0.1, -0.2, 0.2],
+        focal_lengths=[300, 500, 800],
+        image_width=512,
+        image_height=512
+    )
+
 if __name__ == "__main__":
     # Make sure the tests directory exists
     os.makedirs("tests", exist_ok=True)
@@ -207,4 +1459,73 @@ if __name__ == "__main__":
     run_test_case_1()
     
     print("\nRunning Test Case 2: Simple Square Shift Tests...")
-    run_test_case_2()
\ No newline at end of file
+    run_test_case_2()
+    
+    print("\nRunning Test Case 3: Batched Projection Tests...")
+    run_test_case_3()
+    
+    print("\nRunning Test Case 4: Batched Render Tests...")
+    run_test_case_4()
+    
+    print("\nRunning Test Case 5: Compiled Model Tests...")
+    run_test_case_5()
+    
+    print("\nRunning Test Case 6: Near Plane Clipping Tests...")
+    run_test_case_6()
+    
+    print("\nRunning Test Case 7: Scene Culling Tests...")
+    run_test_case_7()
+    
+    print("\nRunning Test Case 8: Sequence Tests...")
+    run_test_case_8()
+    
+    print("\nRunning Test Case 9: Parallel Render Tests...")
+    run_test_case_9()
+    
+    print("\nRunning Test Case 10: Tiled Render Tests...")
+    run_test_case_10()
+    
+    print("\nRunning Test Case 11: Precomposed Transform Tests...")
+    run_test_case_11()
+    
+    print("\nRunning Test Case 12: Instanced Render Tests...")
+    run_test_case_12()
+    
+    print("\nRunning Test Case 13: Level of Detail Tests...")
+    run_test_case_13()
+    
+    print("\nRunning Test Case 14: Model Preprocessing Tests...")
+    run_test_case_14()
+    
+    print("\nRunning Test Case 15: Benchmark Tests...")
+    run_test_case_15()
+    
+    print("\nRunning Test Case 16: Render Stats Tests...")
+    run_test_case_16()
+    
+    print("\nRunning Test Case 17: Regression Runner Tests...")
+    run_test_case_17()
+    
+    print("\nRunning Test Case 18: Async Viewer Tests...")
+    run_test_case_18()
+    
+    print("\nRunning Test Case 19: Hidden Line Tests...")
+    run_test_case_19()
+
+    print("\nRunning Test Case 20: Antialiased Line Tests...")
+    run_test_case_20()
+
+    print("\nRunning Test Case 21: Frame Cache Tests...")
+    run_test_case_21()
+
+    print("\nRunning Test Case 22: Camera Matrix Tests...")
+    run_test_case_22()
+
+    print("\nRunning Test Case 23: Edge Grid Tests...")
+    run_test_case_23()
+
+    print("\nRunning Test Case 24: Buffer Reuse Tests...")
+    run_test_case_24()
+
+    print("\nRunning Test Case 25: Wireframe Renderer Tests...")
+    run_test_case_25()
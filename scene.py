@@ -0,0 +1,193 @@
+import numpy as np
+from rendering import NEAR_PLANE, convert_model_to_camera_space, clip_edges, project_points, draw_segments
+from rendering_helpers import boxes_outside, world_frustum_planes
+from lod import LOD_PIXEL_ERROR, select_lod_edges
+
+BVH_LEAF_SIZE = 4
+
+
+def bounding_box(vertices):
+    """
+    Axis aligned bounding box of a set of points.
+    :param vertices: (N, 3) array of points.
+    :return: tuple (lower, upper) of 3-element arrays.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    return vertices.min(axis=0), vertices.max(axis=0)
+
+def bounding_sphere(vertices):
+    """
+    Bounding sphere of a set of points centered on their bounding box.
+    :param vertices: (N, 3) array of points.
+    :return: tuple (center, radius).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    lower, upper = bounding_box(vertices)
+    center = (lower + upper) / 2
+    return center, np.sqrt(((vertices - center) ** 2).sum(axis=1).max())
+
+
+class Scene:
+    """
+    A set of models in world space with a bounding volume hierarchy over their bounding boxes,
+    so the objects outside the view frustum are skipped without looking at their vertices.
+    """
+
+    def __init__(self, models=()):
+        """
+        :param models: models to add, dictionaries or model_loader.Model instances with world space vertices.
+        """
+        self.models = []
+        self.bounds = []
+        self._bvh = None
+        for model in models:
+            self.add(model)
+
+    def __len__(self):
+        return len(self.models)
+
+    def add(self, model):
+        """
+        Add a model to the scene and precompute its bounds.
+        :param model: dictionary or model_loader.Model with world space vertices.
+        :return: index of the new object.
+        :raises ValueError: when the model has no vertices, since it has no bounds.
+        """
+        vertices = np.asarray(model["vertices"])
+        if not vertices.size:
+            raise ValueError("cannot add a model without vertices to a scene")
+
+        self.models.append(model)
+        self.bounds.append(bounding_box(vertices))
+        self._bvh = None
+        return len(self.models) - 1
+
+    def build(self):
+        """
+        Gather the object bounds into arrays and build the bounding volume hierarchy. Called lazily by the
+        first query after objects were added. Nodes are stored in flat arrays and every node covers a
+        contiguous range of the object order.
+        """
+        self.lower = np.array([bounds[0] for bounds in self.bounds]).reshape(-1, 3)
+        self.upper = np.array([bounds[1] for bounds in self.bounds]).reshape(-1, 3)
+
+        node_lower, node_upper, node_children, node_range = [], [], [], []
+        order = []
+        box_centers = (self.lower + self.upper) / 2
+
+        def build_node(indices):
+            node = len(node_lower)
+            node_lower.append(self.lower[indices].min(axis=0))
+            node_upper.append(self.upper[indices].max(axis=0))
+            node_children.append((-1, -1))
+            node_range.append((len(order), len(indices)))
+
+            if len(indices) <= BVH_LEAF_SIZE:
+                order.extend(indices)
+                return node
+
+            # Split at the median along the axis where the object centers are spread the most
+            spread = box_centers[indices].max(axis=0) - box_centers[indices].min(axis=0)
+            indices = indices[np.argsort(box_centers[indices, np.argmax(spread)], kind="stable")]
+            half = len(indices) // 2
+            node_children[node] = (build_node(indices[:half]), build_node(indices[half:]))
+            return node
+
+        if len(self.models):
+            build_node(np.arange(len(self.models)))
+
+        self._bvh = {
+            "lower": np.array(node_lower).reshape(-1, 3),
+            "upper": np.array(node_upper).reshape(-1, 3),
+            "children": np.array(node_children, dtype=np.int64).reshape(-1, 2),
+            "range": np.array(node_range, dtype=np.int64).reshape(-1, 2),
+            "order": np.array(order, dtype=np.int64),
+        }
+
+    def query_planes(self, planes):
+        """
+        Find the objects whose bounding boxes are not completely outside the given world space planes.
+        :param planes: (P, 4) array of planes, see world_frustum_planes.
+        :return: sorted array of object indices.
+        """
+        if self._bvh is None:
+            self.build()
+        bvh = self._bvh
+        if not len(bvh["order"]):
+            return np.zeros(0, dtype=np.int64)
+
+        found = []
+        stack = [(0, np.arange(len(planes)))]
+        while stack:
+            node, active = stack.pop()
+            outside, crossing = boxes_outside(planes[active], bvh["lower"][node], bvh["upper"][node])
+            if outside:
+                continue
+
+            # Planes the node is completely inside of never need testing again below it
+            active = active[crossing]
+            start, count = bvh["range"][node]
+            objects = bvh["order"][start:start + count]
+            left, right = bvh["children"][node]
+            if not len(active):
+                found.append(objects)
+            elif left < 0:
+                outside, _ = boxes_outside(planes[active], self.lower[objects], self.upper[objects])
+                found.append(objects[~outside])
+            else:
+                stack.append((right, active))
+                stack.append((left, active))
+
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def visible_objects(self, rotation, translation, camera_intrinsics, image_width, image_height, near=NEAR_PLANE, far=None):
+        """
+        Find the objects that may be visible from a camera.
+        :return: sorted array of object indices, see query_planes.
+        """
+        planes = world_frustum_planes(rotation, translation, camera_intrinsics, image_width, image_height, near, far)
+        return self.query_planes(planes)
+
+    def merged_model(self, indices, edge_sets=None):
+        """
+        Combine objects into one model dictionary with the edges offset into the combined vertex array.
+        :param indices: object indices to combine.
+        :param edge_sets: optional edge array for every index to use instead of the object's own edges,
+          e.g. a level of detail.
+        :return: dictionary with "vertices" (N, 3) and "edges" (E, 2) arrays.
+        """
+        vertices, edges = [np.zeros((0, 3))], [np.zeros((0, 2), dtype=np.int64)]
+        offset = 0
+        for position, index in enumerate(indices):
+            model = self.models[index]
+            model_edges = model["edges"] if edge_sets is None else edge_sets[position]
+            model_vertices = np.asarray(model["vertices"]).reshape(-1, 3)
+            vertices.append(model_vertices)
+            edges.append(np.asarray(model_edges, dtype=np.int64).reshape(-1, 2) + offset)
+            offset += len(model_vertices)
+        return {"vertices": np.concatenate(vertices), "edges": np.concatenate(edges)}
+
+    def render(
+        self, rotation, translation, camera_intrinsics, image_width, image_height,
+        near_plane=NEAR_PLANE, far_plane=None, lod_pixel_error=LOD_PIXEL_ERROR,
+    ):
+        """
+        Render every visible object of the scene into one wireframe image, see rendering.render_wireframe.
+        Objects culled by their bounding box are never transformed or projected, and objects with levels of
+        detail are drawn with the coarsest level that fits lod_pixel_error at their own distance.
+        :return: the wireframe image as an (image_height, image_width, 3) uint8 numpy array.
+        """
+        visible = self.visible_objects(rotation, translation, camera_intrinsics, image_width, image_height, near_plane, far_plane)
+        edge_sets = [
+            select_lod_edges(self.models[index], rotation, translation, camera_intrinsics, lod_pixel_error) for index in visible
+        ]
+        model = self.merged_model(visible, edge_sets)
+
+        vertices_camera_space = convert_model_to_camera_space(model["vertices"], rotation, translation)
+        segments, visible_edges = clip_edges(
+            vertices_camera_space, model["edges"], camera_intrinsics, image_width, image_height, near_plane, far_plane
+        )
+        points_2d, _ = project_points(segments[visible_edges], camera_intrinsics)
+
+        image = np.zeros((image_height, image_width, 3), dtype=np.uint8)
+        return draw_segments(image, points_2d)
@@ -0,0 +1,180 @@
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+from rendering import NEAR_PLANE, render_wireframe_batch
+from rendering_helpers import yp_mat_batch
+
+SEQUENCE_CHUNK_SIZE = 16
+
+
+def catmull_rom(keyframes, frame_count):
+    """
+    Sample a Catmull-Rom spline passing through evenly spaced keyframes.
+    :param keyframes: (K, ...) array of keyframe values, e.g. yaws or translations.
+    :param frame_count: number of samples. The first and last samples land on the first and last keyframes.
+    :return: (frame_count, ...) array of interpolated values.
+    """
+    keyframes = np.asarray(keyframes, dtype=np.float64)
+    if len(keyframes) == 1:
+        return np.repeat(keyframes, frame_count, axis=0)
+
+    # Repeat the end keyframes so the curve starts and stops on them
+    padded = np.concatenate([keyframes[:1], keyframes, keyframes[-1:]])
+    position = np.linspace(0, len(keyframes) - 1, frame_count)
+    segment = np.minimum(position.astype(int), len(keyframes) - 2)
+    t = (position - segment).reshape((-1,) + (1,) * (keyframes.ndim - 1))
+
+    p0, p1, p2, p3 = padded[segment], padded[segment + 1], padded[segment + 2], padded[segment + 3]
+    return 0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2 + (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+
+def keyframe_trajectory(yaws, pitches, translations, frame_count):
+    """
+    Turn camera keyframes into a smooth per frame trajectory for render_sequence.
+    :param yaws: (K,) keyframe yaws in radians.
+    :param pitches: (K,) keyframe pitches in radians.
+    :param translations: (K, 3) keyframe camera positions.
+    :param frame_count: number of frames in the trajectory.
+    :return: tuple (yaws, pitches, translations) with frame_count entries each.
+    """
+    return catmull_rom(yaws, frame_count), catmull_rom(pitches, frame_count), catmull_rom(translations, frame_count)
+
+def render_sequence(
+    model,
+    yaws, pitches, translations,
+    camera_intrinsics,
+    image_width, image_height,
+    chunk_size=SEQUENCE_CHUNK_SIZE,
+    near_plane=NEAR_PLANE,
+):
+    """
+    Lazily render a camera trajectory. Poses are transformed and projected chunk_size at a time with
+    render_wireframe_batch, so only one chunk of frames is ever held in memory.
+
+    :param model: Dictionary or model_loader.Model representing the model to render, see rendering.render_wireframe.
+    :param yaws: (F,) camera yaws in radians, or a single value for every frame.
+    :param pitches: (F,) camera pitches in radians, or a single value for every frame.
+    :param translations: (F, 3) camera positions, or a single position for every frame.
+    :param camera_intrinsics: 3x3 numpy array representing the camera intrinsics.
+    :param image_width: width of each frame in pixels
+    :param image_height: height of each frame in pixels
+    :param chunk_size: number of frames rendered per batch.
+    :param near_plane: distance in front of the camera where edges get clipped.
+    :return: generator of (image_height, image_width, 3) uint8 frames.
+    """
+    model = {
+        "vertices": np.asarray(model["vertices"], dtype=np.float64).reshape(-1, 3),
+        "edges": np.asarray(model["edges"], dtype=np.int64).reshape(-1, 2),
+    }
+    yaws = np.atleast_1d(np.asarray(yaws, dtype=np.float64))
+    pitches = np.atleast_1d(np.asarray(pitches, dtype=np.float64))
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+
+    frame_count = max(len(yaws), len(pitches), len(translations))
+    yaws = np.broadcast_to(yaws, (frame_count,))
+    pitches = np.broadcast_to(pitches, (frame_count,))
+    translations = np.broadcast_to(translations, (frame_count, 3))
+
+    for start in range(0, frame_count, chunk_size):
+        stop = start + chunk_size
+        rotations = yp_mat_batch(yaws[start:stop], pitches[start:stop])
+        yield from render_wireframe_batch(
+            model, rotations, translations[start:stop], camera_intrinsics, image_width, image_height, near_plane
+        )
+
+def write_sequence(frames, write_frame, background=True, max_pending=SEQUENCE_CHUNK_SIZE):
+    """
+    Consume a stream of frames and hand each one to a writer.
+
+    :param frames: iterable of frames, e.g. from render_sequence.
+    :param write_frame: callable taking (index, frame), e.g. an ImageSequenceWriter or VideoFileWriter.
+    :param background: write on a worker thread so the next frames render while earlier ones are encoded.
+    :param max_pending: how many rendered frames may wait for the writer before rendering pauses.
+    :return: the number of frames written.
+    """
+    if not background:
+        count = 0
+        for count, frame in enumerate(frames, start=1):
+            write_frame(count - 1, frame)
+        return count
+
+    pending = queue.Queue(maxsize=max_pending)
+    errors = []
+
+    def write_pending():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            # Keep draining after a failure so the producer never blocks on a full queue
+            if not errors:
+                try:
+                    write_frame(*item)
+                except Exception as error:
+                    errors.append(error)
+
+    writer = threading.Thread(target=write_pending, daemon=True)
+    writer.start()
+    count = 0
+    try:
+        for index, frame in enumerate(frames):
+            if errors:
+                break
+            pending.put((index, frame))
+            count += 1
+    finally:
+        pending.put(None)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return count
+
+
+class ImageSequenceWriter:
+    """
+    Writes every frame to its own image file.
+    """
+
+    def __init__(self, path_pattern):
+        """
+        :param path_pattern: file path with a {} placeholder for the frame index,
+          e.g. "tests/rendering2/cube_rotation_sequence_frame_{}.png".
+        """
+        self.path_pattern = path_pattern
+        directory = os.path.dirname(path_pattern)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, index, frame):
+        cv2.imwrite(self.path_pattern.format(index), frame)
+
+
+class VideoFileWriter:
+    """
+    Encodes frames into a video file with OpenCV. Use it as a context manager so the file gets finalized.
+    """
+
+    def __init__(self, path, fps, image_width, image_height, fourcc="mp4v"):
+        """
+        :param path: path of the video file to write.
+        :param fps: frames per second of the video.
+        :param image_width: width of the frames in pixels
+        :param image_height: height of the frames in pixels
+        :param fourcc: four character code of the codec.
+        """
+        self.video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (image_width, image_height))
+
+    def __call__(self, index, frame):
+        self.video.write(frame)
+
+    def close(self):
+        self.video.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def canonical_edges(edges):
+    """
+    Canonical form of an edge list: every edge stored with its smaller index first, sorted, without
+    duplicates, reversed duplicates or edges from a vertex to itself.
+    :param edges: (E, 2) array of pairs of vertex indices.
+    :return: (E', 2) int32 array of unique edges in lexicographic order.
+    """
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return np.unique(edges, axis=0).astype(np.int32)
+
+def remove_unused_vertices(vertices, edges, faces=None):
+    """
+    Drop the vertices no edge or face refers to and renumber the edges to match.
+    :param vertices: (N, 3) array of points.
+    :param edges: (E, 2) array of pairs of indices into vertices.
+    :param faces: optional (F, 3) array of triangles whose vertices are kept as well.
+    :return: tuple (vertices, edges, kept) with kept the (N',) original indices of the remaining vertices.
+    """
+    vertices = np.asarray(vertices).reshape(-1, 3)
+    edges = np.asarray(edges).reshape(-1, 2)
+    used = np.zeros(len(vertices), dtype=bool)
+    used[edges.ravel()] = True
+    if faces is not None:
+        used[np.asarray(faces).ravel()] = True
+    kept = np.flatnonzero(used)
+
+    new_index = np.cumsum(used) - 1
+    return vertices[kept], new_index[edges].astype(edges.dtype), kept
+
+def vertex_adjacency(vertex_count, edges):
+    """
+    Index from every vertex to the edges touching it, in compressed sparse row form.
+    :param vertex_count: number of vertices.
+    :param edges: (E, 2) array of pairs of vertex indices.
+    :return: tuple (offsets, edge_indices) of int32 arrays. The edges touching vertex v are
+      edge_indices[offsets[v]:offsets[v + 1]], in increasing order.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    ends = edges.ravel()
+    edge_indices = np.argsort(ends, kind="stable") // 2
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(ends, minlength=vertex_count))])
+    return offsets.astype(np.int32), edge_indices.astype(np.int32)
+
+def preprocess_arrays(vertices, edges, faces=None):
+    """
+    Canonicalize a model and build its vertex to edge index, see canonical_edges, remove_unused_vertices
+    and vertex_adjacency.
+    :param vertices: (N, 3) array of points.
+    :param edges: (E, 2) array of pairs of indices into vertices.
+    :param faces: optional (F, 3) array of triangles as triples of indices into vertices. They are renumbered
+      along with the edges, and their vertices are kept even when no edge refers to them, so faces that only
+      hide lines stay.
+    :return: dictionary with the new "vertices" and "edges" and the "adjacency_offsets" and "adjacency_edges" index,
+      and the new "faces" if there were any.
+    """
+    vertex_count = len(np.asarray(vertices).reshape(-1, 3))
+    if faces is not None:
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    vertices, edges, kept = remove_unused_vertices(vertices, canonical_edges(edges), faces)
+    offsets, edge_indices = vertex_adjacency(len(vertices), edges)
+    arrays = {"vertices": vertices, "edges": edges, "adjacency_offsets": offsets, "adjacency_edges": edge_indices}
+
+    if faces is not None:
+        new_index = np.full(vertex_count, -1, dtype=np.int64)
+        new_index[kept] = np.arange(len(kept))
+        arrays["faces"] = new_index[faces].astype(np.int32)
+    return arrays
+
+def vertex_edges(model, vertices):
+    """
+    Look up the edges touching some vertices in a preprocessed model without scanning the edge list.
+    :param model: Dictionary or model_loader.Model with the arrays from preprocess_arrays.
+    :param vertices: vertex index or array of vertex indices.
+    :return: sorted array of the indices of every edge touching any of the vertices.
+    """
+    offsets, edge_indices = model["adjacency_offsets"], model["adjacency_edges"]
+    vertices = np.atleast_1d(vertices)
+    starts, stops = offsets[vertices], offsets[vertices + 1]
+    counts = stops - starts
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return np.unique(edge_indices[positions])
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from model_loader import load_model
+from renderer import WireframeRenderer
+from rendering_helpers import QUIT_KEYS, yp_mat, yp_mat_cached, camera_key_step, clamp_pitch, make_intrinsics
+
+LATENCY_HISTORY = 1000
+
+
+class CameraState:
+    """
+    The camera the viewer renders, changed by events. Every change bumps the version, so a frame can tell
+    which state it shows.
+
+    Events are dictionaries:
+      - {"type": "key", "key": "w"} moves, turns or zooms like the rendering.py viewer, see rendering_helpers.camera_key_step
+      - {"type": "pose", "yaw": ..., "pitch": ..., "translation": [x, y, z]} sets any of the pose values, e.g. from a tracker
+      - {"type": "focal_length", "value": ...} sets the focal length
+      - {"type": "quit"} stops the viewer
+    """
+
+    def __init__(self, yaw=0., pitch=0., translation=(0, 0, -5.), focal_length=500.):
+        self.yaw = yaw
+        self.pitch = pitch
+        self.translation = np.array(translation, dtype=np.float64)
+        self.focal_length = focal_length
+        self.version = 0
+        self.quit = False
+
+    def apply(self, event):
+        """
+        Update the state from an event.
+        :param event: event dictionary, see the class documentation.
+        :return: True when the camera changed.
+        """
+        kind = event.get("type")
+        if kind == "quit":
+            self.quit = True
+            return False
+
+        if kind == "key":
+            key = event["key"]
+            if key in QUIT_KEYS:
+                self.quit = True
+                return False
+            step = camera_key_step(key, self.yaw, self.pitch, self.translation, self.focal_length)
+            if step is None:
+                return False
+            self.yaw, self.pitch, self.translation, self.focal_length = step
+        elif kind == "pose":
+            self.yaw = event.get("yaw", self.yaw)
+            self.pitch = clamp_pitch(event.get("pitch", self.pitch))
+            if "translation" in event:
+                self.translation = np.array(event["translation"], dtype=np.float64)
+        elif kind == "focal_length":
+            self.focal_length = event["value"]
+        else:
+            return False
+
+        self.version += 1
+        return True
+
+    def snapshot(self):
+        """
+        :return: tuple (version, yaw, pitch, translation, focal_length) that later events do not change.
+        """
+        return self.version, self.yaw, self.pitch, self.translation.copy(), self.focal_length
+
+
+class AsyncViewer:
+    """
+    Renders a model on a worker thread while camera events keep arriving on the asyncio loop.
+
+    Events are applied to the CameraState as soon as they arrive, which is cheap. The render loop then
+    always draws the newest state: poses that were replaced while a frame was being rendered are never
+    drawn, so the delay between an event and the frame showing it stays at most about two frame times
+    however fast events come in.
+    """
+
+    def __init__(self, model, camera=None, image_width=512, image_height=512, on_frame=None):
+        """
+        :param model: Dictionary or model_loader.Model representing the model to render.
+        :param camera: initial CameraState, defaults to the rendering.py viewer's starting camera.
+        :param image_width: width of the frames in pixels
+        :param image_height: height of the frames in pixels
+        :param on_frame: optional callable taking (frame, version, latency) for every rendered frame, called
+          on the event loop. latency is the time in seconds from the newest event the frame shows until it was done,
+          the latest LATENCY_HISTORY of them are kept in latencies.
+        """
+        self.camera = camera or CameraState()
+        self.image_width = image_width
+        self.image_height = image_height
+        self.on_frame = on_frame
+        self.frame = None
+        self.frame_version = -1
+        self.frames_rendered = 0
+        self.events_received = 0
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+
+        version, yaw, pitch, translation, focal_length = self.camera.snapshot()
+        self._renderer = WireframeRenderer(
+            model, yp_mat(yaw, pitch), translation, make_intrinsics(focal_length, image_width, image_height),
+            image_width, image_height,
+        )
+        self._executor = ThreadPoolExecutor(1)
+        self._changed = None
+        self._draining = False
+        self._event_times = {}
+
+    def submit(self, event):
+        """
+        Apply a camera event. Must be called on the event loop the viewer runs on.
+        :param event: event dictionary, see CameraState.
+        """
+        self.events_received += 1
+        if self.camera.apply(event):
+            self._event_times[self.camera.version] = time.perf_counter()
+        if self._changed is not None:
+            self._changed.set()
+
+    def _render(self, snapshot):
+        version, yaw, pitch, translation, focal_length = snapshot
+        self._renderer.set_pose(yp_mat_cached(yaw, pitch), translation)
+        self._renderer.set_intrinsics(make_intrinsics(focal_length, self.image_width, self.image_height))
+        return self._renderer.render().copy()
+
+    async def render_loop(self):
+        """
+        Render the newest camera state whenever it changed, until a quit event arrives or, once the viewer
+        is draining, the newest state has been drawn.
+        """
+        loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._changed.set()
+        while not self.camera.quit:
+            await self._changed.wait()
+            self._changed.clear()
+            if self.camera.quit:
+                break
+            if self.camera.version == self.frame_version:
+                if self._draining:
+                    break
+                continue
+
+            snapshot = self.camera.snapshot()
+            frame = await loop.run_in_executor(self._executor, self._render, snapshot)
+            version = snapshot[0]
+            event_time = self._event_times.pop(version, None)
+            # Times of the poses that were skipped are dropped along with them
+            self._event_times = {key: value for key, value in self._event_times.items() if key > version}
+
+            self.frame, self.frame_version = frame, version
+            self.frames_rendered += 1
+            latency = time.perf_counter() - event_time if event_time is not None else 0.
+            self.latencies.append(latency)
+            if self.on_frame is not None:
+                self.on_frame(frame, version, latency)
+            if self._draining:
+                self._changed.set()
+
+    def drain(self):
+        """
+        Stop the render loop once the newest camera state has been drawn.
+        """
+        self._draining = True
+        if self._changed is not None:
+            self._changed.set()
+
+    async def run(self, *sources):
+        """
+        Run the render loop together with event sources until a quit event arrives, or every source ended
+        and the last camera state they left has been drawn.
+        :param sources: coroutine functions taking the viewer, e.g. read_event_stream or serve_socket bound
+          with functools.partial, that call viewer.submit for every event.
+        """
+        render_task = asyncio.create_task(self.render_loop())
+        source_tasks = [asyncio.create_task(source(self)) for source in sources]
+        try:
+            if source_tasks:
+                done, _ = await asyncio.wait(source_tasks + [render_task], return_when=asyncio.FIRST_COMPLETED)
+                if render_task not in done and all(task.done() for task in source_tasks):
+                    self.drain()
+            await render_task
+        finally:
+            for task in source_tasks:
+                task.cancel()
+            await asyncio.gather(*source_tasks, return_exceptions=True)
+            self._executor.shutdown()
+
+
+async def read_event_stream(viewer, reader):
+    """
+    Feed the viewer with events from a stream of JSON lines, one event per line.
+    Lines that are not a JSON object are reported on stderr and skipped, the stream goes on after them.
+    :param viewer: AsyncViewer to submit the events to.
+    :param reader: asyncio.StreamReader, e.g. of a socket connection or a pipe.
+    """
+    while not viewer.camera.quit:
+        line = await reader.readline()
+        if not line:
+            return
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError as error:
+            print(f"Skipped malformed event {line[:80]!r}: {error}", file=sys.stderr)
+            continue
+        if not isinstance(event, dict):
+            print(f"Skipped event that is not a JSON object: {line[:80]!r}", file=sys.stderr)
+            continue
+        viewer.submit(event)
+
+async def serve_socket(viewer, host="127.0.0.1", port=8765, path=None):
+    """
+    Accept event streams from local socket connections, see read_event_stream. A script standing in for a
+    tracker can connect and write JSON pose events. Serves until cancelled, AsyncViewer.run cancels it once
+    the viewer quits, which also closes the open connections.
+    :param viewer: AsyncViewer to submit the events to.
+    :param host: host to listen on for TCP connections.
+    :param port: port to listen on for TCP connections.
+    :param path: path of a Unix domain socket to listen on instead of TCP.
+    """
+    writers = set()
+
+    async def handle(reader, writer):
+        writers.add(writer)
+        try:
+            await read_event_stream(viewer, reader)
+        finally:
+            writers.discard(writer)
+            writer.close()
+
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            for writer in list(writers):
+                writer.close()
+
+async def read_stdin(viewer):
+    """
+    Feed the viewer with JSON line events from standard input, e.g. piped from another program.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    await read_event_stream(viewer, reader)
+
+async def window_keys(viewer, poll_interval=0.01):
+    """
+    Show the frames in an OpenCV window and turn its keypresses into key events. The window is polled
+    with a short waitKey on the loop, so it never blocks rendering.
+    """
+    shown_version = None
+    while not viewer.camera.quit:
+        if viewer.frame is not None and viewer.frame_version != shown_version:
+            cv2.imshow("Wireframe", viewer.frame)
+            shown_version = viewer.frame_version
+        keypress = cv2.waitKey(1) & 0xFF
+        if keypress != 0xFF:
+            viewer.submit({"type": "key", "key": chr(keypress)})
+        await asyncio.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    # e.g. python viewer.py --socket 8765 --save-dir frames, then send {"type": "pose", "yaw": 0.3} lines to the port
+    parser = argparse.ArgumentParser(description="Wireframe viewer driven by camera events.")
+    parser.add_argument("--model", default="models/square.json")
+    parser.add_argument("--size", type=int, nargs=2, default=(512, 512), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--socket", type=int, metavar="PORT", help="accept JSON line events on this local TCP port")
+    parser.add_argument("--unix-socket", metavar="PATH", help="accept JSON line events on this Unix domain socket")
+    parser.add_argument("--stdin", action="store_true", help="read JSON line events from standard input")
+    parser.add_argument("--window", action="store_true", help="show the frames in a window and take keypresses")
+    parser.add_argument("--save-dir", help="write every rendered frame to this directory")
+    args = parser.parse_args()
+
+    def save_frame(frame, version, latency):
+        cv2.imwrite(os.path.join(args.save_dir, f"frame_{version:06d}.png"), frame)
+
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+    viewer = AsyncViewer(load_model(args.model), None, *args.size, on_frame=save_frame if args.save_dir else None)
+
+    sources = []
+    if args.socket is not None:
+        sources.append(lambda viewer: serve_socket(viewer, port=args.socket))
+    if args.unix_socket is not None:
+        sources.append(lambda viewer: serve_socket(viewer, path=args.unix_socket))
+    if args.stdin:
+        sources.append(read_stdin)
+    if args.window or not sources:
+        sources.append(window_keys)
+
+    asyncio.run(viewer.run(*sources))
+    print(f"{viewer.frames_rendered} frames rendered for {viewer.events_received} events")